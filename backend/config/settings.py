@@ -46,8 +46,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  # must be first
+    'patient.middleware.InstrumentationMiddleware',
+    'patient.middleware.ReplicaPinningMiddleware',
     "django.middleware.common.CommonMiddleware",
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'patient.middleware.StaticFilesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,11 +82,106 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # In settings.py, define the throttle rate
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'patient.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_THROTTLE_RATES': {
         'patient_process': os.getenv('PATIENT_PROCESS_THROTTLE', '5/min'),
     }
 }
 
+# Budget of calls to the external API, charged per call by every caller together (process
+# endpoints, batches, jobs, warm_metrics); unset means no global limit
+PATIENT_PROCESS_GLOBAL_THROTTLE = os.getenv('PATIENT_PROCESS_GLOBAL_THROTTLE') or None
+
+# Where the process throttle keeps its state: `cache` (the PATIENT_THROTTLE_CACHE cache,
+# shared by all workers when that is Redis/memcached) or `db` (the ThrottleBucket table)
+PATIENT_THROTTLE_BACKEND = os.getenv('PATIENT_THROTTLE_BACKEND', 'cache')
+PATIENT_THROTTLE_CACHE = os.getenv('PATIENT_THROTTLE_CACHE', 'default')
+
+# Render JSON responses with orjson (same bytes as DRF's JSONRenderer, see patient/renderers.py)
+PATIENT_FAST_JSON = os.getenv('PATIENT_FAST_JSON', 'true').lower() == 'true'
+
+# Patient count cache used by the list endpoint.
+# PATIENT_COUNT_MODE=estimate reads pg_class.reltuples on Postgres once the
+# table is bigger than PATIENT_COUNT_ESTIMATE_MIN rows, exact COUNT(*) otherwise.
+PATIENT_COUNT_CACHE_TIMEOUT = int(os.getenv('PATIENT_COUNT_CACHE_TIMEOUT', '300'))
+PATIENT_COUNT_MODE = os.getenv('PATIENT_COUNT_MODE', 'exact')
+PATIENT_COUNT_ESTIMATE_MIN = int(os.getenv('PATIENT_COUNT_ESTIMATE_MIN', '1000000'))
+
+# Seconds patient detail payloads and list pages stay in the cache. Writes through the
+# API invalidate them; with several workers use a shared CACHE_BACKEND so they all see it.
+PATIENT_RESPONSE_CACHE_TIMEOUT = int(os.getenv('PATIENT_RESPONSE_CACHE_TIMEOUT', '3600'))
+
+# Rows per INSERT statement for the bulk add endpoint
+PATIENT_BULK_CHUNK_SIZE = int(os.getenv('PATIENT_BULK_CHUNK_SIZE', '1000'))
+
+# Rows validated and inserted per chunk by the streaming import endpoint
+PATIENT_IMPORT_CHUNK_SIZE = int(os.getenv('PATIENT_IMPORT_CHUNK_SIZE', '500'))
+
+# Rows fetched per round trip by the export endpoint's server-side cursor
+PATIENT_EXPORT_CHUNK_SIZE = int(os.getenv('PATIENT_EXPORT_CHUNK_SIZE', '2000'))
+
+# External process API client (one pooled keep-alive session per worker)
+PATIENT_PROCESS_API_URL = os.getenv(
+    'PATIENT_PROCESS_API_URL',
+    'https://coding-patient-api.vesynta.workers.dev/api/patients/{pk}/process'
+)
+PATIENT_PROCESS_API_CONNECT_TIMEOUT = float(os.getenv('PATIENT_PROCESS_API_CONNECT_TIMEOUT', '3.05'))
+PATIENT_PROCESS_API_READ_TIMEOUT = float(os.getenv('PATIENT_PROCESS_API_READ_TIMEOUT', '10'))
+PATIENT_PROCESS_API_POOL_SIZE = int(os.getenv('PATIENT_PROCESS_API_POOL_SIZE', '10'))
+PATIENT_PROCESS_API_RETRIES = int(os.getenv('PATIENT_PROCESS_API_RETRIES', '2'))
+PATIENT_PROCESS_API_BACKOFF = float(os.getenv('PATIENT_PROCESS_API_BACKOFF', '0.2'))
+PATIENT_PROCESS_API_VERIFY_TLS = os.getenv('PATIENT_PROCESS_API_VERIFY_TLS', 'false').lower() == 'true'
+# Send a second copy of a call still unanswered after the worker's p95 latency (at least
+# PATIENT_PROCESS_API_HEDGE_MIN_DELAY seconds); the first answer wins
+PATIENT_PROCESS_API_HEDGE = os.getenv('PATIENT_PROCESS_API_HEDGE', 'false').lower() == 'true'
+PATIENT_PROCESS_API_HEDGE_MIN_DELAY = float(os.getenv('PATIENT_PROCESS_API_HEDGE_MIN_DELAY', '0.05'))
+
+# Circuit breaker around the external API (see patient/breaker.py): open after
+# PATIENT_BREAKER_FAILURES failed calls in a row, probe again after PATIENT_BREAKER_RESET_TIMEOUT
+# seconds. State is per worker (`local`) or in the PATIENT_BREAKER_CACHE cache (`cache`).
+PATIENT_BREAKER_ENABLED = os.getenv('PATIENT_BREAKER_ENABLED', 'true').lower() == 'true'
+PATIENT_BREAKER_FAILURES = int(os.getenv('PATIENT_BREAKER_FAILURES', '5'))
+PATIENT_BREAKER_RESET_TIMEOUT = float(os.getenv('PATIENT_BREAKER_RESET_TIMEOUT', '30'))
+PATIENT_BREAKER_BACKEND = os.getenv('PATIENT_BREAKER_BACKEND', 'local')
+PATIENT_BREAKER_CACHE = os.getenv('PATIENT_BREAKER_CACHE', 'default')
+
+# Decimals (in kg and m) process requests are rounded to before matching stored metrics.
+# Changing it only affects rows saved afterwards.
+PATIENT_METRICS_KEY_PRECISION = int(os.getenv('PATIENT_METRICS_KEY_PRECISION', '2'))
+
+# Threads per worker running async process jobs; 0 leaves them to `manage.py process_jobs`
+PATIENT_PROCESS_WORKERS = int(os.getenv('PATIENT_PROCESS_WORKERS', '4'))
+
+# Batch process endpoint: max items per request, concurrent upstream calls per request
+PATIENT_PROCESS_BATCH_MAX_ITEMS = int(os.getenv('PATIENT_PROCESS_BATCH_MAX_ITEMS', '500'))
+PATIENT_PROCESS_BATCH_CONCURRENCY = int(os.getenv('PATIENT_PROCESS_BATCH_CONCURRENCY', '8'))
+
+# Local surrogate for the process endpoints (see patient/surrogate.py): answer with an
+# "approximate" interpolation of stored results when the external API fails, or hasn't
+# answered after PATIENT_SURROGATE_AFTER seconds (0 waits for it). The table is rebuilt
+# once metrics change, at most every PATIENT_SURROGATE_CACHE_TIMEOUT seconds otherwise.
+PATIENT_SURROGATE_ENABLED = os.getenv('PATIENT_SURROGATE_ENABLED', 'false').lower() == 'true'
+PATIENT_SURROGATE_AFTER = float(os.getenv('PATIENT_SURROGATE_AFTER', '0'))
+PATIENT_SURROGATE_CACHE_TIMEOUT = int(os.getenv('PATIENT_SURROGATE_CACHE_TIMEOUT', '86400'))
+
+# PK analytics: trailing points used for the terminal half-life fit, and how long a
+# result may be reused (it's recomputed as soon as metrics are added or removed anyway)
+PATIENT_ANALYTICS_TERMINAL_POINTS = int(os.getenv('PATIENT_ANALYTICS_TERMINAL_POINTS', '4'))
+PATIENT_ANALYTICS_CACHE_TIMEOUT = int(os.getenv('PATIENT_ANALYTICS_CACHE_TIMEOUT', '86400'))
+
+# Request/DB/upstream telemetry served on /api/metrics. With several workers set
+# PATIENT_TELEMETRY_DIR to a directory they share (emptied on deploy) so it sums them all.
+PATIENT_TELEMETRY_ENABLED = os.getenv('PATIENT_TELEMETRY_ENABLED', 'true').lower() == 'true'
+PATIENT_TELEMETRY_DIR = os.getenv('PATIENT_TELEMETRY_DIR', '')
+PATIENT_TELEMETRY_FLUSH_INTERVAL = float(os.getenv('PATIENT_TELEMETRY_FLUSH_INTERVAL', '5'))
+
+# Serve the list, detail and process endpoints with the async views (async ORM, httpx).
+# Meant for an ASGI server (SERVER_MODE=asgi); under WSGI each request gets its own event loop.
+PATIENT_ASYNC_VIEWS = os.getenv('PATIENT_ASYNC_VIEWS', 'false').lower() == 'true'
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -108,6 +205,34 @@ else:
             }
         }
 
+# Read replicas: comma-separated database URLs (postgres://..., or sqlite:////path/replica.sqlite3
+# to try it locally), added as replica_1, replica_2, ... The patient list/detail GETs and the
+# stored metrics lookups of the process endpoints read from one of them, writes stay on
+# `default` (patient/routers.py). Tests use `default` for them (MIRROR).
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+PATIENT_READ_REPLICAS = []
+for index, url in enumerate(DATABASE_REPLICA_URLS, 1):
+    DATABASES[f'replica_{index}'] = {**dj_database_url.parse(url), 'TEST': {'MIRROR': 'default'}}
+    PATIENT_READ_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['patient.routers.ReadReplicaRouter'] if PATIENT_READ_REPLICAS else []
+
+# Read-your-writes: seconds a client stays on the primary after a successful write (a
+# cookie), more than the replicas lag. List pages, details and the patient count read
+# from a replica are cached at most PATIENT_REPLICA_CACHE_TIMEOUT seconds, so one built
+# by a lagging replica right after a write doesn't outlive the lag for long.
+PATIENT_REPLICA_PIN_SECONDS = int(os.getenv('PATIENT_REPLICA_PIN_SECONDS', '5'))
+PATIENT_REPLICA_CACHE_TIMEOUT = int(os.getenv('PATIENT_REPLICA_CACHE_TIMEOUT', '60'))
+
+# Cache
+# locmem by default (per process); point CACHE_BACKEND/CACHE_LOCATION at a
+# shared backend (redis, memcached, database) to share it between workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'patient'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,45 @@
+"""
+Production profile, used by the Docker image (DJANGO_SETTINGS_MODULE=config.settings_production).
+
+The development settings with DEBUG off, persistent health-checked DB connections, and
+the state several Gunicorn workers have to share (cache, throttle, circuit breaker,
+telemetry) moved out of each worker's memory.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, SECRET_KEY
+
+# DEBUG also keeps every query of a request in memory
+DEBUG = os.getenv('DJANGO_DEBUG', 'false').lower() == 'true'
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', SECRET_KEY)
+# Served behind Traefik; list the public host names to have Django check them
+ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+# Keep each worker thread's DB connection open between requests instead of connecting for
+# every request, and check it before reuse after an error. Under ASGI and gevent requests
+# don't stay on one thread, so connections would pile up instead: 0 there (pool them with
+# PgBouncer if needed).
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+PER_THREAD_CONNECTIONS = SERVER_MODE != 'asgi' and os.getenv('GUNICORN_WORKER_CLASS', 'gthread') != 'gevent'
+for database in DATABASES.values():
+    database.update(
+        CONN_MAX_AGE=int(os.getenv('DB_CONN_MAX_AGE', '60' if PER_THREAD_CONNECTIONS else '0')),
+        CONN_HEALTH_CHECKS=True,
+    )
+
+# Workers must see each other's cache writes (list invalidation, counts): the database
+# cache (table made by `createcachetable` in the migrate step) unless CACHE_BACKEND
+# points at Redis or memcached, which are faster
+if 'CACHE_BACKEND' not in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'patient_cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+PATIENT_THROTTLE_BACKEND = os.getenv('PATIENT_THROTTLE_BACKEND', 'db')
+PATIENT_BREAKER_BACKEND = os.getenv('PATIENT_BREAKER_BACKEND', 'cache')
+# Emptied by gunicorn.conf.py when the server starts
+PATIENT_TELEMETRY_DIR = os.getenv('PATIENT_TELEMETRY_DIR', '/tmp/patient-telemetry')
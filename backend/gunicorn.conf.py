@@ -0,0 +1,115 @@
+"""
+Gunicorn settings for the Docker image, read from the working directory (backend/).
+Sized from the CPUs the container may use; every value can be overridden through the
+environment.
+
+DB connection budget: with persistent connections (CONN_MAX_AGE > 0, gthread) every
+thread that touches the database keeps one open, so each worker holds up to
+GUNICORN_THREADS (requests) + PATIENT_PROCESS_WORKERS (async jobs) + PATIENT_PROCESS_API_POOL_SIZE
+(background fetches, surrogate on only). The hedge and batch pools only make HTTP calls.
+workers x that, plus the `jobs` service, has to stay under the server's max_connections
+(DB_MAX_CONNECTIONS, Postgres default 100); when_ready logs the total and warns above it.
+"""
+import math
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+
+def available_cpus():
+    """
+    CPUs this process may run on: its affinity mask, capped by a cgroup CPU quota
+    (docker --cpus), which cpu_count() ignores
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota -1 when unlimited
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = f.read().strip()
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = f.read().strip()
+        except OSError:
+            return cpus
+    if quota not in ('max', '-1'):
+        cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    return cpus
+
+
+# gthread (default): a thread pool per worker, requests waiting on the external API
+# don't hold a whole process. gevent: greenlets, needs `pip install gevent psycogreen`.
+# sync: one request at a time per worker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+cpus = available_cpus()
+# Threads and greenlets already overlap the waiting, one process per CPU runs the Python;
+# sync workers wait themselves, so more of them
+workers = int(os.getenv('WEB_CONCURRENCY', cpus * 2 + 1 if worker_class == 'sync' else cpus))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+# Import Django and the app once in the master; workers fork with it loaded, start
+# faster and share its memory pages
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Above the slowest process call (connect + read timeouts and retries)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers now and then, staggered so they don't all restart together; a recycled
+# worker finishes its running jobs first (worker_exit), the `jobs` service picks up the rest
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+
+def on_starting(server):
+    # The previous run's telemetry files would be summed into /api/metrics
+    from django.conf import settings
+    if settings.PATIENT_TELEMETRY_DIR:
+        shutil.rmtree(settings.PATIENT_TELEMETRY_DIR, ignore_errors=True)
+
+
+def when_ready(server):
+    # Workers must not inherit a DB connection opened while preloading
+    from django.conf import settings
+    from django.db import connections
+    connections.close_all()
+
+    if not settings.DATABASES['default'].get('CONN_MAX_AGE'):
+        return
+    per_worker = (threads if worker_class == 'gthread' else 1) + max(settings.PATIENT_PROCESS_WORKERS, 0)
+    if settings.PATIENT_SURROGATE_ENABLED:
+        per_worker += settings.PATIENT_PROCESS_API_POOL_SIZE
+    total = workers * per_worker
+    limit = int(os.getenv('DB_MAX_CONNECTIONS', '100'))
+    server.log.info("DB connections: up to %d per worker x %d workers = %d", per_worker, workers, total)
+    if total > limit:
+        server.log.warning(
+            "Up to %d persistent DB connections, above DB_MAX_CONNECTIONS=%d: "
+            "lower WEB_CONCURRENCY/GUNICORN_THREADS/PATIENT_PROCESS_WORKERS or DB_CONN_MAX_AGE",
+            total, limit
+        )
+
+
+def worker_exit(server, worker):
+    # Let running jobs finish (within graceful_timeout); queued ones stay in the table
+    from patient import jobs
+    jobs.shutdown()
+
+
+def post_worker_init(worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning("psycogreen is not installed, DB queries block the gevent worker")
+        else:
+            patch_psycopg()
@@ -1,6 +1,6 @@
 
 from django.contrib import admin
-from .models import Patient, PatientMetrics
+from .models import Patient, PatientMetrics, ProcessJob
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -14,3 +14,10 @@ class PatientMetricsAdmin(admin.ModelAdmin):
     list_display = ('patient', 'weight_value', 'weight_unit', 'height_value', 'height_unit',  'processed_at')
     search_fields = ('patient__first_name', 'patient__last_name')
     list_filter = ('processed_at',)
+
+
+@admin.register(ProcessJob)
+class ProcessJobAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'status', 'attempts', 'created_at', 'finished_at')
+    search_fields = ('patient__first_name', 'patient__last_name')
+    list_filter = ('status', 'created_at')
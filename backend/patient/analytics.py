@@ -0,0 +1,167 @@
+"""
+Pharmacokinetic summary over every stored PatientMetrics series, computed with NumPy
+on whole batches of equal-length series at once.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import PatientMetrics
+from .series import HEADER, RANGE, RANGE_CODE
+
+ANALYTICS_CACHE_KEY = 'patient:analytics:pk'
+NUMPY_DTYPES = {'b': 'i1', 'h': '<i2', 'i': '<i4', 'q': '<i8', 'd': '<f8'}
+STATS = ('cmax', 'tmax', 'auc', 'half_life')
+
+# numpy 2 renamed trapz
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def decode_columns(packed):
+    """
+    (durations, concentrations) as float64 arrays straight from the packed buffer
+    """
+    buffer = bytes(packed)
+    _, duration_code, concentration_code, count = HEADER.unpack_from(buffer)
+    offset = HEADER.size
+    duration_code, concentration_code = chr(duration_code), chr(concentration_code)
+
+    if duration_code == RANGE_CODE:
+        start, step = RANGE.unpack_from(buffer, offset)
+        durations = start + step * np.arange(count, dtype=np.float64)
+        offset += RANGE.size
+    else:
+        dtype = np.dtype(NUMPY_DTYPES[duration_code])
+        durations = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).astype(np.float64)
+        offset += dtype.itemsize * count
+    concentrations = np.frombuffer(
+        buffer, dtype=NUMPY_DTYPES[concentration_code], count=count, offset=offset
+    ).astype(np.float64)
+    return durations, concentrations
+
+
+def pk_metrics(durations, concentrations, terminal_points):
+    """
+    Cmax, Tmax, AUC (trapezoid) and terminal half-life for a (series x points) batch.
+    Half-life comes from a log-linear fit of the last `terminal_points` points and is
+    NaN when they aren't all after Cmax, positive and decreasing.
+    """
+    rows = np.arange(concentrations.shape[0])
+    peak = concentrations.argmax(axis=1)
+    cmax = concentrations[rows, peak]
+    tmax = durations[rows, peak]
+    auc = trapezoid(concentrations, durations, axis=1)
+
+    points = concentrations.shape[1]
+    half_life = np.full(concentrations.shape[0], np.nan)
+    if points >= max(terminal_points, 2):
+        t = durations[:, -terminal_points:]
+        c = concentrations[:, -terminal_points:]
+        usable = (peak < points - terminal_points) & (c > 0).all(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_c = np.log(np.where(c > 0, c, 1.0))
+            t_centered = t - t.mean(axis=1, keepdims=True)
+            slope = (t_centered * (log_c - log_c.mean(axis=1, keepdims=True))).sum(axis=1) / (t_centered ** 2).sum(axis=1)
+            usable &= slope < 0
+            half_life = np.where(usable, math.log(2) / -slope, np.nan)
+    return {"cmax": cmax, "tmax": tmax, "auc": auc, "half_life": half_life}
+
+
+def summarize(values):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return {"n": 0, "mean": None, "median": None, "min": None, "max": None}
+    return {
+        "n": int(values.size),
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def group_stats(metrics, labels):
+    """
+    Summary of every metric per distinct label
+    """
+    groups = {}
+    if not labels.size:
+        return groups
+    names, inverse = np.unique(labels, return_inverse=True)
+    for index, name in enumerate(names):
+        mask = inverse == index
+        groups[str(name)] = {"count": int(mask.sum()), **{stat: summarize(metrics[stat][mask]) for stat in STATS}}
+    return groups
+
+
+def compute_pk_analytics():
+    terminal_points = settings.PATIENT_ANALYTICS_TERMINAL_POINTS
+
+    # One JOIN query; series are bucketed by length so each bucket is one 2D batch
+    buckets = defaultdict(lambda: ([], [], [], []))
+    patients = set()
+    rows = PatientMetrics.objects.exclude(results_packed=None).values_list(
+        'patient_id', 'patient__sex', 'patient__ethnic_background', 'results_packed'
+    )
+    for patient_id, sex, ethnic_background, packed in rows.iterator(chunk_size=2000):
+        durations, concentrations = decode_columns(packed)
+        if not concentrations.size:
+            continue
+        bucket = buckets[concentrations.size]
+        bucket[0].append(durations)
+        bucket[1].append(concentrations)
+        bucket[2].append(sex)
+        bucket[3].append(ethnic_background)
+        patients.add(patient_id)
+
+    batches = [
+        pk_metrics(np.vstack(durations), np.vstack(concentrations), terminal_points)
+        for durations, concentrations, _, _ in buckets.values()
+    ]
+    metrics = {
+        stat: np.concatenate([batch[stat] for batch in batches]) if batches else np.empty(0)
+        for stat in STATS
+    }
+    sexes = np.array([sex for bucket in buckets.values() for sex in bucket[2]], dtype=object)
+    backgrounds = np.array([eb for bucket in buckets.values() for eb in bucket[3]], dtype=object)
+
+    return {
+        "series_count": int(metrics["cmax"].size),
+        "patient_count": len(patients),
+        "time_unit": "duration_30_m",
+        "overall": {"count": int(metrics["cmax"].size), **{stat: summarize(metrics[stat]) for stat in STATS}},
+        "by_sex": group_stats(metrics, sexes),
+        "by_ethnic_background": group_stats(metrics, backgrounds),
+        "computed_at": timezone.now(),
+    }
+
+
+def metrics_fingerprint():
+    """
+    Changes whenever metrics are added or removed, one cheap aggregate query
+    """
+    aggregate = PatientMetrics.objects.aggregate(last_id=Max('id'), count=Count('id'))
+    return aggregate['last_id'], aggregate['count']
+
+
+def get_pk_analytics():
+    """
+    Return (analytics, cached). Reused until the metrics table changes.
+    """
+    fingerprint = metrics_fingerprint()
+    cached = cache.get(ANALYTICS_CACHE_KEY)
+    if cached is not None and cached["fingerprint"] == fingerprint:
+        return cached["data"], True
+
+    data = compute_pk_analytics()
+    cache.set(
+        ANALYTICS_CACHE_KEY,
+        {"fingerprint": fingerprint, "data": data},
+        settings.PATIENT_ANALYTICS_CACHE_TIMEOUT
+    )
+    return data, False
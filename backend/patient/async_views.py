@@ -0,0 +1,307 @@
+"""
+Async versions of the list, detail and process endpoints, used with PATIENT_ASYNC_VIEWS
+under an ASGI server. Same URLs, bodies and caching as views.py; reads use the async ORM
+and the external call awaits on httpx, so a slow upstream holds no worker thread.
+Methods without an async version (adding a patient, deleting one) run the DRF view in a thread.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import reverse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+
+from .models import Patient
+from .serializers import PatientFilterSerializer, PatientMetricsPostSerializer
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+from .filters import filter_patients, filters_key
+from .payloads import apatient_rows, alatest_metrics
+from .caches import (
+    get_patient_count, get_cached_patient, cache_patient, patient_list_key, aget_cached_patient_list,
+    cache_patient_list
+)
+from .processing import ProcessingError, afind_metrics, metrics_payload
+from .surrogate import afetch_or_estimate
+from .renderers import FastJSONRenderer
+from .routers import replica_reads
+from .views import (
+    PatientView, PatientDetailView, ProcessPatientView, cached_response, include_metrics, with_latest_metrics
+)
+from . import jobs, telemetry
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """
+    The bytes the DRF views render, without content negotiation (JSON only)
+    """
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncAPIView(View):
+    """
+    Async handlers for the methods a subclass defines, every other method of
+    `sync_view` runs that DRF view in a thread. CSRF exempt like the DRF views.
+    """
+    sync_view = None
+    sync_handler = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Once per class, as_view() can be called for any number of routes
+        if 'sync_view' in cls.__dict__:
+            cls.sync_handler = staticmethod(sync_to_async(cls.sync_view.as_view())) if cls.sync_view else None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        if not hasattr(self, method) and self.sync_handler and hasattr(self.sync_view, method):
+            return self.sync_handler(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPatientView(AsyncAPIView):
+    """
+    GET: PatientView.get on the async ORM (page or cursor, filters, cached pages)
+    POST: PatientView.post
+    """
+    sync_view = PatientView
+    page_size = PatientView.page_size
+
+    async def get(self, request):
+        with replica_reads():
+            return await self.get_page(request)
+
+    async def get_page(self, request):
+        filter_serializer = PatientFilterSerializer(data=request.GET)
+        if not filter_serializer.is_valid():
+            return json_response({
+                "series": {
+                    "success": False,
+                    "result": {
+                        "errors": filter_serializer.errors
+                    }
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
+        filters = filter_serializer.validated_data
+
+        if 'cursor' in request.GET:
+            return await self.get_cursor_page(request, filters)
+
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+
+        key = await sync_to_async(patient_list_key)('page', page, filters_key(filters))
+        entry = await aget_cached_patient_list(key)
+        if entry is None:
+            page_size = self.page_size
+            start = (page - 1) * page_size
+            end = start + page_size
+
+            queryset = filter_patients(Patient.objects.all(), filters)
+            rows = await apatient_rows(queryset.order_by('id')[start:end])
+
+            if filters:
+                total_count, count_exact = await queryset.acount(), True
+            else:
+                total_count, count_exact = await sync_to_async(get_patient_count)()
+            total_pages = (total_count + page_size - 1) // page_size
+
+            entry = await sync_to_async(cache_patient_list)(key, {
+                "page": page,
+                "total_pages": total_pages,
+                "total_count": total_count,
+                "count_exact": count_exact,
+                "patients": [data for data, _ in rows]
+            }, rows)
+
+        result = entry["result"]
+        if include_metrics(request):
+            latest = await alatest_metrics([patient['id'] for patient in result["patients"]])
+            entry, patients = with_latest_metrics(entry, result["patients"], latest)
+            result = {**result, "patients": patients}
+
+        return cached_response(request, entry, {
+            "series": {
+                "success": True,
+                "result": result
+            }
+        }, json_response)
+
+    async def get_cursor_page(self, request, filters):
+        try:
+            last_id = decode_cursor(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return json_response({
+                "series": {
+                    "success": False,
+                    "result": {
+                        "errors": {"cursor": [str(e)]}
+                    }
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        key = await sync_to_async(patient_list_key)('cursor', last_id, filters_key(filters))
+        entry = await aget_cached_patient_list(key)
+        if entry is None:
+            patients = filter_patients(Patient.objects.all(), filters).order_by('id')
+            if last_id is not None:
+                patients = patients.filter(id__gt=last_id)
+
+            # Fetch one extra row to know whether there is a next page
+            rows = await apatient_rows(patients[:self.page_size + 1])
+            has_more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+
+            entry = await sync_to_async(cache_patient_list)(key, {
+                "page_size": self.page_size,
+                "next_cursor": encode_cursor(rows[-1][0]['id']) if has_more else None,
+                "patients": [data for data, _ in rows]
+            }, rows)
+
+        result = entry["result"]
+        if include_metrics(request):
+            latest = await alatest_metrics([patient['id'] for patient in result["patients"]])
+            entry, patients = with_latest_metrics(entry, result["patients"], latest)
+            result = {**result, "patients": patients}
+
+        return cached_response(request, entry, {
+            "series": {
+                "success": True,
+                "result": result
+            }
+        }, json_response)
+
+
+class AsyncPatientDetailView(AsyncAPIView):
+    """
+    GET: PatientDetailView.get on the async ORM
+    DELETE: PatientDetailView.delete
+    """
+    sync_view = PatientDetailView
+
+    async def get(self, request, pk):
+        with replica_reads():
+            return await self.get_patient(request, pk)
+
+    async def get_patient(self, request, pk):
+        entry = await sync_to_async(get_cached_patient)(pk)
+        if entry is None:
+            rows = await apatient_rows(Patient.objects.filter(pk=pk))
+            if not rows:
+                return json_response({
+                    "series": {
+                        "success": False,
+                        "result": {"patient": None}
+                    }
+                }, status=status.HTTP_404_NOT_FOUND)
+            entry = await sync_to_async(cache_patient)(*rows[0])
+
+        patient = entry["patient"]
+        if include_metrics(request):
+            entry, (patient,) = with_latest_metrics(entry, [patient], await alatest_metrics([patient['id']]))
+
+        return cached_response(request, entry, {
+            "series": {
+                "success": True,
+                "result": {"patient": patient}
+            }
+        }, json_response)
+
+
+class AsyncProcessPatientView(AsyncAPIView):
+    """
+    ProcessPatientView.post with the external call awaited on httpx: while it waits
+    the worker keeps serving other requests. Identical in-flight calls are shared.
+    """
+
+    def check_throttles(self, request):
+        """
+        ProcessPatientView's throttles, all of them consulted like DRF does:
+        (throttled, seconds to wait or None)
+        """
+        throttled, waits = False, []
+        for throttle_class in ProcessPatientView.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                throttled = True
+                waits.append(throttle.wait())
+        return throttled, max((wait for wait in waits if wait is not None), default=None)
+
+    async def post(self, request, pk):
+        throttled, wait = await sync_to_async(self.check_throttles)(request)
+        if throttled:
+            # Same body and Retry-After as DRF's throttled response
+            exc = Throttled(wait)
+            response = json_response({"detail": exc.detail}, status=exc.status_code)
+            if exc.wait:
+                response['Retry-After'] = '%d' % exc.wait
+            return response
+
+        # Fetch patient (only its id is used)
+        try:
+            patient = await Patient.objects.only('id').aget(pk=pk)
+        except Patient.DoesNotExist:
+            return json_response(
+                {"success": False, "error": "Patient not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            data = json.loads(request.body) if request.body else {}
+        except ValueError as e:
+            return json_response(
+                {"detail": f"JSON parse error - {e}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate input (weight + height)
+        serializer = PatientMetricsPostSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(
+                {"success": False, "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        weight = serializer.validated_data['weight']
+        height = serializer.validated_data['height']
+
+        # Check if metrics already exist (on a replica if any, see ProcessPatientView)
+        with replica_reads():
+            metrics = await afind_metrics(patient, weight, height)
+        telemetry.inc('patient_metrics_cache_requests_total', result='hit' if metrics else 'miss')
+        if metrics:
+            return json_response(metrics_payload(metrics))
+
+        # Async mode: queue the external call and let the client poll the job
+        if request.GET.get('async', '').lower() in ('1', 'true'):
+            job = await sync_to_async(jobs.enqueue)(patient, weight, height)
+            response = json_response({
+                "success": True,
+                "job": jobs.job_payload(job)
+            }, status=status.HTTP_202_ACCEPTED)
+            response['Location'] = reverse('process-job', kwargs={'pk': job.id})
+            return response
+
+        # Call external API and save the result, or estimate it (see surrogate.py)
+        try:
+            metrics, estimate = await afetch_or_estimate(patient, weight, height)
+        except ProcessingError as e:
+            response = json_response(
+                {"success": False, "error": str(e)},
+                status=e.status_code
+            )
+            if e.retry_after is not None:
+                response['Retry-After'] = '%d' % e.retry_after
+            return response
+        if estimate is not None:
+            return json_response(estimate)
+
+        return json_response(metrics_payload(metrics))
@@ -0,0 +1,122 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from rest_framework import status
+
+from .models import Patient, PatientMetrics
+from .processing import ProcessingError, call_upstream, metrics_payload, request_key
+from . import telemetry
+
+
+def lookup_existing(keys):
+    """
+    Stored metrics for many (patient_id, metric_key) keys in one query
+    """
+    if not keys:
+        return {}
+    rows = PatientMetrics.objects.filter(
+        patient_id__in={patient_id for patient_id, _ in keys},
+        metric_key__in={key for _, key in keys},
+    )
+    return {
+        (metrics.patient_id, metrics.metric_key): metrics
+        for metrics in rows
+        if (metrics.patient_id, metrics.metric_key) in keys
+    }
+
+
+def error_report(patient_id, message, status_code):
+    return {
+        "patient_id": patient_id,
+        "success": False,
+        "status": status_code,
+        "error": message,
+    }
+
+
+def success_report(metrics, source):
+    return {
+        "patient_id": metrics.patient_id,
+        "source": source,
+        **metrics_payload(metrics),
+    }
+
+
+def process_batch(items, concurrency=None, admit=None):
+    """
+    Process validated {patient_id, weight, height} items.
+    Stored metrics come from one lookup, the rest are fetched from the external API
+    concurrently (PATIENT_PROCESS_BATCH_CONCURRENCY calls unless `concurrency` is given)
+    and saved with one bulk_create. Returns one report per item, in order.
+    `admit(calls)` is called with the number of external calls needed before making
+    any, and may raise to refuse them.
+    """
+    reports = [None] * len(items)
+    patients = Patient.objects.in_bulk({item['patient_id'] for item in items})
+
+    # Identical items share one lookup/upstream call
+    pending = {}
+    for index, item in enumerate(items):
+        if item['patient_id'] not in patients:
+            reports[index] = error_report(item['patient_id'], "Patient not found", status.HTTP_404_NOT_FOUND)
+            continue
+        key = (item['patient_id'], request_key(item['weight'], item['height']))
+        pending.setdefault(key, (item, []))[1].append(index)
+
+    existing = lookup_existing(set(pending))
+    telemetry.inc('patient_metrics_cache_requests_total', len(existing), result='hit')
+    telemetry.inc('patient_metrics_cache_requests_total', len(pending) - len(existing), result='miss')
+    for key, metrics in existing.items():
+        for index in pending.pop(key)[1]:
+            reports[index] = success_report(metrics, 'cached')
+
+    if not pending:
+        return reports
+    if admit is not None:
+        admit(len(pending))
+
+    workers = max(1, min(concurrency or settings.PATIENT_PROCESS_BATCH_CONCURRENCY, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='process-batch') as executor:
+        # Each call runs in a copy of this context, so a wait_for_budget() around the batch holds
+        futures = {
+            key: executor.submit(
+                contextvars.copy_context().run, call_upstream, item['patient_id'], item['weight'], item['height']
+            )
+            for key, (item, _) in pending.items()
+        }
+
+    fetched = []
+    for key, future in futures.items():
+        item, indexes = pending[key]
+        try:
+            fields = future.result()
+        except ProcessingError as e:
+            for index in indexes:
+                reports[index] = error_report(item['patient_id'], str(e), e.status_code)
+            continue
+        fields.update(
+            weight_value=item['weight']['value'],
+            weight_unit=item['weight']['unit'],
+            height_value=item['height']['value'],
+            height_unit=item['height']['unit'],
+            metric_key=key[1],
+        )
+        fetched.append((PatientMetrics(patient_id=item['patient_id'], **fields), indexes))
+
+    try:
+        # Rows another worker saved meanwhile are skipped by the unique constraint
+        PatientMetrics.objects.bulk_create([metrics for metrics, _ in fetched], ignore_conflicts=True)
+    except Exception as e:
+        for metrics, indexes in fetched:
+            for index in indexes:
+                reports[index] = error_report(
+                    metrics.patient_id, f"Failed to save metrics: {str(e)}",
+                    status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+        return reports
+
+    for metrics, indexes in fetched:
+        for index in indexes:
+            reports[index] = success_report(metrics, 'processed')
+    return reports
@@ -0,0 +1,43 @@
+"""
+Shared helpers for the bench_* management commands
+"""
+import math
+
+
+class QueryCounter:
+    """
+    Count statements through connection.execute_wrapper (cheaper than capturing them)
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_summary(seconds):
+    """
+    Summarise per-request latencies (seconds) in milliseconds
+    """
+    if not seconds:
+        return {"count": 0}
+    return {
+        "count": len(seconds),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 3),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+    }
@@ -0,0 +1,136 @@
+"""
+Circuit breaker for the external process API. After PATIENT_BREAKER_FAILURES calls in
+a row fail (no response, or a 5xx once retries are spent) it opens: calls fail fast
+with CircuitOpen instead of each waiting out the timeout. PATIENT_BREAKER_RESET_TIMEOUT
+seconds later a single call goes through as a probe (half-open); its success closes the
+breaker, its failure keeps it open for another period.
+
+State is a few keys in a cache: a private locmem one per worker by default
+(PATIENT_BREAKER_BACKEND=local), or the PATIENT_BREAKER_CACHE cache
+(PATIENT_BREAKER_BACKEND=cache) so every worker sharing it (Redis, memcached, Django's
+database cache) trips and recovers together. Opening and claiming the probe use
+cache.add, so with a shared cache exactly one worker does each.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import telemetry
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+KEY_PREFIX = 'patient:breaker:upstream:'
+
+_local = LocMemCache('patient-breaker', {'TIMEOUT': None})
+
+
+class CircuitOpen(Exception):
+    """
+    The breaker is open; `retry_after` is the seconds until the next probe
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def get_cache():
+    if settings.PATIENT_BREAKER_BACKEND == 'cache':
+        return caches[settings.PATIENT_BREAKER_CACHE]
+    return _local
+
+
+def key(name):
+    return KEY_PREFIX + name
+
+
+def before_call():
+    """
+    Raises CircuitOpen unless the call may go ahead. Returns True when the call is
+    the half-open probe, whose outcome decides the breaker's.
+    """
+    if not settings.PATIENT_BREAKER_ENABLED:
+        return False
+    cache = get_cache()
+    opened_at = cache.get(key('opened_at'))
+    if opened_at is None:
+        return False
+
+    now = time.time()
+    retry_at = opened_at + settings.PATIENT_BREAKER_RESET_TIMEOUT
+    if now < retry_at or not cache.add(key(f'probe:{opened_at}'), True, settings.PATIENT_BREAKER_RESET_TIMEOUT):
+        telemetry.inc('patient_upstream_breaker_rejections_total')
+        raise CircuitOpen(max(retry_at - now, 0))
+    # Everyone else keeps failing fast until the probe is back (or another period passes)
+    cache.set(key('opened_at'), now, None)
+    telemetry.inc('patient_upstream_breaker_probes_total')
+    return True
+
+
+def record(ok, probe=False):
+    """
+    Count a finished call: a success closes the breaker, enough failures in a row open it
+    """
+    if not settings.PATIENT_BREAKER_ENABLED:
+        return
+    cache = get_cache()
+    if ok:
+        cache.delete_many([key('failures'), key('opened_at')])
+        return
+    if probe:
+        # Still down: stays open, the probe pushed opened_at to its own start
+        return
+
+    if cache.add(key('failures'), 1, None):
+        failures = 1
+    else:
+        try:
+            failures = cache.incr(key('failures'))
+        except ValueError:
+            # Reset by a success since the add
+            failures = 1
+            cache.set(key('failures'), 1, None)
+    if failures >= settings.PATIENT_BREAKER_FAILURES and cache.add(key('opened_at'), time.time(), None):
+        if not cache.add(key('trips'), 1, None):
+            cache.incr(key('trips'))
+        telemetry.inc('patient_upstream_breaker_trips_total')
+
+
+def status():
+    """
+    State as /api/upstream reports it; shared between workers with the cache backend
+    """
+    cache = get_cache()
+    values = cache.get_many([key('failures'), key('opened_at'), key('trips')])
+    opened_at = values.get(key('opened_at'))
+    state, retry_in = CLOSED, None
+    if opened_at is not None:
+        retry_in = opened_at + settings.PATIENT_BREAKER_RESET_TIMEOUT - time.time()
+        state = OPEN if retry_in > 0 else HALF_OPEN
+        retry_in = round(max(retry_in, 0), 3)
+    return {
+        "enabled": settings.PATIENT_BREAKER_ENABLED,
+        "backend": settings.PATIENT_BREAKER_BACKEND,
+        "state": state,
+        "consecutive_failures": values.get(key('failures'), 0),
+        "trips": values.get(key('trips'), 0),
+        "retry_in": retry_in,
+    }
+
+
+def prometheus_lines():
+    """
+    Current state as a gauge, appended to /api/metrics (this worker's view of it)
+    """
+    state = status()["state"]
+    return [
+        "# HELP patient_upstream_breaker_state External API circuit breaker state (0 closed, 1 half-open, 2 open)",
+        "# TYPE patient_upstream_breaker_state gauge",
+        f"patient_upstream_breaker_state {STATE_VALUES[state]}",
+    ]
+
+
+def reset():
+    get_cache().delete_many([key('failures'), key('opened_at'), key('trips')])
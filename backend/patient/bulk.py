@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .caches import patients_written
+from .models import Patient, PatientMetrics, ProcessJob
+from .payloads import patient_rows
+
+NATURAL_KEY = ('first_name', 'last_name', 'dob')
+UPSERT_FIELDS = ('sex', 'ethnic_background', 'updated_at')
+# pg_advisory_xact_lock key taken by upserts
+UPSERT_LOCK_ID = 7_345_001
+
+
+def bulk_create_patients(validated_data, chunk_size=None):
+    """
+    Insert already validated patient dicts with chunked bulk_create in one transaction.
+    Primary keys are filled in from RETURNING (Postgres, SQLite 3.35+).
+    """
+    chunk_size = chunk_size or settings.PATIENT_BULK_CHUNK_SIZE
+    patients = [Patient(**item) for item in validated_data]
+    using = router.db_for_write(Patient)
+    with transaction.atomic(using=using):
+        Patient.objects.using(using).bulk_create(patients, batch_size=chunk_size)
+        if patients:
+            patients_written(delta=len(patients), using=using)
+    return patients
+
+
+def natural_key(row):
+    return tuple(row[field] for field in NATURAL_KEY)
+
+
+def lock_upserts(connection):
+    """
+    Serialize upserts on Postgres: the natural key isn't unique (two people can share a
+    name and birth date), so nothing else stops two upserts inserting the same new key.
+    SQLite has a single writer anyway.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [UPSERT_LOCK_ID])
+
+
+def stored_patients(rows, using, chunk_size):
+    """
+    The oldest stored patient of each row's natural key, locked (select_for_update)
+    until the transaction ends; one query per chunk
+    """
+    keys = list({natural_key(row) for row in rows})
+    stored = {}
+    for start in range(0, len(keys), chunk_size):
+        chunk = set(keys[start:start + chunk_size])
+        # A cheap superset on two indexed columns, narrowed down to exact keys here
+        candidates = Patient.objects.using(using).select_for_update().filter(
+            last_name__in={key[1] for key in chunk},
+            dob__in={key[2] for key in chunk},
+        ).order_by('id')
+        for patient in candidates:
+            key = (patient.first_name, patient.last_name, patient.dob)
+            if key in chunk:
+                stored.setdefault(key, patient)
+    return stored
+
+
+def upsert_patients(validated_data, chunk_size=None):
+    """
+    Insert or update on (first_name, last_name, dob) in one transaction: the stored
+    patients are looked up and locked, updated with bulk_update, the new ones inserted
+    with bulk_create, chunked. When several patients share a key the oldest is updated.
+    A key repeated in the batch keeps its last row.
+    Returns (patients, created keys).
+    """
+    chunk_size = chunk_size or settings.PATIENT_BULK_CHUNK_SIZE
+    rows = list({natural_key(item): item for item in validated_data}.values())
+    using = router.db_for_write(Patient)
+
+    with transaction.atomic(using=using):
+        lock_upserts(connections[using])
+        stored = stored_patients(rows, using, chunk_size)
+        now = timezone.now()
+        patients, updated, created, created_keys = [], [], [], set()
+        for row in rows:
+            patient = stored.get(natural_key(row))
+            if patient is None:
+                patient = Patient(**row)
+                created.append(patient)
+                created_keys.add(natural_key(row))
+            else:
+                patient.sex = row['sex']
+                patient.ethnic_background = row['ethnic_background']
+                patient.updated_at = now
+                updated.append(patient)
+            patients.append(patient)
+        Patient.objects.using(using).bulk_update(updated, UPSERT_FIELDS, batch_size=chunk_size)
+        Patient.objects.using(using).bulk_create(created, batch_size=chunk_size)
+        # Updated patients may be cached with their old values
+        patients_written([patient.pk for patient in updated], len(created), using)
+
+    return patients, created_keys
+
+
+def delete_where_in(connection, model, field, ids):
+    """
+    DELETE FROM <model's table> WHERE <field's column> IN (ids), no collector; returns the row count
+    """
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field).column
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})",
+            ids
+        )
+        return cursor.rowcount
+
+
+def delete_patients(ids, return_payloads=True, chunk_size=None):
+    """
+    Delete patients with their jobs and metrics as set-based DELETE ... WHERE IN statements
+    (no collector, no per-object signals) on the primary, chunked, in one transaction.
+    Returns (deleted count, payloads of the deleted patients or None).
+    """
+    chunk_size = chunk_size or settings.PATIENT_BULK_CHUNK_SIZE
+    ids = sorted(set(ids))
+    payloads = [] if return_payloads else None
+    deleted = 0
+    using = router.db_for_write(Patient)
+    connection = connections[using]
+
+    with transaction.atomic(using=using):
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            if return_payloads:
+                payloads.extend(
+                    data for data, _ in patient_rows(Patient.objects.using(using).filter(id__in=chunk).order_by('id'))
+                )
+            # Children first: jobs point at metrics, both point at patients
+            delete_where_in(connection, ProcessJob, 'patient', chunk)
+            delete_where_in(connection, PatientMetrics, 'patient', chunk)
+            deleted += delete_where_in(connection, Patient, 'id', chunk)
+        if deleted:
+            patients_written(ids, -deleted, using)
+    return deleted, payloads
@@ -0,0 +1,196 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.utils.http import quote_etag
+
+from .models import Patient
+from . import routers
+
+PATIENT_COUNT_KEY = 'patient:count'
+PATIENT_COUNT_EXACT_KEY = 'patient:count:exact'
+PATIENT_COUNT_REPLICA_KEY = 'patient:count:replica'
+PATIENT_DETAIL_KEY = 'patient:detail:{pk}'
+PATIENT_LIST_VERSION_KEY = 'patient:list:version'
+
+
+def get_patient_count():
+    """
+    Return (count, exact) for the patient table, served from cache when possible
+    """
+    cached = cache.get_many([PATIENT_COUNT_KEY, PATIENT_COUNT_EXACT_KEY, PATIENT_COUNT_REPLICA_KEY])
+    if PATIENT_COUNT_KEY in cached and usable(cached.get(PATIENT_COUNT_REPLICA_KEY)):
+        return cached[PATIENT_COUNT_KEY], cached.get(PATIENT_COUNT_EXACT_KEY, True)
+
+    count, exact = count_patients()
+    cache.set_many({
+        PATIENT_COUNT_KEY: count,
+        PATIENT_COUNT_EXACT_KEY: exact,
+        PATIENT_COUNT_REPLICA_KEY: routers.current_replica() is not None,
+    }, cache_timeout(settings.PATIENT_COUNT_CACHE_TIMEOUT))
+    return count, exact
+
+
+def count_patients():
+    """
+    Count patients, using the planner estimate for very large Postgres tables
+    """
+    if settings.PATIENT_COUNT_MODE == 'estimate':
+        estimate = estimate_patient_count()
+        if estimate is not None and estimate >= settings.PATIENT_COUNT_ESTIMATE_MIN:
+            return estimate, False
+    return Patient.objects.count(), True
+
+
+def estimate_patient_count():
+    """
+    Row estimate from pg_class.reltuples; None when unavailable (not Postgres, never analyzed)
+    """
+    connection = connections[router.db_for_read(Patient)]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [Patient._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def adjust_patient_count(delta):
+    """
+    Shift the cached count after inserts/deletes instead of recounting
+    """
+    if not delta:
+        return
+    try:
+        cache.incr(PATIENT_COUNT_KEY, delta)
+    except ValueError:
+        # Nothing cached yet, next read will count
+        pass
+
+
+def invalidate_patient_count():
+    cache.delete_many([PATIENT_COUNT_KEY, PATIENT_COUNT_EXACT_KEY, PATIENT_COUNT_REPLICA_KEY])
+
+
+def cache_timeout(timeout):
+    """
+    `timeout`, capped at PATIENT_REPLICA_CACHE_TIMEOUT when this request reads from a
+    replica: a lagging one may not have the write that just emptied the cache
+    """
+    if routers.current_replica() is None:
+        return timeout
+    return min(timeout, settings.PATIENT_REPLICA_CACHE_TIMEOUT)
+
+
+def usable(from_replica):
+    """
+    False for something cached from a replica when the client is pinned to the
+    primary: it may predate the client's own write
+    """
+    return not (from_replica and routers.pinned())
+
+
+def get_cached_patient(pk):
+    entry = cache.get(PATIENT_DETAIL_KEY.format(pk=pk))
+    return entry if entry is not None and usable(entry.get("replica")) else None
+
+
+def cache_patient(data, updated_at):
+    """
+    Store a patient payload with its validators. Patients don't change after
+    creation except through an upsert, so updated_at is both the Last-Modified and the ETag seed.
+    """
+    entry = {
+        "patient": data,
+        "etag": quote_etag(f"{data['id']}-{updated_at.timestamp():.6f}"),
+        "last_modified": int(updated_at.timestamp()),
+    }
+    if routers.current_replica() is not None:
+        entry["replica"] = True
+    cache.set(PATIENT_DETAIL_KEY.format(pk=data['id']), entry, cache_timeout(settings.PATIENT_RESPONSE_CACHE_TIMEOUT))
+    return entry
+
+
+def invalidate_patients(pks):
+    cache.delete_many([PATIENT_DETAIL_KEY.format(pk=pk) for pk in pks])
+
+
+def patient_list_key(*parts):
+    """
+    Cache key for a list page, under the current list version so one bump drops every page
+    """
+    version = cache.get(PATIENT_LIST_VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted version never reuses old pages
+        cache.add(PATIENT_LIST_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(PATIENT_LIST_VERSION_KEY, 0)
+    return ':'.join(['patient:list', str(version), *map(str, parts)])
+
+
+def get_cached_patient_list(key):
+    entry = cache.get(key)
+    return entry if entry is not None and usable(entry.get("replica")) else None
+
+
+async def aget_cached_patient_list(key):
+    entry = await cache.aget(key)
+    return entry if entry is not None and usable(entry.get("replica")) else None
+
+
+def cache_patient_list(key, result, rows):
+    """
+    Store a list page; the ETag covers the (id, updated_at) of its rows and the rest of the result
+    """
+    digest = hashlib.md5(usedforsecurity=False)
+    for data, updated_at in rows:
+        digest.update(f"{data['id']}-{updated_at.timestamp():.6f},".encode())
+    for name in ('page', 'total_count', 'next_cursor'):
+        digest.update(f"{name}={result.get(name)},".encode())
+    entry = {"result": result, "etag": quote_etag(digest.hexdigest())}
+    if routers.current_replica() is not None:
+        entry["replica"] = True
+    cache.set(key, entry, cache_timeout(settings.PATIENT_RESPONSE_CACHE_TIMEOUT))
+    return entry
+
+
+def metrics_entry(entry, latest):
+    """
+    Validators for a cached entry served with its patients' latest metrics attached:
+    the ETag also covers those (metrics rows never change, their ids are enough).
+    No Last-Modified, a newer metrics row doesn't move the patient's.
+    """
+    digest = hashlib.md5(entry["etag"].encode(), usedforsecurity=False)
+    for patient_id, metrics in sorted(latest.items()):
+        digest.update(f"{patient_id}:{metrics['id']},".encode())
+    return {"etag": quote_etag(digest.hexdigest())}
+
+
+def invalidate_patient_lists():
+    try:
+        cache.incr(PATIENT_LIST_VERSION_KEY)
+    except ValueError:
+        # No version yet, so no cached pages either
+        pass
+
+
+def patients_written(pks=(), delta=0, using=DEFAULT_DB_ALIAS):
+    """
+    Drop what a write to patients made stale: the details of `pks`, every list page,
+    and shift the count by `delta` (patients added minus deleted). Runs once the
+    transaction commits, so a read racing the write can't cache the old rows again.
+    Called by the Patient signals (see signals.py) and by the bulk writes, which send none.
+    """
+    def invalidate():
+        if pks:
+            invalidate_patients(pks)
+        invalidate_patient_lists()
+        adjust_patient_count(delta)
+
+    transaction.on_commit(invalidate, using=using)
@@ -0,0 +1,90 @@
+import csv
+import json
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Patient
+from .series import unpack_results
+
+PATIENT_FIELDS = ['id', 'first_name', 'last_name', 'dob', 'sex', 'ethnic_background']
+METRICS_FIELDS = {
+    'metrics__id': 'metrics_id',
+    'metrics__weight_value': 'weight_value',
+    'metrics__weight_unit': 'weight_unit',
+    'metrics__height_value': 'height_value',
+    'metrics__height_unit': 'height_unit',
+    'metrics__processed_at': 'processed_at',
+    'metrics__results_packed': 'results',
+}
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands each row back instead of buffering it
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(include_metrics, chunk_size):
+    """
+    Stream flat rows with a single server-side cursor query.
+    With metrics it's one LEFT JOIN row per (patient, metrics) pair, ordered by patient.
+    """
+    fields = PATIENT_FIELDS + (list(METRICS_FIELDS) if include_metrics else [])
+    order = ['id', 'metrics__id'] if include_metrics else ['id']
+    return Patient.objects.order_by(*order).values(*fields).iterator(chunk_size=chunk_size)
+
+
+def export_ndjson(include_metrics, chunk_size):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    rows = iter_rows(include_metrics, chunk_size)
+    if not include_metrics:
+        for row in rows:
+            yield encoder.encode(row) + "\n"
+        return
+
+    # Rows come ordered by patient id, so grouping keeps only one patient in memory
+    for _, group in groupby(rows, key=itemgetter('id')):
+        group = list(group)
+        patient = {field: group[0][field] for field in PATIENT_FIELDS}
+        patient["metrics"] = [
+            {
+                "weight": {"value": row['metrics__weight_value'], "unit": row['metrics__weight_unit']},
+                "height": {"value": row['metrics__height_value'], "unit": row['metrics__height_unit']},
+                "processed_at": row['metrics__processed_at'],
+                "results": _points(row['metrics__results_packed']),
+            }
+            for row in group if row['metrics__id'] is not None
+        ]
+        yield encoder.encode(patient) + "\n"
+
+
+def export_csv(include_metrics, chunk_size):
+    writer = csv.writer(Echo())
+    fields = PATIENT_FIELDS + (list(METRICS_FIELDS) if include_metrics else [])
+    yield writer.writerow(PATIENT_FIELDS + (list(METRICS_FIELDS.values()) if include_metrics else []))
+    for row in iter_rows(include_metrics, chunk_size):
+        values = []
+        for field in fields:
+            value = row[field]
+            if field == 'metrics__results_packed' and value is not None:
+                value = json.dumps(unpack_results(value).pairs(), separators=(',', ':'))
+            elif hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        yield writer.writerow(values)
+
+
+def _points(packed):
+    series = unpack_results(packed)
+    return series.as_points() if series is not None else []
+
+
+EXPORTERS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+}
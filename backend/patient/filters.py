@@ -0,0 +1,51 @@
+import hashlib
+
+from django.db.models import Q
+
+
+def name_query(name):
+    """
+    Case-insensitive prefix match. One word matches first or last name,
+    two words match "first last" or "last first".
+    """
+    words = name.split()
+    if not words:
+        return Q()
+    if len(words) == 1:
+        return Q(last_name__istartswith=words[0]) | Q(first_name__istartswith=words[0])
+    head, rest = words[0], ' '.join(words[1:])
+    return (
+        Q(first_name__istartswith=head, last_name__istartswith=rest)
+        | Q(last_name__istartswith=head, first_name__istartswith=rest)
+    )
+
+
+def filter_patients(queryset, filters):
+    """
+    Apply validated PatientFilterSerializer data to a Patient queryset
+    """
+    if filters.get('name'):
+        queryset = queryset.filter(name_query(filters['name']))
+    if 'sex' in filters:
+        queryset = queryset.filter(sex=filters['sex'])
+    if 'ethnic_background' in filters:
+        queryset = queryset.filter(ethnic_background=filters['ethnic_background'])
+    if 'dob_from' in filters:
+        queryset = queryset.filter(dob__gte=filters['dob_from'])
+    if 'dob_to' in filters:
+        queryset = queryset.filter(dob__lte=filters['dob_to'])
+    if 'created_from' in filters:
+        queryset = queryset.filter(created_at__gte=filters['created_from'])
+    if 'created_to' in filters:
+        queryset = queryset.filter(created_at__lte=filters['created_to'])
+    return queryset
+
+
+def filters_key(filters):
+    """
+    Short stable cache key part for a set of filters, '' when there are none
+    """
+    if not filters:
+        return ''
+    raw = '&'.join(f"{name}={filters[name]}" for name in sorted(filters))
+    return hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
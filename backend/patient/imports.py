@@ -0,0 +1,96 @@
+import csv
+import json
+
+from rest_framework.exceptions import ValidationError
+
+from .bulk import bulk_create_patients
+from .serializers import AddPatientSerializer
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_ndjson_rows(lines):
+    """
+    Yield (line_number, row) from NDJSON bytes lines; undecodable lines yield a RowError
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, RowError(f"Invalid JSON: {e}")
+
+
+def iter_csv_rows(lines):
+    """
+    Yield (line_number, row) from CSV bytes lines, the first line is the header
+    """
+    reader = csv.DictReader(line.decode('utf-8-sig') for line in lines)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, RowError("Too many columns")
+            continue
+        yield reader.line_num, row
+
+
+def stream_import(rows, chunk_size):
+    """
+    Validate rows with AddPatientSerializer rules and insert them chunk by chunk.
+    Yields one NDJSON progress line per chunk and a summary line at the end.
+    """
+    serializer = AddPatientSerializer()
+    totals = {"rows": 0, "created": 0, "failed": 0}
+    chunk_number = 0
+
+    def flush(chunk):
+        valid, errors = [], []
+        for line_number, row in chunk:
+            if isinstance(row, RowError):
+                errors.append({"line": line_number, "errors": {"non_field_errors": [str(row)]}})
+                continue
+            try:
+                valid.append(serializer.run_validation(row))
+            except ValidationError as e:
+                errors.append({"line": line_number, "errors": e.detail})
+
+        created = bulk_create_patients(valid, chunk_size=chunk_size) if valid else []
+
+        totals["rows"] += len(chunk)
+        totals["created"] += len(created)
+        totals["failed"] += len(errors)
+        return _line({
+            "chunk": chunk_number,
+            "rows": len(chunk),
+            "created": len(created),
+            "first_id": created[0].id if created else None,
+            "last_id": created[-1].id if created else None,
+            "errors": errors,
+        })
+
+    chunk = []
+    try:
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                chunk_number += 1
+                yield flush(chunk)
+                chunk = []
+        if chunk:
+            chunk_number += 1
+            yield flush(chunk)
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Rows flushed so far stay committed, report where the stream broke
+        yield _line({"success": False, "error": f"Could not read upload: {e}", "summary": totals})
+        return
+
+    yield _line({"success": totals["failed"] == 0, "summary": totals})
+
+
+def _line(data):
+    return json.dumps(data, default=str) + "\n"
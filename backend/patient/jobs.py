@@ -0,0 +1,171 @@
+"""
+DB-backed queue for async process requests.
+
+Jobs are rows in ProcessJob. Each worker process runs them on a small thread
+pool right after the enqueueing transaction commits; `manage.py process_jobs`
+drains anything left queued (pool disabled, worker restarted).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+
+from .models import ProcessJob
+from .processing import ProcessingError, get_or_fetch_metrics, metrics_payload
+from .throttling import wait_for_budget
+
+# Seconds a job waits for the external API budget before failing with 429
+BUDGET_WAIT = 60
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_executor():
+    """
+    Per-worker thread pool, None when PATIENT_PROCESS_WORKERS is 0
+    """
+    global _executor, _executor_pid
+    if settings.PATIENT_PROCESS_WORKERS <= 0:
+        return None
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PATIENT_PROCESS_WORKERS,
+                    thread_name_prefix='process-job',
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def shutdown():
+    """
+    Wait for this worker's running jobs and drop the ones not started, which stay
+    queued in the table for `manage.py process_jobs`
+    """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None and _executor_pid == os.getpid():
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def enqueue(patient, weight, height):
+    """
+    Create a job (or reuse an identical one still pending) and schedule it after commit
+    """
+    params = dict(
+        patient=patient,
+        weight_value=weight['value'],
+        weight_unit=weight['unit'],
+        height_value=height['value'],
+        height_unit=height['unit'],
+    )
+    pending = ProcessJob.objects.filter(
+        status__in=[ProcessJob.QUEUED, ProcessJob.RUNNING], **params
+    ).order_by('id').first()
+    if pending:
+        return pending
+
+    job = ProcessJob.objects.create(**params)
+    executor = get_executor()
+    if executor is not None:
+        transaction.on_commit(lambda: executor.submit(run_in_thread, job.id))
+    return job
+
+
+def run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim(job_id):
+    """
+    Atomically move a queued job to running; False if someone else got it
+    """
+    return ProcessJob.objects.filter(id=job_id, status=ProcessJob.QUEUED).update(
+        status=ProcessJob.RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def run_job(job_id):
+    """
+    Run one claimed job: reuse stored metrics or call the external API
+    """
+    if not claim(job_id):
+        return None
+
+    job = ProcessJob.objects.select_related('patient').get(id=job_id)
+    weight = {"value": job.weight_value, "unit": job.weight_unit}
+    height = {"value": job.height_value, "unit": job.height_unit}
+    try:
+        with wait_for_budget(BUDGET_WAIT):
+            job.metrics = get_or_fetch_metrics(job.patient, weight, height)
+        job.status = ProcessJob.DONE
+    except ProcessingError as e:
+        job.status, job.error, job.error_status = ProcessJob.FAILED, str(e), e.status_code
+    except Exception as e:
+        job.status, job.error = ProcessJob.FAILED, f"Unexpected error: {str(e)}"
+        job.error_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+    job.finished_at = timezone.now()
+    job.save(update_fields=['metrics', 'status', 'error', 'error_status', 'finished_at'])
+    return job
+
+
+def requeue_stale(older_than):
+    """
+    Put jobs stuck in running (their worker died) back in the queue
+    """
+    return ProcessJob.objects.filter(
+        status=ProcessJob.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).update(status=ProcessJob.QUEUED)
+
+
+def run_pending(limit=None):
+    """
+    Run queued jobs in this process, oldest first. Returns how many were run.
+    """
+    ids = ProcessJob.objects.filter(status=ProcessJob.QUEUED).order_by('id').values_list('id', flat=True)
+    if limit:
+        ids = ids[:limit]
+    done = 0
+    for job_id in list(ids):
+        if run_job(job_id) is not None:
+            done += 1
+    return done
+
+
+def job_payload(job):
+    """
+    Job status for the API, with the results once it's done
+    """
+    data = {
+        "id": job.id,
+        "patient_id": job.patient_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "error": job.error or None,
+    }
+    if job.status == ProcessJob.DONE and job.metrics is not None:
+        payload = metrics_payload(job.metrics)
+        data["patient"] = payload["patient"]
+        data["results"] = payload["results"]
+    return data
@@ -0,0 +1,295 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from unittest import mock
+
+import django
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from patient import telemetry, upstream
+from patient.bench import latency_summary
+from patient.bulk import bulk_create_patients
+from patient.models import Patient
+from patient.pagination import encode_cursor
+from patient.seed import generate_patients
+from patient.stub_upstream import StubUpstreamServer
+from patient.views import PatientProcessRateThrottle
+
+SCENARIOS = (
+    'list_first', 'list_middle', 'list_last', 'list_cursor_deep', 'list_cached',
+    'detail', 'detail_cached', 'bulk_insert', 'delete', 'process_hit', 'process_miss',
+)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Headers and body go out in separate writes; with Nagle on, keep-alive
+    # requests stall ~40ms on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the patient API over HTTP: a throwaway test database seeded with N "
+        "generated patients, a threaded WSGI server, the local external API stub. "
+        "Reports p50/p95/p99, throughput and DB queries per request, optionally as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--bulk-size', type=int, default=100, help="Patients per bulk insert request")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--stub-delay', type=float, default=0.005, help="External API stub time per call")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--conn-max-age', type=int, default=None,
+            help="CONN_MAX_AGE for the run (default: the settings'); 0 connects to the DB for every request"
+        )
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Earlier JSON results to show p95/throughput changes against")
+
+    def handle(self, *args, **options):
+        if options['requests'] * 2 >= options['patients']:
+            raise CommandError("--patients must be more than twice --requests (delete/process use distinct patients)")
+
+        if options['conn_max_age'] is not None:
+            # Shared by the connections the server threads open
+            connection.settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+        old_name, test_file = self.create_test_db()
+        try:
+            with StubUpstreamServer(delay=options['stub_delay']) as stub, override_settings(
+                DEBUG=False,
+                ALLOWED_HOSTS=['127.0.0.1'],
+                PATIENT_PROCESS_API_URL=stub.url_template,
+                PATIENT_TELEMETRY_ENABLED=True,
+                PATIENT_TELEMETRY_DIR='',
+            ), mock.patch.dict(PatientProcessRateThrottle.THROTTLE_RATES, {'patient_process': None}):
+                upstream.reset_session()
+                cache.clear()
+                results = self.run_suite(options)
+                upstream.reset_session()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if test_file and os.path.exists(test_file):
+                os.remove(test_file)
+
+        report = {"meta": self.meta(options), "scenarios": results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"results written to {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def create_test_db(self):
+        """
+        Fresh test database. SQLite gets a file so the server threads share it, and
+        IMMEDIATE transactions so concurrent writers wait instead of failing with
+        "database is locked".
+        """
+        test_file = None
+        if connection.vendor == 'sqlite':
+            test_file = os.path.join(tempfile.gettempdir(), f"bench_api_{os.getpid()}.sqlite3")
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = test_file
+            connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=30)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Read replicas route to the test database, like the test runner's MIRROR
+        for alias in settings.PATIENT_READ_REPLICAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        return old_name, test_file
+
+    def run_suite(self, options):
+        count = options['patients']
+        started = time.perf_counter()
+        rows = [
+            dict(row, dob=datetime.date.fromisoformat(row['dob']))
+            for row in generate_patients(count, seed=options['seed'])
+        ]
+        bulk_create_patients(rows)
+        ids = list(Patient.objects.order_by('id').values_list('id', flat=True))
+        self.stdout.write(
+            f"seeded {count} patients in {time.perf_counter() - started:.1f}s "
+            f"({connection.vendor}, CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']})"
+        )
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}/api"
+
+        try:
+            results = {}
+            self.stdout.write(
+                f"{'scenario':<18} {'reqs':>5} {'errors':>6} {'p50_ms':>8} {'p95_ms':>8} "
+                f"{'p99_ms':>8} {'req/s':>8} {'queries':>8}"
+            )
+            for name in options['scenarios']:
+                requests_list, cached = getattr(self, f"scenario_{name}")(ids, options)
+                timeout = settings.PATIENT_RESPONSE_CACHE_TIMEOUT if cached else 0
+                with override_settings(PATIENT_RESPONSE_CACHE_TIMEOUT=timeout):
+                    if cached:
+                        # Warm the cache outside the measurement
+                        for method, path, body in requests_list[:1]:
+                            requests.request(method, base + path, json=body)
+                    result = self.drive(base, requests_list, options['concurrency'])
+                results[name] = result
+                self.stdout.write(
+                    f"{name:<18} {result['count']:>5} {result['errors']:>6} {result['p50_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['throughput_rps']:>8.1f} "
+                    f"{result['queries_per_request']:>8.2f}"
+                )
+            return results
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def drive(self, base, requests_list, concurrency):
+        """
+        Send every (method, path, body) with `concurrency` keep-alive clients
+        """
+        local = threading.local()
+
+        def send(request):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            method, path, body = request
+            started = time.perf_counter()
+            resp = session.request(method, base + path, json=body)
+            return time.perf_counter() - started, resp.status_code
+
+        telemetry.reset()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(send, requests_list))
+        wall = time.perf_counter() - started
+
+        _, histograms = telemetry.collect()
+        queries = [
+            (total, count) for (name, _), (_, total, count) in histograms.items()
+            if name == 'patient_db_queries_per_request'
+        ]
+        served = sum(count for _, count in queries)
+        return {
+            **latency_summary([seconds for seconds, _ in outcomes]),
+            "errors": sum(1 for _, code in outcomes if code >= 400),
+            "throughput_rps": round(len(outcomes) / wall, 1),
+            "queries_per_request": round(sum(total for total, _ in queries) / served, 2) if served else 0,
+        }
+
+    # Each scenario returns ([(method, path, json body), ...], cached)
+
+    def scenario_list_first(self, ids, options):
+        return [('GET', '/patients?page=1', None)] * options['requests'], False
+
+    def scenario_list_middle(self, ids, options):
+        return [('GET', f'/patients?page={max(len(ids) // 15 // 2, 1)}', None)] * options['requests'], False
+
+    def scenario_list_last(self, ids, options):
+        return [('GET', f'/patients?page={(len(ids) + 14) // 15}', None)] * options['requests'], False
+
+    def scenario_list_cursor_deep(self, ids, options):
+        cursor = encode_cursor(ids[-30])
+        return [('GET', f'/patients?cursor={cursor}', None)] * options['requests'], False
+
+    def scenario_list_cached(self, ids, options):
+        return [('GET', f'/patients?page={max(len(ids) // 15 // 2, 1)}', None)] * options['requests'], True
+
+    def scenario_detail(self, ids, options):
+        step = max(len(ids) // options['requests'], 1)
+        return [('GET', f'/patients/{pk}', None) for pk in ids[::step][:options['requests']]], False
+
+    def scenario_detail_cached(self, ids, options):
+        return [('GET', f'/patients/{ids[len(ids) // 2]}', None)] * options['requests'], True
+
+    def scenario_bulk_insert(self, ids, options):
+        size = options['bulk_size']
+        # Continue the generator past the seeded rows so natural keys stay unique
+        start = len(ids)
+        rows = list(islice(generate_patients(start + size * options['requests'], seed=options['seed']), start, None))
+        return [
+            ('POST', '/patients/bulk', rows[i * size:(i + 1) * size])
+            for i in range(options['requests'])
+        ], False
+
+    def scenario_delete(self, ids, options):
+        # The newest seeded patients, away from the pages the list scenarios read
+        return [('DELETE', f'/patients/{pk}', None) for pk in ids[-options['requests']:]], False
+
+    def scenario_process_hit(self, ids, options):
+        body = {"weight": {"value": 70, "unit": "kg"}, "height": {"value": 175, "unit": "cm"}}
+        pk = ids[0]
+        return [('POST', f'/patients/{pk}/process', body)] * options['requests'], True
+
+    def scenario_process_miss(self, ids, options):
+        # A different weight per request, so each one calls the stub
+        return [
+            ('POST', f'/patients/{ids[1 + i]}/process', {
+                "weight": {"value": 40 + i * 0.01, "unit": "kg"},
+                "height": {"value": 175, "unit": "cm"},
+            })
+            for i in range(options['requests'])
+        ], False
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "settings": settings.SETTINGS_MODULE,
+            "conn_max_age": connection.settings_dict['CONN_MAX_AGE'],
+            "cache": settings.CACHES['default']['BACKEND'],
+            "patients": options['patients'],
+            "requests": options['requests'],
+            "concurrency": options['concurrency'],
+            "bulk_size": options['bulk_size'],
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)
+        self.stdout.write(f"compared with {path} (commit {previous['meta'].get('commit')})")
+        self.stdout.write(f"{'scenario':<18} {'p95_ms':>17} {'req/s':>17}")
+        for name, result in results.items():
+            old = previous['scenarios'].get(name)
+            if not old or not old.get('count'):
+                continue
+            self.stdout.write(
+                f"{name:<18} {old['p95_ms']:>7.2f} {self.change(old['p95_ms'], result['p95_ms'])} "
+                f"{old['throughput_rps']:>7.1f} {self.change(old['throughput_rps'], result['throughput_rps'])}"
+            )
+
+    @staticmethod
+    def change(old, new):
+        if not old:
+            return f"{'n/a':>9}"
+        return f"{(new - old) / old * 100:>+8.1f}%"
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from patient.bench import QueryCounter
+from patient.bulk import bulk_create_patients
+from patient.seed import generate_patients
+from patient.serializers import AddPatientSerializer
+
+
+def serializer_save(rows, chunk_size):
+    serializer = AddPatientSerializer(data=rows, many=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def bulk_path(rows, chunk_size):
+    serializer = AddPatientSerializer(data=rows, many=True)
+    serializer.is_valid(raise_exception=True)
+    return bulk_create_patients(serializer.validated_data, chunk_size=chunk_size)
+
+
+PATHS = {
+    'serializer': serializer_save,
+    'bulk_create': bulk_path,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-row serializer insert path with the chunked bulk_create path. "
+        "Every run is rolled back, the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"database: {connection.vendor}")
+        self.stdout.write(f"{'rows':>8} {'path':<12} {'seconds':>9} {'rows/s':>10} {'queries':>8}")
+        for size in options['sizes']:
+            rows = list(generate_patients(size))
+            for name in options['paths']:
+                seconds, queries = self.run_once(PATHS[name], rows, options['chunk_size'])
+                self.stdout.write(
+                    f"{size:>8} {name:<12} {seconds:>9.3f} {size / seconds:>10.0f} {queries:>8}"
+                )
+
+    def run_once(self, path, rows, chunk_size):
+        counter = QueryCounter()
+        with transaction.atomic():
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                created = path(rows, chunk_size)
+                seconds = time.perf_counter() - started
+            assert len(created) == len(rows) and created[-1].pk is not None
+            transaction.set_rollback(True)
+        return seconds, counter.count
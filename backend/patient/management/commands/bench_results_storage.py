@@ -0,0 +1,60 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from patient.series import pack_results, unpack_results
+from patient.stub_upstream import concentration_series
+
+
+def json_points(text):
+    # What the process endpoints did with the JSONField: decode, then rebuild as dicts
+    return [{"duration_30_m": r[0], "concentration": r[1]} for r in json.loads(text)]
+
+
+def packed_points(packed):
+    return unpack_results(packed).as_points()
+
+
+class Command(BaseCommand):
+    help = "Compare JSON and packed storage of PatientMetrics results: bytes per row and time to serialize."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, nargs='+', default=[48, 480, 4800])
+        parser.add_argument('--rows', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'points':>7} {'format':<8} {'bytes/row':>10} {'decode+build us/row':>20}"
+        )
+        for points in options['points']:
+            rows = [
+                concentration_series({"value": 50 + i % 60, "unit": "kg"}, {"value": 150 + i % 50, "unit": "cm"}, points)
+                for i in range(options['rows'])
+            ]
+            as_json = [json.dumps(r) for r in rows]
+            as_packed = [pack_results(r) for r in rows]
+            assert all(packed_points(p) == json_points(j) for p, j in zip(as_packed[:50], as_json[:50]))
+
+            for name, stored, decode in (('json', as_json, json_points), ('packed', as_packed, packed_points)):
+                size = sum(len(value) for value in stored) / len(stored)
+                started = time.perf_counter()
+                for value in stored:
+                    decode(value)
+                micros = (time.perf_counter() - started) / len(stored) * 1e6
+                self.stdout.write(f"{points:>7} {name:<8} {size:>10.0f} {micros:>20.1f}")
+
+            jsonb = self.jsonb_size(as_json[0])
+            if jsonb is not None:
+                self.stdout.write(f"{points:>7} {'jsonb':<8} {jsonb:>10}")
+
+    def jsonb_size(self, text):
+        """
+        On Postgres, what the old JSONField column actually took per row
+        """
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_column_size(%s::jsonb)", [text])
+            return cursor.fetchone()[0]
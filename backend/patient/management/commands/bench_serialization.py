@@ -0,0 +1,97 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from patient.bulk import bulk_create_patients
+from patient.models import Patient, PatientMetrics
+from patient.payloads import patient_rows
+from patient.processing import metrics_payload
+from patient.renderers import FastJSONRenderer, orjson
+from patient.seed import generate_patients
+from patient.serializers import PatientSerializer
+from patient.stub_upstream import concentration_series
+
+
+def page_body(patients):
+    return {"series": {"success": True, "result": {"page": 1, "patients": patients}}}
+
+
+# Each call takes a fresh queryset so the fetch is part of what's timed
+def serializer_page(queryset):
+    return page_body(PatientSerializer(queryset.all(), many=True).data)
+
+
+def values_page(queryset):
+    return page_body([data for data, _ in patient_rows(queryset.all())])
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare PatientSerializer + JSONRenderer with the values_list() payloads + FastJSONRenderer "
+        "used by the list/detail/process endpoints. Checks the bytes are identical. "
+        "Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 15, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write("orjson is not installed, FastJSONRenderer falls back to the stdlib path")
+        with transaction.atomic(), override_settings(PATIENT_FAST_JSON=True):
+            rows = [
+                dict(row, dob=datetime.date.fromisoformat(row['dob']))
+                for row in generate_patients(max(options['sizes']))
+            ]
+            bulk_create_patients(rows)
+            self.compare_pages(options['sizes'], options['repeat'])
+            self.compare_process(options['repeat'])
+            transaction.set_rollback(True)
+
+    def compare_pages(self, sizes, repeat):
+        self.stdout.write(f"{'rows':>6} {'path':<28} {'us/response':>12} {'speedup':>8}")
+        for size in sizes:
+            queryset = Patient.objects.order_by('id')[:size]
+            paths = [
+                ('serializer + JSONRenderer', serializer_page, JSONRenderer()),
+                ('values + JSONRenderer', values_page, JSONRenderer()),
+                ('values + FastJSONRenderer', values_page, FastJSONRenderer()),
+            ]
+            baseline = None
+            expected = None
+            for name, build, renderer in paths:
+                body = renderer.render(build(queryset))
+                if expected is None:
+                    expected = body
+                assert body == expected, f"{name} output differs at {size} rows"
+
+                micros = self.time(lambda: renderer.render(build(queryset)), repeat)
+                baseline = baseline or micros
+                self.stdout.write(f"{size:>6} {name:<28} {micros:>12.1f} {baseline / micros:>7.1f}x")
+
+    def compare_process(self, repeat):
+        patient = Patient.objects.first()
+        metrics = PatientMetrics(patient=patient, weight_value=70, weight_unit='kg', height_value=175, height_unit='cm')
+        metrics.results = concentration_series({"value": 70, "unit": "kg"}, {"value": 175, "unit": "cm"})
+        metrics.save()
+
+        expected = JSONRenderer().render(metrics_payload(metrics))
+        self.stdout.write(f"{'':>6} {'process payload':<28} {'us/response':>12} {'speedup':>8}")
+        baseline = None
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            assert renderer.render(metrics_payload(metrics)) == expected, f"{name} output differs"
+            micros = self.time(lambda: renderer.render(metrics_payload(metrics)), repeat)
+            baseline = baseline or micros
+            self.stdout.write(f"{'':>6} {name:<28} {micros:>12.1f} {baseline / micros:>7.1f}x")
+
+    @staticmethod
+    def time(fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat * 1e6
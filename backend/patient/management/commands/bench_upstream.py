@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from patient import upstream
+from patient.bench import latency_summary
+from patient.stub_upstream import StubUpstreamServer
+
+PAYLOAD = {
+    "weight": {"value": 70, "unit": "kg"},
+    "height": {"value": 175, "unit": "cm"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the pooled upstream client against a fresh connection per call, "
+        "using the local stub server (no network needed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--delay', type=float, default=0.005, help="Stub time per request")
+        parser.add_argument('--connect-delay', type=float, default=0.05, help="Stub time per new connection (handshake)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'client':<8} {'mean_ms':>9} {'p50_ms':>9} {'p95_ms':>9} {'conns':>6}")
+        for name in ('fresh', 'pooled'):
+            with StubUpstreamServer(delay=options['delay'], connect_delay=options['connect_delay']) as server:
+                with override_settings(PATIENT_PROCESS_API_URL=server.url_template):
+                    upstream.reset_session()
+                    call = self.fresh_call if name == 'fresh' else self.pooled_call
+                    latencies = self.run(call, options['requests'], options['concurrency'])
+                    summary = latency_summary(latencies)
+                    self.stdout.write(
+                        f"{name:<8} {summary['mean_ms']:>9.2f} {summary['p50_ms']:>9.2f} "
+                        f"{summary['p95_ms']:>9.2f} {server.connections:>6}"
+                    )
+                    if name == 'pooled':
+                        self.stdout.write(f"pool stats: {upstream.pool_stats()}")
+                    upstream.reset_session()
+
+    def run(self, call, count, concurrency):
+        def timed(pk):
+            started = time.perf_counter()
+            call(pk)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(timed, range(1, count + 1)))
+
+    def fresh_call(self, pk):
+        # What ProcessPatientView used to do: module-level requests.post per call
+        resp = requests.post(upstream.process_url(pk), json=PAYLOAD, timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+
+    def pooled_call(self, pk):
+        return upstream.post_process(pk, PAYLOAD)
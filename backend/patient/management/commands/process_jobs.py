@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patient.jobs import requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued process jobs from the database (once, or forever with --loop)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new jobs")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls with --loop")
+        parser.add_argument('--limit', type=int, default=None, help="Max jobs per poll")
+        parser.add_argument(
+            '--stale-after', type=int, default=300,
+            help="Requeue jobs running for longer than this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale(options['stale_after'])
+            done = run_pending(options['limit'])
+            if requeued or done:
+                self.stdout.write(f"requeued {requeued}, ran {done} job(s)")
+            if not options['loop']:
+                break
+            if not done:
+                time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from patient.stub_upstream import StubUpstreamServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the external process API. "
+        "Point PATIENT_PROCESS_API_URL at the printed URL to work offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8787)
+        parser.add_argument('--delay', type=float, default=0.0, help="Seconds added to every request")
+        parser.add_argument('--connect-delay', type=float, default=0.0, help="Seconds added to every new connection")
+        parser.add_argument('--fail-status', type=int, default=None, help="Answer every request with this status")
+
+    def handle(self, *args, **options):
+        server = StubUpstreamServer(
+            host=options['host'],
+            port=options['port'],
+            delay=options['delay'],
+            connect_delay=options['connect_delay'],
+            fail_status=options['fail_status'],
+        )
+        self.stdout.write(f"PATIENT_PROCESS_API_URL={server.url_template}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,124 @@
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from patient.batch import process_batch
+from patient.models import Patient, PatientMetrics
+from patient.processing import request_key
+from patient.surrogate import get_table
+from patient.throttling import wait_for_budget
+
+
+def parse_values(spec):
+    """
+    "start:stop:step" (stop included) or "v1,v2,..." as floats
+    """
+    try:
+        if ':' in spec:
+            start, stop, step = (Decimal(part) for part in spec.split(':'))
+            if step <= 0 or stop < start:
+                raise ValueError
+            count = int((stop - start) / step) + 1
+            return [float(start + step * index) for index in range(count)]
+        return [float(Decimal(part)) for part in spec.split(',')]
+    except (InvalidOperation, ValueError):
+        raise CommandError(f"Expected start:stop:step or a comma-separated list, got {spec!r}")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Store PatientMetrics ahead of time so process requests hit: a weight/height grid, "
+        "and/or every combination already stored, for the given patients (default: all). "
+        "Combinations already stored are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', help="Weights, start:stop:step or v1,v2,... (e.g. 40:120:5)")
+        parser.add_argument('--heights', help="Heights, start:stop:step or v1,v2,... (e.g. 1.5:2:0.05)")
+        parser.add_argument('--weight-unit', default='kg')
+        parser.add_argument('--height-unit', default='m')
+        parser.add_argument(
+            '--observed', action='store_true',
+            help="Also warm every weight/height some patient was already processed with"
+        )
+        parser.add_argument('--patients', type=int, nargs='+', help="Patient ids (default: every patient)")
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help="Concurrent external API calls (default PATIENT_PROCESS_BATCH_CONCURRENCY)"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only count the requests")
+
+    def handle(self, *args, **options):
+        combinations = self.combinations(options)
+        if not combinations:
+            raise CommandError("Nothing to warm: pass --weights and --heights, and/or --observed")
+
+        patients = Patient.objects.order_by('id').values_list('id', flat=True)
+        if options['patients']:
+            patients = patients.filter(id__in=options['patients'])
+        patient_ids = list(patients)
+        total = len(patient_ids) * len(combinations)
+        self.stdout.write(
+            f"{len(combinations)} weight/height combination(s) x {len(patient_ids)} patient(s) = {total} request(s)"
+        )
+        if options['dry_run'] or not total:
+            return
+
+        items = (
+            {"patient_id": patient_id, "weight": weight, "height": height}
+            for patient_id in patient_ids
+            for weight, height in combinations
+        )
+        sources, errors, done = Counter(), Counter(), 0
+        for chunk in chunked(items, settings.PATIENT_PROCESS_BATCH_MAX_ITEMS):
+            # Calls take their turn in PATIENT_PROCESS_GLOBAL_THROTTLE instead of failing
+            with wait_for_budget():
+                reports = process_batch(chunk, options['concurrency'])
+            for report in reports:
+                if report['success']:
+                    sources[report['source']] += 1
+                else:
+                    errors[report['error']] += 1
+            done += len(chunk)
+            self.stdout.write(
+                f"{done}/{total}: {sources['processed']} fetched, {sources['cached']} already stored, "
+                f"{sum(errors.values())} failed"
+            )
+
+        for error, count in errors.most_common():
+            self.stderr.write(f"{count} x {error}")
+        if settings.PATIENT_SURROGATE_ENABLED:
+            self.stdout.write(f"surrogate table: {len(get_table())} weight/height point(s)")
+
+    def combinations(self, options):
+        combinations = {}
+        if options['weights'] or options['heights']:
+            if not (options['weights'] and options['heights']):
+                raise CommandError("--weights and --heights go together")
+            for weight in parse_values(options['weights']):
+                for height in parse_values(options['heights']):
+                    self.add(combinations, weight, options['weight_unit'], height, options['height_unit'])
+        if options['observed']:
+            observed = PatientMetrics.objects.values_list(
+                'weight_value', 'weight_unit', 'height_value', 'height_unit'
+            ).distinct()
+            for weight_value, weight_unit, height_value, height_unit in observed.iterator():
+                if weight_value is not None and height_value is not None:
+                    self.add(combinations, weight_value, weight_unit, height_value, height_unit)
+        return list(combinations.values())
+
+    @staticmethod
+    def add(combinations, weight_value, weight_unit, height_value, height_unit):
+        # One request per combination once rounded/unit-converted like a metric key
+        weight = {"value": weight_value, "unit": weight_unit}
+        height = {"value": height_value, "unit": height_unit}
+        combinations.setdefault(request_key(weight, height), (weight, height))
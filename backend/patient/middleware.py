@@ -0,0 +1,244 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import routers, telemetry
+
+# QueryTimer of the request being served. A ContextVar follows the request into the
+# threads sync_to_async runs the ORM in, which a per-connection execute_wrapper doesn't.
+_request_timer = ContextVar('patient_request_timer', default=None)
+
+
+class QueryTimer:
+    """
+    Statements run for one request and the time spent in them
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    execute_wrapper installed on every connection, charges the current request's QueryTimer
+    """
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.seconds += time.perf_counter() - started
+        timer.count += 1
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def on_connection_created(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+# Connections are per thread, and under ASGI the ORM runs on other threads than the
+# event loop: each is timed from its creation. PatientConfig.ready imports this module
+# so that happens before any connection is opened.
+connection_created.connect(on_connection_created, dispatch_uid='patient.middleware.time_query')
+
+
+class InstrumentationMiddleware:
+    """
+    Latency, DB query count and DB time per patient API route (see telemetry.py).
+    Streaming responses are measured to their last byte, with the queries run while
+    streaming. Works sync and async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.PATIENT_TELEMETRY_ENABLED:
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        token = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        if response.streaming and self.route(request) is not None:
+            self.time_stream(request, response, started, timer)
+            return response
+        self.record(request, response, time.perf_counter() - started, timer)
+        telemetry.flush()
+        return response
+
+    async def __acall__(self, request):
+        if not settings.PATIENT_TELEMETRY_ENABLED:
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        token = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        if response.streaming and self.route(request) is not None:
+            self.time_stream(request, response, started, timer)
+            return response
+        self.record(request, response, time.perf_counter() - started, timer)
+        await aflush()
+        return response
+
+    def time_stream(self, request, response, started, timer):
+        """
+        Wrap the streaming content: its chunks are made with the request's timer
+        current, the request is recorded once the stream ends or is closed
+        """
+        content = response.streaming_content
+
+        if response.is_async:
+            async def stream():
+                try:
+                    while True:
+                        token = _request_timer.set(timer)
+                        try:
+                            chunk = await anext(content)
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            _request_timer.reset(token)
+                        yield chunk
+                finally:
+                    self.record(request, response, time.perf_counter() - started, timer)
+                    await aflush()
+        else:
+            def stream():
+                try:
+                    while True:
+                        token = _request_timer.set(timer)
+                        try:
+                            chunk = next(content)
+                        except StopIteration:
+                            return
+                        finally:
+                            _request_timer.reset(token)
+                        yield chunk
+                finally:
+                    self.record(request, response, time.perf_counter() - started, timer)
+                    telemetry.flush()
+
+        response.streaming_content = stream()
+
+    @staticmethod
+    def route(request):
+        """
+        URL pattern of the patient API view that served the request, None otherwise
+        """
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.func.__module__.startswith('patient.'):
+            return match.route
+        return None
+
+    def record(self, request, response, elapsed, timer):
+        route = self.route(request)
+        if route is not None:
+            telemetry.observe(
+                'patient_http_request_duration_seconds', elapsed,
+                route=route, method=request.method, status=str(response.status_code),
+            )
+            telemetry.observe('patient_db_queries_per_request', timer.count, route=route)
+            telemetry.observe('patient_db_query_duration_seconds', timer.seconds, route=route)
+
+
+async def aflush():
+    """
+    telemetry.flush off the event loop, when one is due (it writes a file)
+    """
+    if telemetry.flush_due():
+        await sync_to_async(telemetry.flush, thread_sensitive=False)()
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes with read replicas (see routers.py): a successful write request
+    gets a cookie keeping the client's reads on the primary for PATIENT_REPLICA_PIN_SECONDS.
+    Does nothing without replicas. Works sync and async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.PATIENT_READ_REPLICAS:
+            return self.get_response(request)
+
+        with routers.primary_pin(routers.PIN_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if not settings.PATIENT_READ_REPLICAS:
+            return await self.get_response(request)
+
+        with routers.primary_pin(routers.PIN_COOKIE in request.COOKIES):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                routers.PIN_COOKIE, '1', max_age=settings.PATIENT_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs async. Stock WhiteNoise is sync-only, which under ASGI
+    puts every request on a thread for the rest of the middleware chain and the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
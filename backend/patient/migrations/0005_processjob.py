@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0004_alter_patientmetrics_patient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight_value', models.FloatField()),
+                ('weight_unit', models.CharField(default='kg', max_length=10)),
+                ('height_value', models.FloatField()),
+                ('height_unit', models.CharField(default='m', max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('error_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('metrics', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='patient.patientmetrics')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='process_jobs', to='patient.patient')),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:17
+
+from django.db import migrations, models
+
+
+def check_constraints_now(schema_editor):
+    """
+    Run the foreign key checks Postgres deferred for the rows just changed: it
+    refuses to ALTER TABLE later in the same transaction while they are pending
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+def remove_duplicate_metrics(apps, schema_editor):
+    """
+    Keep the oldest row of each duplicated request, point jobs at it, drop the rest
+    """
+    PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+    ProcessJob = apps.get_model('patient', 'ProcessJob')
+    key_fields = ('patient_id', 'weight_value', 'weight_unit', 'height_value', 'height_unit')
+
+    kept = {}
+    duplicates = {}
+    rows = PatientMetrics.objects.order_by('id').values_list('id', *key_fields)
+    for row in rows.iterator():
+        metrics_id, key = row[0], row[1:]
+        if key in kept:
+            duplicates[metrics_id] = kept[key]
+        else:
+            kept[key] = metrics_id
+
+    for duplicate_id, kept_id in duplicates.items():
+        ProcessJob.objects.filter(metrics_id=duplicate_id).update(metrics_id=kept_id)
+    ids = list(duplicates)
+    for start in range(0, len(ids), 500):
+        PatientMetrics.objects.filter(id__in=ids[start:start + 500]).delete()
+    check_constraints_now(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0005_processjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_metrics, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='patientmetrics',
+            constraint=models.UniqueConstraint(fields=('patient', 'weight_value', 'weight_unit', 'height_value', 'height_unit'), name='unique_patient_metrics_request'),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of patient/units.py as of this migration, so later changes to the live key
+# don't change what it backfills. The precision stays the deployment's setting: the keys
+# must match what lookups compute.
+WEIGHT_TO_KG = {
+    'kg': 1.0,
+    'g': 0.001,
+    'mg': 0.000001,
+    'lb': 0.45359237,
+    'lbs': 0.45359237,
+    'oz': 0.028349523125,
+    'st': 6.35029318,
+}
+HEIGHT_TO_M = {
+    'm': 1.0,
+    'cm': 0.01,
+    'mm': 0.001,
+    'in': 0.0254,
+    'ft': 0.3048,
+}
+
+
+def key_part(value, unit, factors, si_unit, precision):
+    factor = factors.get(str(unit).strip().lower())
+    if factor is None or value is None:
+        return f"{value}{unit}"
+    return f"{float(value) * factor:.{precision}f}{si_unit}"
+
+
+def metric_key(weight_value, weight_unit, height_value, height_unit):
+    precision = settings.PATIENT_METRICS_KEY_PRECISION
+    return "|".join([
+        key_part(weight_value, weight_unit, WEIGHT_TO_KG, 'kg', precision),
+        key_part(height_value, height_unit, HEIGHT_TO_M, 'm', precision),
+    ])
+
+
+def check_constraints_now(schema_editor):
+    """
+    Pending deferred foreign key checks block the constraint changes below (see 0006)
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+def backfill_metric_key(apps, schema_editor):
+    """
+    Fill metric_key for existing rows. Rows that now normalize to the same
+    key (70 kg vs 154.32 lb) are merged: the oldest is kept, jobs point at it.
+    """
+    PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+    ProcessJob = apps.get_model('patient', 'ProcessJob')
+
+    kept = {}
+    duplicates = {}
+    rows = PatientMetrics.objects.order_by('id').values_list(
+        'id', 'patient_id', 'weight_value', 'weight_unit', 'height_value', 'height_unit'
+    )
+    for metrics_id, patient_id, *values in rows.iterator():
+        key = (patient_id, metric_key(*values))
+        if key in kept:
+            duplicates[metrics_id] = kept[key]
+        else:
+            kept[key] = metrics_id
+
+    for duplicate_id, kept_id in duplicates.items():
+        ProcessJob.objects.filter(metrics_id=duplicate_id).update(metrics_id=kept_id)
+    ids = list(duplicates)
+    for start in range(0, len(ids), 500):
+        PatientMetrics.objects.filter(id__in=ids[start:start + 500]).delete()
+    check_constraints_now(schema_editor)
+
+    PatientMetrics.objects.bulk_update(
+        [PatientMetrics(id=metrics_id, metric_key=key) for (_, key), metrics_id in kept.items()],
+        ['metric_key'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0006_unique_patient_metrics_request'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientmetrics',
+            name='metric_key',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_metric_key, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='patientmetrics',
+            name='unique_patient_metrics_request',
+        ),
+        migrations.AddConstraint(
+            model_name='patientmetrics',
+            constraint=models.UniqueConstraint(fields=('patient', 'metric_key'), name='unique_patient_metric_key'),
+        ),
+    ]
@@ -0,0 +1,151 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:45
+
+import struct
+import sys
+from array import array
+
+from django.db import migrations, models
+
+# Frozen copy of patient/series.py at format version 1, the layout this migration
+# writes and reads back, whatever the app's packing becomes later
+VERSION = 1
+HEADER = struct.Struct('<BBBI')
+RANGE = struct.Struct('<qq')
+RANGE_CODE = 'R'
+INT_CODES = ('b', 'h', 'i', 'q')
+INT_LIMITS = {code: 2 ** (array(code).itemsize * 8 - 1) for code in INT_CODES}
+
+
+def column_code(values):
+    if all(type(v) is int for v in values):
+        for code in INT_CODES:
+            if all(-INT_LIMITS[code] <= v < INT_LIMITS[code] for v in values):
+                return code
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            raise ValueError("results must be [number, number] pairs")
+    return 'd'
+
+
+def to_bytes(code, values):
+    column = array(code, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def from_bytes(code, buffer, offset, count):
+    column = array(code)
+    end = offset + column.itemsize * count
+    column.frombytes(buffer[offset:end])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column, end
+
+
+def pack_results(results):
+    """
+    Pack a [[duration, concentration], ...] list. Raises ValueError on anything else.
+    """
+    if results is None:
+        return None
+    try:
+        durations = [row[0] for row in results]
+        concentrations = [row[1] for row in results]
+    except (TypeError, IndexError, KeyError):
+        raise ValueError("results must be [number, number] pairs")
+    count = len(durations)
+
+    duration_code = column_code(durations)
+    concentration_code = column_code(concentrations)
+    if duration_code != 'd' and count > 1:
+        step = durations[1] - durations[0]
+        if step and all(durations[i] == durations[0] + i * step for i in range(count)):
+            duration_code = RANGE_CODE
+
+    if duration_code == RANGE_CODE:
+        duration_bytes = RANGE.pack(durations[0], step)
+    else:
+        duration_bytes = to_bytes(duration_code, durations)
+
+    return b''.join([
+        HEADER.pack(VERSION, ord(duration_code), ord(concentration_code), count),
+        duration_bytes,
+        to_bytes(concentration_code, concentrations),
+    ])
+
+
+def unpack_pairs(packed):
+    """
+    The [[duration, concentration], ...] list back from pack_results, None for None
+    """
+    if packed is None:
+        return None
+    buffer = bytes(packed)
+    version, duration_code, concentration_code, count = HEADER.unpack_from(buffer)
+    if version != VERSION:
+        raise ValueError(f"Unknown results format version {version}")
+    offset = HEADER.size
+    duration_code, concentration_code = chr(duration_code), chr(concentration_code)
+
+    if duration_code == RANGE_CODE:
+        start, step = RANGE.unpack_from(buffer, offset)
+        durations = range(start, start + step * count, step)
+        offset += RANGE.size
+    else:
+        durations, offset = from_bytes(duration_code, buffer, offset, count)
+    concentrations, _ = from_bytes(concentration_code, buffer, offset, count)
+    return [[d, c] for d, c in zip(durations, concentrations.tolist())]
+
+
+def pack_existing_results(apps, schema_editor):
+    PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+    batch, invalid = [], []
+    for metrics in PatientMetrics.objects.only('id', 'results').iterator(chunk_size=500):
+        try:
+            metrics.results_packed = pack_results(metrics.results)
+        except ValueError:
+            invalid.append(metrics.id)
+            continue
+        batch.append(metrics)
+        if len(batch) >= 500:
+            PatientMetrics.objects.bulk_update(batch, ['results_packed'])
+            batch = []
+    if invalid:
+        # The JSON column is dropped next, don't lose these silently
+        raise ValueError(f"PatientMetrics rows with non-numeric results, fix them first: {invalid}")
+    if batch:
+        PatientMetrics.objects.bulk_update(batch, ['results_packed'])
+
+
+def unpack_to_json(apps, schema_editor):
+    PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+    batch = []
+    for metrics in PatientMetrics.objects.only('id', 'results_packed').iterator(chunk_size=500):
+        metrics.results = unpack_pairs(metrics.results_packed)
+        batch.append(metrics)
+        if len(batch) >= 500:
+            PatientMetrics.objects.bulk_update(batch, ['results'])
+            batch = []
+    if batch:
+        PatientMetrics.objects.bulk_update(batch, ['results'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0007_patientmetrics_metric_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientmetrics',
+            name='results_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_existing_results, unpack_to_json),
+        migrations.RemoveField(
+            model_name='patientmetrics',
+            name='results',
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:27
+
+import logging
+
+from django.db import DatabaseError, migrations, models, transaction
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = {
+    'patient_last_name_trgm_idx': 'last_name',
+    'patient_first_name_trgm_idx': 'first_name',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Postgres only: GIN trigram indexes on UPPER(name), the expression Django's
+    istartswith compares, so name prefix search doesn't scan the table.
+    Skipped (name search still works, unindexed) elsewhere or without pg_trgm.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('patient', 'Patient')._meta.db_table)
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError as e:
+        logger.warning("pg_trgm unavailable, skipping trigram indexes: %s", e)
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {schema_editor.quote_name(name)} ON {table} "
+            f"USING gin ((UPPER({schema_editor.quote_name(column)}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0008_patientmetrics_results_packed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'first_name'], name='patient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['dob'], name='patient_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patient_created_at_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:30
+
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    Patient = apps.get_model('patient', 'Patient')
+    Patient.objects.using(schema_editor.connection.alias).update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    # Was 0010_patient_natural_key: databases that applied it under that name keep it applied
+    replaces = [('patient', '0010_patient_natural_key')]
+
+    dependencies = [
+        ('patient', '0009_patient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0010_patient_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('tat', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,9 @@
 # patient/models.py
 from django.db import models
+from django.utils.functional import cached_property
+
+from .series import pack_results, unpack_results
+from .units import metric_key
 
 class Patient(models.Model):
     first_name = models.CharField(max_length=100)
@@ -9,6 +13,16 @@ class Patient(models.Model):
     sex = models.CharField(max_length=10, choices=sex_choices)
     ethnic_background = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
+    # changes when an upsert overwrites the patient, what ETag/Last-Modified are based on
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Postgres also gets trigram indexes for name search, see migration 0009
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='patient_name_idx'),
+            models.Index(fields=['dob'], name='patient_dob_idx'),
+            models.Index(fields=['created_at'], name='patient_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -20,5 +34,70 @@ class PatientMetrics(models.Model):
     weight_unit = models.CharField(max_length=10, default='kg')
     height_value = models.FloatField(blank=True, null=True)
     height_unit = models.CharField(max_length=10, default='m')
-    results = models.JSONField(blank=True, null=True)  # store the array from API as-is
+    # the API's [[duration_30_m, concentration], ...] array, packed column-wise (see series.py)
+    results_packed = models.BinaryField(blank=True, null=True)
     processed_at = models.DateTimeField(auto_now_add=True)
+    # weight|height in SI units, rounded; what cache lookups match on (see units.metric_key)
+    metric_key = models.CharField(max_length=64, editable=False)
+
+    class Meta:
+        constraints = [
+            # One row per distinct process request, see processing.fetch_metrics
+            models.UniqueConstraint(fields=['patient', 'metric_key'], name='unique_patient_metric_key'),
+        ]
+
+    @cached_property
+    def series(self):
+        """
+        Decoded ResultSeries, None when there are no results
+        """
+        return unpack_results(self.results_packed)
+
+    @property
+    def results(self):
+        series = self.series
+        return series.pairs() if series is not None else None
+
+    @results.setter
+    def results(self, value):
+        self.results_packed = pack_results(value)
+        self.__dict__.pop('series', None)
+
+    def build_metric_key(self):
+        return metric_key(self.weight_value, self.weight_unit, self.height_value, self.height_unit)
+
+    def save(self, *args, **kwargs):
+        self.metric_key = self.build_metric_key()
+        super().save(*args, **kwargs)
+
+
+class ProcessJob(models.Model):
+    """
+    Queued call to the external process API, run by the in-process worker pool
+    or by `manage.py process_jobs`
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    status_choices = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='process_jobs')
+    weight_value = models.FloatField()
+    weight_unit = models.CharField(max_length=10, default='kg')
+    height_value = models.FloatField()
+    height_unit = models.CharField(max_length=10, default='m')
+    status = models.CharField(max_length=10, choices=status_choices, default=QUEUED, db_index=True)
+    metrics = models.ForeignKey('PatientMetrics', on_delete=models.SET_NULL, blank=True, null=True, related_name='jobs')
+    error = models.TextField(blank=True, default='')
+    error_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+
+class ThrottleBucket(models.Model):
+    """
+    GCRA throttle state for PATIENT_THROTTLE_BACKEND=db: one row per throttled key
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    # theoretical arrival time, microseconds since the epoch (see throttling.py)
+    tat = models.BigIntegerField()
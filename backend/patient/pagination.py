@@ -0,0 +1,31 @@
+import base64
+import binascii
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id):
+    """
+    Build an opaque cursor token pointing just after the given patient id
+    """
+    raw = json.dumps({"id": last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Return the patient id a cursor points after, or None for the first page
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        last_id = int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if last_id < 0:
+        raise InvalidCursor("Invalid cursor")
+    return last_id
@@ -0,0 +1,82 @@
+"""
+Patient payloads built straight from rows, what PatientSerializer returns
+without its per-field machinery.
+"""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import PatientMetrics
+from .series import unpack_results
+
+PATIENT_FIELDS = ('id', 'first_name', 'last_name', 'dob', 'sex', 'ethnic_background')
+LATEST_METRICS_FIELDS = (
+    'patient_id', 'id', 'weight_value', 'weight_unit', 'height_value', 'height_unit',
+    'processed_at', 'results_packed',
+)
+
+
+def patient_rows(queryset):
+    """
+    [(payload, updated_at), ...] from one values_list() query; updated_at feeds the cache validators
+    """
+    return [
+        (dict(zip(PATIENT_FIELDS, row)), row[-1])
+        for row in queryset.values_list(*PATIENT_FIELDS, 'updated_at')
+    ]
+
+
+def patient_payload(patient):
+    return {field: getattr(patient, field) for field in PATIENT_FIELDS}
+
+
+async def apatient_rows(queryset):
+    """
+    patient_rows with async iteration, for the async views
+    """
+    return [
+        (dict(zip(PATIENT_FIELDS, row)), row[-1])
+        async for row in queryset.values_list(*PATIENT_FIELDS, 'updated_at')
+    ]
+
+
+def latest_metrics_queryset(patient_ids):
+    """
+    Each patient's most recent PatientMetrics as rows: ROW_NUMBER() over the patient's
+    metrics, newest first, keeping the first. One query however many patients.
+    """
+    return PatientMetrics.objects.filter(patient_id__in=patient_ids).annotate(
+        recency=Window(
+            RowNumber(),
+            partition_by=F('patient_id'),
+            order_by=[F('processed_at').desc(), F('id').desc()],
+        )
+    ).filter(recency=1).values_list(*LATEST_METRICS_FIELDS)
+
+
+def latest_metrics_payload(row):
+    patient_id, metrics_id, weight_value, weight_unit, height_value, height_unit, processed_at, packed = row
+    series = unpack_results(packed)
+    peak = series.peak() if series is not None else None
+    return {
+        "id": metrics_id,
+        "weight": {"value": weight_value, "unit": weight_unit},
+        "height": {"value": height_value, "unit": height_unit},
+        "processed_at": processed_at,
+        "points": len(series) if series is not None else 0,
+        "peak": {"duration_30_m": peak[0], "concentration": peak[1]} if peak else None,
+    }
+
+
+def latest_metrics(patient_ids):
+    """
+    {patient_id: latest metrics payload}; patients without metrics are left out
+    """
+    if not patient_ids:
+        return {}
+    return {row[0]: latest_metrics_payload(row) for row in latest_metrics_queryset(patient_ids)}
+
+
+async def alatest_metrics(patient_ids):
+    if not patient_ids:
+        return {}
+    return {row[0]: latest_metrics_payload(row) async for row in latest_metrics_queryset(patient_ids)}
@@ -0,0 +1,214 @@
+import math
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from requests.exceptions import RequestException
+from rest_framework import status
+
+from .models import PatientMetrics
+from .series import pack_results
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .units import metric_key
+from . import breaker, throttling, upstream
+
+# Identical process requests in this worker share one upstream call
+_inflight = SingleFlight()
+_ainflight = AsyncSingleFlight()
+
+
+class ProcessingError(Exception):
+    """
+    Upstream or storage failure, carries the HTTP status the API answers with
+    (and the seconds for Retry-After, when known)
+    """
+
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def budget_error(e):
+    return ProcessingError(
+        f"External API {str(e)}", status.HTTP_429_TOO_MANY_REQUESTS, retry_after=math.ceil(e.retry_after)
+    )
+
+
+def circuit_error(e):
+    # Retry once the breaker lets a probe through, at least a second from now
+    return ProcessingError(
+        f"External API unavailable: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE,
+        retry_after=max(math.ceil(e.retry_after), 1)
+    )
+
+
+def request_key(weight, height):
+    return metric_key(weight['value'], weight['unit'], height['value'], height['unit'])
+
+
+def find_metrics(patient, weight, height):
+    """
+    Stored metrics for the same weight/height once unit-converted and rounded, or None.
+    One probe of the (patient, metric_key) unique index.
+    """
+    return PatientMetrics.objects.filter(
+        patient=patient,
+        metric_key=request_key(weight, height)
+    ).first()
+
+
+def upstream_payload(weight, height):
+    return {
+        "weight": {"value": weight['value'], "unit": weight['unit']},
+        "height": {"value": height['value'], "unit": height['unit']}
+    }
+
+
+def call_upstream(pk, weight, height):
+    """
+    Call the external API and return the PatientMetrics fields from its answer.
+    Raises ProcessingError.
+    """
+    try:
+        # Pooled keep-alive session, raises for HTTP errors and bad JSON
+        data = upstream.post_process(pk, upstream_payload(weight, height))
+    except throttling.BudgetExhausted as e:
+        raise budget_error(e)
+    except breaker.CircuitOpen as e:
+        raise circuit_error(e)
+    except RequestException as e:
+        raise ProcessingError(f"External API request failed: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE)
+    except ValueError:  # JSON decode error
+        raise ProcessingError("Invalid JSON returned from external API", status.HTTP_502_BAD_GATEWAY)
+    return metrics_fields(data)
+
+
+async def acall_upstream(pk, weight, height):
+    """
+    call_upstream on the event loop's AsyncClient. Raises ProcessingError.
+    """
+    try:
+        data = await upstream.apost_process(pk, upstream_payload(weight, height))
+    except throttling.BudgetExhausted as e:
+        raise budget_error(e)
+    except breaker.CircuitOpen as e:
+        raise circuit_error(e)
+    except httpx.HTTPError as e:
+        # httpx appends a documentation link on a second line; some errors have no message
+        message = str(e).split('\n')[0] or type(e).__name__
+        raise ProcessingError(f"External API request failed: {message}", status.HTTP_503_SERVICE_UNAVAILABLE)
+    except ValueError:  # JSON decode error
+        raise ProcessingError("Invalid JSON returned from external API", status.HTTP_502_BAD_GATEWAY)
+    return metrics_fields(data)
+
+
+def metrics_fields(data):
+    """
+    PatientMetrics fields from the external API's answer. Raises ProcessingError.
+    """
+    # Validate keys exist in the response
+    try:
+        patient_data = data["patient"]
+        weight_data = patient_data["weight"]
+        height_data = patient_data["height"]
+        fields = {
+            "weight_value": weight_data["value"],
+            "weight_unit": weight_data["unit"],
+            "height_value": height_data["value"],
+            "height_unit": height_data["unit"],
+        }
+    except KeyError as e:
+        raise ProcessingError(f"Missing expected key in API response: {str(e)}", status.HTTP_502_BAD_GATEWAY)
+
+    try:
+        fields["results_packed"] = pack_results(data.get("results", []))
+    except ValueError as e:
+        raise ProcessingError(f"Invalid results in API response: {str(e)}", status.HTTP_502_BAD_GATEWAY)
+    return fields
+
+
+def fetch_metrics(patient, weight, height):
+    """
+    Call the external API and store what it returns. Raises ProcessingError.
+    """
+    return store_metrics(patient, weight, height, call_upstream(patient.pk, weight, height))
+
+
+def store_metrics(patient, weight, height, fields):
+    """
+    Save the external API's answer. Raises ProcessingError.
+    Stored under the requested weight/height, so the unique constraint catches
+    another worker that saved the same request first.
+    """
+    fields.update(
+        weight_value=weight['value'],
+        weight_unit=weight['unit'],
+        height_value=height['value'],
+        height_unit=height['unit'],
+    )
+
+    # Save to DB
+    try:
+        with transaction.atomic():
+            return PatientMetrics.objects.create(patient=patient, **fields)
+    except IntegrityError:
+        # Lost the race to another worker, use its row
+        metrics = find_metrics(patient, weight, height)
+        if metrics:
+            return metrics
+        raise ProcessingError("Failed to save metrics: conflicting row vanished", status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        raise ProcessingError(f"Failed to save metrics: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def get_or_fetch_metrics(patient, weight, height):
+    """
+    Stored metrics, or a single upstream call + insert shared by every
+    concurrent identical request in this worker. Raises ProcessingError.
+    """
+    key = (patient.pk, request_key(weight, height))
+    return _inflight.do(
+        key,
+        lambda: find_metrics(patient, weight, height) or fetch_metrics(patient, weight, height)
+    )
+
+
+async def afind_metrics(patient, weight, height):
+    return await PatientMetrics.objects.filter(
+        patient=patient,
+        metric_key=request_key(weight, height)
+    ).afirst()
+
+
+async def afetch_metrics(patient, weight, height):
+    fields = await acall_upstream(patient.pk, weight, height)
+    return await sync_to_async(store_metrics)(patient, weight, height, fields)
+
+
+async def aget_or_fetch_metrics(patient, weight, height):
+    """
+    get_or_fetch_metrics for the async views: the upstream call awaits on the
+    event loop instead of holding a thread, identical requests on the loop share it
+    """
+    key = (patient.pk, request_key(weight, height))
+
+    async def load():
+        return await afind_metrics(patient, weight, height) or await afetch_metrics(patient, weight, height)
+
+    return await _ainflight.do(key, load)
+
+
+def metrics_payload(metrics):
+    """
+    Response body shared by the process endpoints
+    """
+    return {
+        "success": True,
+        "patient": {
+            "weight": {"value": metrics.weight_value, "unit": metrics.weight_unit},
+            "height": {"value": metrics.height_value, "unit": metrics.height_unit}
+        },
+        # Built straight from the packed columns
+        "results": metrics.series.as_points() if metrics.series is not None else []
+    }
@@ -0,0 +1,91 @@
+"""
+Read replicas for the patient read endpoints. A router only sees the model being
+queried, so the views opt in: patient queries inside `replica_reads()` (list and detail
+GETs, the stored metrics lookup of the process endpoints) go to one of
+PATIENT_READ_REPLICAS, everything else and every write to `default`.
+
+Read-your-writes: a successful write request gets a cookie that keeps the client on the
+primary for PATIENT_REPLICA_PIN_SECONDS (ReplicaPinningMiddleware), longer than the
+replicas are expected to lag. Cached responses built from a replica are marked so a
+pinned client doesn't get them either (see caches.py).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'patient_primary'
+
+# Replica the current request reads from, pinned to the primary or not. ContextVars
+# follow the request into sync_to_async threads and the async ORM.
+_replica = ContextVar('patient_read_replica', default=None)
+_pinned = ContextVar('patient_primary_pinned', default=False)
+
+
+def current_replica():
+    """
+    Alias the patient reads of this request go to, None on the primary
+    """
+    return _replica.get()
+
+
+def pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def replica_reads():
+    """
+    Send the patient queries run inside to a replica, unless the client is pinned
+    """
+    alias = None
+    if settings.PATIENT_READ_REPLICAS and not _pinned.get():
+        # One replica for the whole request, so a page and its count agree
+        alias = random.choice(settings.PATIENT_READ_REPLICAS)
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def primary_pin(active):
+    token = _pinned.set(active)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReadReplicaRouter:
+    """
+    Installed when DATABASE_REPLICA_URLS is set. Models of other apps (cache table,
+    sessions, auth) keep Django's default routing.
+    """
+    app_label = 'patient'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        # Also for instances loaded from a replica, which Django would save back there
+        return DEFAULT_DB_ALIAS
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema from the primary (a copy of it locally)
+        if app_label == self.app_label and db in settings.PATIENT_READ_REPLICAS:
+            return False
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.PATIENT_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,35 @@
+import datetime
+import random
+
+FIRST_NAMES = [
+    'Abigail', 'Alexander', 'Amelia', 'Aria', 'Ava', 'Benjamin', 'Charlotte', 'Chloe',
+    'Daniel', 'Elijah', 'Emily', 'Ethan', 'Grace', 'Hannah', 'Henry', 'Isabella',
+    'Jack', 'James', 'Joseph', 'Liam', 'Lily', 'Lucas', 'Mia', 'Noah', 'Olivia',
+]
+LAST_NAMES = [
+    'Adams', 'Baker', 'Brown', 'Clark', 'Davis', 'Evans', 'Garcia', 'Hernandez',
+    'Johnson', 'Kim', 'Lee', 'Lopez', 'Martinez', 'Nguyen', 'Patel', 'Rivera',
+    'Rodriguez', 'Scott', 'Singh', 'Turner', 'White', 'Wilson', 'Young',
+]
+SEXES = ['male', 'female', 'other']
+ETHNIC_BACKGROUNDS = [
+    'Caucasian', 'Hispanic', 'African American', 'Asian', 'Indian', 'Korean',
+]
+
+
+def generate_patients(count, seed=0):
+    """
+    Yield seed.json-style patient dicts.
+    (first_name, last_name, dob) is unique across the generated rows.
+    """
+    rng = random.Random(seed)
+    names = len(FIRST_NAMES) * len(LAST_NAMES)
+    start = datetime.date(1940, 1, 1)
+    for i in range(count):
+        yield {
+            "first_name": FIRST_NAMES[i % len(FIRST_NAMES)],
+            "last_name": LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)],
+            "dob": (start + datetime.timedelta(days=i // names)).isoformat(),
+            "sex": rng.choice(SEXES),
+            "ethnic_background": rng.choice(ETHNIC_BACKGROUNDS),
+        }
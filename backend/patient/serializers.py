@@ -11,6 +11,26 @@ class PatientSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'dob', 'sex', 'ethnic_background']
 
 
+class PatientFilterSerializer(serializers.Serializer):
+    """
+    Query params of the patient list: name prefix, exact sex / ethnic background,
+    inclusive dob and created_at ranges
+    """
+    name = serializers.CharField(required=False, allow_blank=True, max_length=201)
+    sex = serializers.ChoiceField(choices=Patient.sex_choices, required=False)
+    ethnic_background = serializers.CharField(required=False, max_length=100)
+    dob_from = serializers.DateField(required=False)
+    dob_to = serializers.DateField(required=False)
+    created_from = serializers.DateTimeField(required=False)
+    created_to = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        for start, end in (('dob_from', 'dob_to'), ('created_from', 'created_to')):
+            if start in data and end in data and data[start] > data[end]:
+                raise serializers.ValidationError(f"{start} must not be after {end}")
+        return data
+
+
 class AddPatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
@@ -23,6 +43,21 @@ class AddPatientSerializer(serializers.ModelSerializer):
         return value
 
 
+class BulkDeletePatientsSerializer(serializers.Serializer):
+    """
+    Either a list of ids or a (non-empty) set of list filters
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = PatientFilterSerializer(required=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Send either ids or filter")
+        if 'filter' in data and not any(value not in ('', None) for value in data['filter'].values()):
+            raise serializers.ValidationError("filter must not be empty")
+        return data
+
+
 
 
 class PatientMetricsPostSerializer(serializers.ModelSerializer):
@@ -41,6 +76,9 @@ class PatientMetricsPostSerializer(serializers.ModelSerializer):
         for key in ['weight', 'height']:
             if 'value' not in data[key] or 'unit' not in data[key]:
                 raise serializers.ValidationError(f"{key} must include value and unit")
+            value = data[key]['value']
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise serializers.ValidationError(f"{key} value must be a number")
         return data
 
     def create(self, validated_data):
@@ -66,3 +104,12 @@ class PatientMetricsPostSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+
+class ProcessBatchItemSerializer(PatientMetricsPostSerializer):
+    """
+    One {patient_id, weight, height} item of a batch process request
+    """
+    patient_id = serializers.IntegerField(write_only=True)
+
+    class Meta(PatientMetricsPostSerializer.Meta):
+        fields = ['patient_id', 'weight', 'height']
@@ -0,0 +1,143 @@
+"""
+Packed storage for the external API's [[duration_30_m, concentration], ...] series.
+
+Layout (little-endian):
+    header      version (B), duration code (B), concentration code (B), count (I)
+    durations   'R' + start/step (two int64) for an evenly spaced int range,
+                otherwise an array of the code's typecode
+    concentrations  array of the code's typecode
+
+Int columns use the smallest signed int type that fits and come back as ints,
+anything else is stored as float64.
+"""
+import struct
+import sys
+from array import array
+
+VERSION = 1
+HEADER = struct.Struct('<BBBI')
+RANGE = struct.Struct('<qq')
+RANGE_CODE = 'R'
+INT_CODES = ('b', 'h', 'i', 'q')
+INT_LIMITS = {code: 2 ** (array(code).itemsize * 8 - 1) for code in INT_CODES}
+
+
+def _column_code(values):
+    if all(type(v) is int for v in values):
+        for code in INT_CODES:
+            if all(-INT_LIMITS[code] <= v < INT_LIMITS[code] for v in values):
+                return code
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            raise ValueError("results must be [number, number] pairs")
+    return 'd'
+
+
+def _to_bytes(code, values):
+    column = array(code, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_bytes(code, buffer, offset, count):
+    column = array(code)
+    end = offset + column.itemsize * count
+    column.frombytes(buffer[offset:end])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column, end
+
+
+def pack_results(results):
+    """
+    Pack a [[duration, concentration], ...] list. Raises ValueError on anything else.
+    """
+    if results is None:
+        return None
+    try:
+        durations = [row[0] for row in results]
+        concentrations = [row[1] for row in results]
+    except (TypeError, IndexError, KeyError):
+        raise ValueError("results must be [number, number] pairs")
+    count = len(durations)
+
+    duration_code = _column_code(durations)
+    concentration_code = _column_code(concentrations)
+    if duration_code != 'd' and count > 1:
+        step = durations[1] - durations[0]
+        if step and all(durations[i] == durations[0] + i * step for i in range(count)):
+            duration_code = RANGE_CODE
+
+    if duration_code == RANGE_CODE:
+        duration_bytes = RANGE.pack(durations[0], step)
+    else:
+        duration_bytes = _to_bytes(duration_code, durations)
+
+    return b''.join([
+        HEADER.pack(VERSION, ord(duration_code), ord(concentration_code), count),
+        duration_bytes,
+        _to_bytes(concentration_code, concentrations),
+    ])
+
+
+class ResultSeries:
+    """
+    Decoded view of a packed series: columns as arrays, no per-point objects until asked
+    """
+    __slots__ = ('durations', 'concentrations')
+
+    def __init__(self, durations, concentrations):
+        self.durations = durations
+        self.concentrations = concentrations
+
+    @classmethod
+    def from_bytes(cls, packed):
+        buffer = bytes(packed)
+        version, duration_code, concentration_code, count = HEADER.unpack_from(buffer)
+        if version != VERSION:
+            raise ValueError(f"Unknown results format version {version}")
+        offset = HEADER.size
+        duration_code, concentration_code = chr(duration_code), chr(concentration_code)
+
+        if duration_code == RANGE_CODE:
+            start, step = RANGE.unpack_from(buffer, offset)
+            durations = range(start, start + step * count, step)
+            offset += RANGE.size
+        else:
+            durations, offset = _from_bytes(duration_code, buffer, offset, count)
+        concentrations, _ = _from_bytes(concentration_code, buffer, offset, count)
+        return cls(durations, concentrations)
+
+    def __len__(self):
+        return len(self.concentrations)
+
+    def pairs(self):
+        """
+        The series as the external API sent it: [[duration_30_m, concentration], ...]
+        """
+        return [[d, c] for d, c in zip(self.durations, self.concentrations.tolist())]
+
+    def peak(self):
+        """
+        (duration_30_m, concentration) of the highest concentration, None for an empty series
+        """
+        if not len(self.concentrations):
+            return None
+        index = max(range(len(self.concentrations)), key=self.concentrations.__getitem__)
+        return self.durations[index], self.concentrations[index]
+
+    def as_points(self):
+        """
+        The series as the process endpoints return it
+        """
+        return [
+            {"duration_30_m": d, "concentration": c}
+            for d, c in zip(self.durations, self.concentrations.tolist())
+        ]
+
+
+def unpack_results(packed):
+    if packed is None:
+        return None
+    return ResultSeries.from_bytes(packed)
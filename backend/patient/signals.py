@@ -0,0 +1,20 @@
+"""
+Cache invalidation for Patient writes made one object at a time through the ORM: the
+API, the admin, a shell. Bulk writes send no signals, bulk.py invalidates for them.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caches import patients_written
+from .models import Patient
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, using, **kwargs):
+    # A new patient has no cached detail to drop, and the view may have just written it through
+    patients_written([] if created else [instance.pk], 1 if created else 0, using)
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, using, **kwargs):
+    patients_written([instance.pk], -1, using)
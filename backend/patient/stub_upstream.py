@@ -0,0 +1,117 @@
+"""
+Local stand-in for the external process API, for offline benchmarks and development
+"""
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROCESS_PATH = re.compile(r'^/api/patients/(\d+)/process$')
+
+TO_KG = {'kg': 1.0, 'g': 0.001, 'lb': 0.45359237, 'lbs': 0.45359237}
+TO_M = {'m': 1.0, 'cm': 0.01, 'mm': 0.001, 'in': 0.0254, 'ft': 0.3048}
+
+
+def concentration_series(weight, height, points=48):
+    """
+    One-compartment oral dose curve sampled every 30 minutes.
+    Deterministic in weight/height so repeated calls return the same series.
+    """
+    kg = float(weight['value']) * TO_KG.get(weight['unit'], 1.0)
+    m = float(height['value']) * TO_M.get(height['unit'], 1.0)
+    volume = 0.7 * kg or 1.0
+    ka = 1.2
+    ke = 0.15 + 0.05 * m
+    dose = 500.0
+    results = []
+    for step in range(1, points + 1):
+        hours = step * 0.5
+        conc = dose / volume * ka / (ka - ke) * (math.exp(-ke * hours) - math.exp(-ka * hours))
+        results.append([step, round(conc, 4)])
+    return results
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment, no Nagle/delayed-ACK stalls on keep-alive
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        super().setup()
+        # Charged once per TCP connection, stands in for the TCP+TLS handshake
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        match = PROCESS_PATH.match(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests += 1
+            number = self.server.requests
+        if not match:
+            return self.reply(404, {"error": "Not found"})
+        if self.server.fail_status and (self.server.fail_first is None or number <= self.server.fail_first):
+            return self.reply(self.server.fail_status, {"error": "Stub failure"})
+        try:
+            payload = json.loads(body)
+            weight, height = payload['weight'], payload['height']
+            results = concentration_series(weight, height)
+        except (ValueError, KeyError, TypeError):
+            return self.reply(400, {"error": "Invalid payload"})
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.reply(200, {
+            "patient": {"weight": weight, "height": height},
+            "results": results,
+        })
+
+    def reply(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubUpstreamServer(ThreadingHTTPServer):
+    """
+    Threaded stub server; use as a context manager to run it in the background.
+    delay is added to every request, connect_delay to every new connection.
+    fail_status answers every request, or only the first `fail_first` ones.
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, connect_delay=0.0, fail_status=None, fail_first=None):
+        super().__init__((host, port), StubHandler)
+        self.delay = delay
+        self.connect_delay = connect_delay
+        self.fail_status = fail_status
+        self.fail_first = fail_first
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self._thread = None
+
+    @property
+    def url_template(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/patients/{{pk}}/process"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,281 @@
+"""
+Local surrogate for the external process API: a weight/height interpolation table built
+from the stored PatientMetrics. When the API fails, or hasn't answered after
+PATIENT_SURROGATE_AFTER seconds, the process endpoints answer with an estimate marked
+"approximate" instead, as long as stored results surround the request. Nothing the
+surrogate answers is stored; a slow call still completes and saves the exact result.
+"""
+import asyncio
+import os
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from rest_framework import status
+
+from .analytics import metrics_fingerprint
+from .models import PatientMetrics
+from .processing import ProcessingError, aget_or_fetch_metrics, get_or_fetch_metrics
+from .series import ResultSeries, unpack_results
+from .units import HEIGHT_TO_M, WEIGHT_TO_KG, to_si
+from . import telemetry
+
+SURROGATE_CACHE_KEY = 'patient:surrogate:table'
+# Upstream failures (and a spent external API budget) the surrogate stands in for;
+# storage errors are still reported
+FALLBACK_STATUSES = (
+    status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE, status.HTTP_504_GATEWAY_TIMEOUT
+)
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+# Async upstream calls outliving the request that started them
+_background = set()
+
+
+class SurrogateTable:
+    """
+    Stored series by (kg, m), rounded like metric keys; series stored for the same
+    point (several patients) are averaged. An estimate interpolates linearly in height
+    within the nearest weights on either side that have points around it, then in
+    weight between those two, so it covers the grids `warm_metrics` fills (and
+    scattered points) but never extrapolates.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        columns = defaultdict(list)
+        for weight, height in points:
+            columns[weight].append(height)
+        self.columns = {weight: sorted(heights) for weight, heights in columns.items()}
+        self.weights = sorted(self.columns)
+
+    def __len__(self):
+        return len(self.points)
+
+    @staticmethod
+    def bracket(axis, value):
+        """
+        (low, high, fraction) of the sorted values around `value`, None outside them
+        """
+        index = bisect_left(axis, value)
+        if index == len(axis):
+            return None
+        if axis[index] == value:
+            return value, value, 0.0
+        if index == 0:
+            return None
+        low, high = axis[index - 1], axis[index]
+        return low, high, (value - low) / (high - low)
+
+    @staticmethod
+    def blend(low, high, fraction):
+        """
+        Linear blend of two (durations, concentrations), None if sampled differently
+        """
+        if fraction == 0:
+            return low
+        if low[0] != high[0]:
+            return None
+        return low[0], low[1] * (1 - fraction) + high[1] * fraction
+
+    def column(self, weight, height):
+        heights = self.bracket(self.columns[weight], height)
+        if heights is None:
+            return None
+        low, high, fraction = heights
+        return self.blend(self.points[(weight, low)], self.points[(weight, high)], fraction)
+
+    def estimate(self, weight, height):
+        """
+        ResultSeries for (kg, m), or None when stored points don't surround it
+        """
+        index = bisect_left(self.weights, weight)
+        if index < len(self.weights) and self.weights[index] == weight:
+            exact = self.column(weight, height)
+            if exact is not None:
+                return ResultSeries(*exact)
+            below, above = self.weights[index - 1::-1] if index else [], self.weights[index + 1:]
+        else:
+            below, above = self.weights[index - 1::-1] if index else [], self.weights[index:]
+
+        lower = next(((w, c) for w in below if (c := self.column(w, height)) is not None), None)
+        upper = next(((w, c) for w in above if (c := self.column(w, height)) is not None), None)
+        if lower is None or upper is None:
+            return None
+        fraction = (weight - lower[0]) / (upper[0] - lower[0])
+        estimate = self.blend(lower[1], upper[1], fraction)
+        return ResultSeries(*estimate) if estimate is not None else None
+
+
+def build_table():
+    """
+    SurrogateTable of every stored series with a known weight/height unit, one query
+    """
+    precision = settings.PATIENT_METRICS_KEY_PRECISION
+    groups = defaultdict(list)
+    rows = PatientMetrics.objects.exclude(results_packed=None).values_list(
+        'weight_value', 'weight_unit', 'height_value', 'height_unit', 'results_packed'
+    )
+    for weight_value, weight_unit, height_value, height_unit, packed in rows.iterator(chunk_size=2000):
+        weight = to_si(weight_value, weight_unit, WEIGHT_TO_KG)
+        height = to_si(height_value, height_unit, HEIGHT_TO_M)
+        series = unpack_results(packed)
+        if weight is None or height is None or series is None or not len(series):
+            continue
+        groups[(round(weight, precision), round(height, precision))].append(series)
+
+    points = {}
+    for point, series_list in groups.items():
+        durations = list(series_list[0].durations)
+        stack = np.vstack([
+            np.asarray(series.concentrations, dtype=np.float64)
+            for series in series_list if list(series.durations) == durations
+        ])
+        # Usually identical (the model doesn't depend on the patient): keep the stored values
+        points[point] = (durations, stack[0] if (stack == stack[0]).all() else stack.mean(axis=0))
+    return SurrogateTable(points)
+
+
+def get_table():
+    """
+    The cached SurrogateTable, rebuilt once metrics have been added or removed
+    """
+    fingerprint = metrics_fingerprint()
+    cached = cache.get(SURROGATE_CACHE_KEY)
+    if cached is not None and cached["fingerprint"] == fingerprint:
+        return cached["table"]
+
+    table = build_table()
+    cache.set(
+        SURROGATE_CACHE_KEY,
+        {"fingerprint": fingerprint, "table": table},
+        settings.PATIENT_SURROGATE_CACHE_TIMEOUT
+    )
+    return table
+
+
+def estimate_payload(weight, height):
+    """
+    Process response body estimated from the table, or None when it can't
+    """
+    weight_si = to_si(weight['value'], weight['unit'], WEIGHT_TO_KG)
+    height_si = to_si(height['value'], height['unit'], HEIGHT_TO_M)
+    if weight_si is None or height_si is None:
+        return None
+    series = get_table().estimate(weight_si, height_si)
+    if series is None:
+        return None
+    return {
+        "success": True,
+        "approximate": True,
+        "patient": {
+            "weight": {"value": weight['value'], "unit": weight['unit']},
+            "height": {"value": height['value'], "unit": height['unit']}
+        },
+        "results": series.as_points()
+    }
+
+
+def get_executor():
+    """
+    Per-worker threads running upstream calls the request stopped waiting for
+    """
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PATIENT_PROCESS_API_POOL_SIZE,
+                    thread_name_prefix='process-surrogate',
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def fetch_in_thread(patient, weight, height):
+    close_old_connections()
+    try:
+        return get_or_fetch_metrics(patient, weight, height)
+    finally:
+        close_old_connections()
+
+
+def fetch_or_estimate(patient, weight, height):
+    """
+    get_or_fetch_metrics with the surrogate as fallback: (metrics, None), or
+    (None, estimated body) when the API failed or was slower than PATIENT_SURROGATE_AFTER.
+    Raises ProcessingError when there is nothing to fall back on.
+    """
+    if not settings.PATIENT_SURROGATE_ENABLED:
+        return get_or_fetch_metrics(patient, weight, height), None
+
+    future = None
+    try:
+        if settings.PATIENT_SURROGATE_AFTER > 0:
+            future = get_executor().submit(fetch_in_thread, patient, weight, height)
+            return future.result(timeout=settings.PATIENT_SURROGATE_AFTER), None
+        return get_or_fetch_metrics(patient, weight, height), None
+    except FutureTimeout:
+        reason, error = 'slow', None
+    except ProcessingError as e:
+        if e.status_code not in FALLBACK_STATUSES:
+            raise
+        reason, error = 'error', e
+
+    payload = estimate_payload(weight, height)
+    if payload is None:
+        if error is not None:
+            raise error
+        # Slow but nothing to estimate from: keep waiting for the API
+        return future.result(), None
+    telemetry.inc('patient_surrogate_responses_total', reason=reason)
+    return None, payload
+
+
+def _background_done(task):
+    _background.discard(task)
+    if not task.cancelled():
+        # Failures were already answered for; mark them retrieved
+        task.exception()
+
+
+async def afetch_or_estimate(patient, weight, height):
+    """
+    fetch_or_estimate for the async views; a call that outlives the deadline carries
+    on on the event loop (under ASGI; a WSGI request's own loop ends with it)
+    """
+    if not settings.PATIENT_SURROGATE_ENABLED:
+        return await aget_or_fetch_metrics(patient, weight, height), None
+
+    task = asyncio.ensure_future(aget_or_fetch_metrics(patient, weight, height))
+    try:
+        if settings.PATIENT_SURROGATE_AFTER > 0:
+            return await asyncio.wait_for(asyncio.shield(task), settings.PATIENT_SURROGATE_AFTER), None
+        return await task, None
+    except asyncio.TimeoutError:
+        reason, error = 'slow', None
+    except ProcessingError as e:
+        if e.status_code not in FALLBACK_STATUSES:
+            raise
+        reason, error = 'error', e
+
+    payload = await sync_to_async(estimate_payload)(weight, height)
+    if payload is None:
+        if error is not None:
+            raise error
+        return await task, None
+    if not task.done():
+        _background.add(task)
+        task.add_done_callback(_background_done)
+    telemetry.inc('patient_surrogate_responses_total', reason=reason)
+    return None, payload
@@ -0,0 +1,236 @@
+"""
+In-process counters and histograms for the patient API, rendered as Prometheus text.
+
+Each worker keeps its own numbers in memory. With PATIENT_TELEMETRY_DIR set, workers
+write a snapshot there every PATIENT_TELEMETRY_FLUSH_INTERVAL seconds (and at exit),
+one file per process, and /api/metrics sums every file. Empty the directory on deploy,
+like prometheus_client's multiprocess mode.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'patient_http_request_duration_seconds': (
+        'histogram', "Latency of patient API requests by route, method and status", LATENCY_BUCKETS),
+    'patient_db_queries_per_request': (
+        'histogram', "DB queries run by one patient API request", QUERY_BUCKETS),
+    'patient_db_query_duration_seconds': (
+        'histogram', "Time one patient API request spent in DB queries", LATENCY_BUCKETS),
+    'patient_upstream_request_duration_seconds': (
+        'histogram', "Latency of external process API calls by HTTP status", LATENCY_BUCKETS),
+    'patient_metrics_cache_requests_total': (
+        'counter', "Process requests answered from stored PatientMetrics (hit) or not (miss)", None),
+    'patient_throttle_rejections_total': (
+        'counter', "Requests rejected by a throttle, by scope", None),
+    'patient_upstream_breaker_trips_total': (
+        'counter', "Times the external API circuit breaker opened", None),
+    'patient_upstream_breaker_rejections_total': (
+        'counter', "External API calls failed fast by the open circuit breaker", None),
+    'patient_upstream_breaker_probes_total': (
+        'counter', "Half-open probe calls let through by the circuit breaker", None),
+    'patient_upstream_hedged_requests_total': (
+        'counter', "External API calls that sent a hedged second request", None),
+    'patient_surrogate_responses_total': (
+        'counter', "Process requests answered by the local surrogate, by reason (error or slow)", None),
+}
+
+_lock = threading.Lock()
+_pid = None
+_token = None
+_counters = defaultdict(float)
+_histograms = {}
+_last_flush = 0.0
+
+
+def _check_pid():
+    """
+    Forget what the parent recorded after a fork; called with the lock held
+    """
+    global _pid, _token, _last_flush
+    pid = os.getpid()
+    if _pid != pid:
+        _pid = pid
+        # pid + token: a restarted worker reusing a pid never overwrites a dead one's file
+        _token = uuid.uuid4().hex[:8]
+        _counters.clear()
+        _histograms.clear()
+        _last_flush = time.monotonic()
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    if not settings.PATIENT_TELEMETRY_ENABLED:
+        return
+    key = (name, _labels_key(labels))
+    with _lock:
+        _check_pid()
+        _counters[key] += amount
+
+
+def observe(name, value, **labels):
+    if not settings.PATIENT_TELEMETRY_ENABLED:
+        return
+    buckets = METRICS[name][2]
+    key = (name, _labels_key(labels))
+    index = bisect_left(buckets, value)
+    with _lock:
+        _check_pid()
+        histogram = _histograms.get(key)
+        if histogram is None:
+            # per-bucket (not cumulative) counts, +Inf last, then sum and count
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def snapshot():
+    with _lock:
+        _check_pid()
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [
+                [name, list(labels), list(counts), total, count]
+                for (name, labels), (counts, total, count) in _histograms.items()
+            ],
+        }
+
+
+def flush_due():
+    """
+    Whether flush() would write now, so async callers only leave the event loop then
+    """
+    return (
+        bool(settings.PATIENT_TELEMETRY_DIR) and settings.PATIENT_TELEMETRY_ENABLED
+        and time.monotonic() - _last_flush >= settings.PATIENT_TELEMETRY_FLUSH_INTERVAL
+    )
+
+
+def flush(force=False):
+    """
+    Write this process' snapshot to PATIENT_TELEMETRY_DIR, at most once per flush interval
+    """
+    global _last_flush
+    directory = settings.PATIENT_TELEMETRY_DIR
+    if not directory or not settings.PATIENT_TELEMETRY_ENABLED:
+        return
+    if not force and not flush_due():
+        return
+    _last_flush = time.monotonic()
+
+    data = snapshot()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"telemetry-{_pid}-{_token}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    # Readers see the old file or the new one, never half of one
+    os.replace(tmp, path)
+
+
+def collect():
+    """
+    Every process' numbers summed: this one live, the others from their last flush
+    """
+    snapshots = [snapshot()]
+    directory = settings.PATIENT_TELEMETRY_DIR
+    if directory:
+        flush(force=True)
+        own = os.path.join(directory, f"telemetry-{_pid}-{_token}.json")
+        for path in glob.glob(os.path.join(directory, 'telemetry-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed or replaced while listing
+                continue
+
+    counters = defaultdict(float)
+    histograms = {}
+    for data in snapshots:
+        for name, labels, value in data["counters"]:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, counts, total, count in data["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render_prometheus():
+    """
+    Prometheus text exposition format 0.0.4
+    """
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _flush_at_exit():
+    try:
+        flush(force=True)
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,17 @@
+"""
+The API with the async list, detail and process views, as PATIENT_ASYNC_VIEWS serves it
+"""
+from django.urls import include, path
+
+from patient import urls
+from patient.async_views import AsyncPatientDetailView, AsyncPatientView, AsyncProcessPatientView
+
+VIEWS = {'patients': AsyncPatientView, 'patient-detail': AsyncPatientDetailView, 'patient-process': AsyncProcessPatientView}
+
+urlpatterns = [
+    path('api/', include([
+        path(str(pattern.pattern), VIEWS[pattern.name].as_view(), name=pattern.name)
+        if pattern.name in VIEWS else pattern
+        for pattern in urls.urlpatterns
+    ])),
+]
@@ -0,0 +1,17 @@
+"""
+The API with the DRF list, detail and process views, whatever PATIENT_ASYNC_VIEWS says
+"""
+from django.urls import include, path
+
+from patient import urls
+from patient.views import PatientDetailView, PatientView, ProcessPatientView
+
+VIEWS = {'patients': PatientView, 'patient-detail': PatientDetailView, 'patient-process': ProcessPatientView}
+
+urlpatterns = [
+    path('api/', include([
+        path(str(pattern.pattern), VIEWS[pattern.name].as_view(), name=pattern.name)
+        if pattern.name in VIEWS else pattern
+        for pattern in urls.urlpatterns
+    ])),
+]
@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from patient.analytics import decode_columns, pk_metrics
+from patient.models import Patient, PatientMetrics
+from patient.series import pack_results, unpack_results
+
+AVA = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+BEN = {"first_name": "Ben", "last_name": "Ode", "dob": "1985-05-05", "sex": "male", "ethnic_background": "Yoruba"}
+
+# Peak of 8 at t=10, then halving every 10
+DECAY = [[0, 0.0], [10, 8.0], [20, 4.0], [30, 2.0], [40, 1.0]]
+RISING = [[0, 1.0], [10, 2.0], [20, 3.0]]
+
+
+class PKMetricsTests(SimpleTestCase):
+
+    def test_decode_columns(self):
+        for results in (DECAY, [[0, 1], [5, 7], [30, 2]], [[1, 0.25]]):
+            with self.subTest(results=results):
+                durations, concentrations = decode_columns(pack_results(results))
+                series = unpack_results(pack_results(results))
+                self.assertEqual(durations.tolist(), [float(d) for d in series.durations])
+                self.assertEqual(concentrations.tolist(), series.concentrations.tolist())
+
+    def test_batch(self):
+        durations = np.array([[d for d, _ in DECAY], [d for d, _ in DECAY]], dtype=np.float64)
+        concentrations = np.array([[c for _, c in DECAY], [5.0, 4.0, 3.0, 2.0, 9.0]])
+        metrics = pk_metrics(durations, concentrations, 3)
+        self.assertEqual(metrics["cmax"].tolist(), [8.0, 9.0])
+        self.assertEqual(metrics["tmax"].tolist(), [10.0, 40.0])
+        self.assertEqual(metrics["auc"].tolist(), [40 + 60 + 30 + 15, 45 + 35 + 25 + 55])
+        self.assertAlmostEqual(metrics["half_life"][0], 10.0)
+        # Peak inside the terminal points: no half-life
+        self.assertTrue(math.isnan(metrics["half_life"][1]))
+
+    def test_too_few_points_for_a_half_life(self):
+        metrics = pk_metrics(np.array([[0.0, 10.0]]), np.array([[2.0, 1.0]]), 3)
+        self.assertTrue(math.isnan(metrics["half_life"][0]))
+
+
+@override_settings(PATIENT_ANALYTICS_TERMINAL_POINTS=3)
+class PKAnalyticsViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ava, self.ben = Patient.objects.create(**AVA), Patient.objects.create(**BEN)
+
+    def add_metrics(self, patient, weight, results):
+        PatientMetrics.objects.create(
+            patient=patient, weight_value=weight, weight_unit='kg', height_value=1.8, height_unit='m',
+            results=results
+        )
+
+    def get(self):
+        response = self.client.get('/api/analytics/pk')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_no_series(self):
+        result = self.get()["result"]
+        self.assertEqual((result["series_count"], result["patient_count"]), (0, 0))
+        self.assertEqual(result["overall"]["cmax"], {"n": 0, "mean": None, "median": None, "min": None, "max": None})
+        self.assertEqual(result["by_sex"], {})
+
+    def test_summary_across_series_lengths(self):
+        self.add_metrics(self.ava, 70, DECAY)
+        self.add_metrics(self.ava, 80, RISING)
+        self.add_metrics(self.ben, 90, DECAY)
+        # Not processed yet: left out
+        self.add_metrics(self.ben, 100, None)
+
+        result = self.get()["result"]
+        self.assertEqual((result["series_count"], result["patient_count"]), (3, 2))
+        self.assertEqual(result["overall"]["cmax"]["max"], 8.0)
+        self.assertEqual(result["overall"]["cmax"]["min"], 3.0)
+        self.assertEqual(result["overall"]["half_life"]["n"], 2)
+        self.assertAlmostEqual(result["overall"]["half_life"]["mean"], 10.0)
+
+        self.assertEqual({sex: group["count"] for sex, group in result["by_sex"].items()}, {"female": 2, "male": 1})
+        self.assertEqual(result["by_ethnic_background"]["Yoruba"]["auc"]["mean"], 145.0)
+
+    def test_cached_until_metrics_change(self):
+        self.add_metrics(self.ava, 70, DECAY)
+        self.assertFalse(self.get()["cached"])
+        body = self.get()
+        self.assertTrue(body["cached"])
+        self.assertEqual(body["result"]["series_count"], 1)
+
+        self.add_metrics(self.ben, 70, DECAY)
+        body = self.get()
+        self.assertFalse(body["cached"])
+        self.assertEqual(body["result"]["series_count"], 2)
@@ -0,0 +1,31 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from patient.async_views import AsyncPatientView
+from patient.models import Patient
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+@override_settings(ROOT_URLCONF='patient.tests.async_urls')
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_as_view_has_no_side_effects(self):
+        handler = AsyncPatientView.sync_handler
+        AsyncPatientView.as_view()
+        AsyncPatientView.as_view()
+        self.assertIs(AsyncPatientView.sync_handler, handler)
+
+    def test_methods_without_async_version_run_the_drf_view(self):
+        response = self.client.post('/api/patients', PATIENT, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        patient_id = response.json()["series"]["result"]["patient"]["id"]
+
+        response = self.client.get(f'/api/patients/{patient_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["series"]["result"]["patient"]["first_name"], "Ava")
+        self.assertEqual(self.client.delete(f'/api/patients/{patient_id}').status_code, 200)
+        self.assertFalse(Patient.objects.filter(id=patient_id).exists())
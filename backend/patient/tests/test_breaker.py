@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from patient import breaker, upstream
+from patient.breaker import CircuitOpen
+from patient.models import Patient
+from patient.processing import ProcessingError, call_upstream
+from patient.stub_upstream import StubUpstreamServer
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+START = 1_700_000_000.0
+
+
+@override_settings(
+    PATIENT_BREAKER_ENABLED=True,
+    PATIENT_BREAKER_FAILURES=2,
+    PATIENT_BREAKER_RESET_TIMEOUT=30,
+    PATIENT_BREAKER_BACKEND='local',
+)
+class BreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        # Probe claims too, not only what reset() clears
+        breaker.get_cache().clear()
+        self.now = START
+        self.enterContext(mock.patch('patient.breaker.time.time', lambda: self.now))
+
+    def trip(self):
+        breaker.record(False)
+        breaker.record(False)
+
+    def test_opens_after_failures_in_a_row(self):
+        breaker.record(False)
+        self.assertFalse(breaker.before_call())
+        # A success in between starts the count again
+        breaker.record(True)
+        breaker.record(False)
+        self.assertFalse(breaker.before_call())
+        breaker.record(False)
+        with self.assertRaises(CircuitOpen) as raised:
+            breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertEqual(breaker.status()["state"], breaker.OPEN)
+        self.assertEqual(breaker.status()["trips"], 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.trip()
+        self.now += 10
+        with self.assertRaises(CircuitOpen) as raised:
+            breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 20)
+
+        self.now += 20
+        self.assertEqual(breaker.status()["state"], breaker.HALF_OPEN)
+        self.assertTrue(breaker.before_call())
+        # Others keep failing fast while the probe is out
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+    def test_probe_failure_keeps_it_open(self):
+        self.trip()
+        self.now += 30
+        self.assertTrue(breaker.before_call())
+        breaker.record(False, probe=True)
+        self.now += 29
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        # Another period on, the next probe
+        self.now += 1
+        self.assertTrue(breaker.before_call())
+
+    def test_probe_success_closes_it(self):
+        self.trip()
+        self.now += 30
+        self.assertTrue(breaker.before_call())
+        breaker.record(True, probe=True)
+        self.assertEqual(breaker.status()["state"], breaker.CLOSED)
+        self.assertEqual(breaker.status()["consecutive_failures"], 0)
+        self.assertFalse(breaker.before_call())
+        self.assertFalse(breaker.before_call())
+
+    @override_settings(
+        PATIENT_PROCESS_API_HEDGE=False,
+        PATIENT_PROCESS_API_RETRIES=0,
+        PATIENT_PROCESS_GLOBAL_THROTTLE=None,
+    )
+    def test_open_breaker_spares_the_external_api(self):
+        stub = StubUpstreamServer(fail_status=503).__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        self.enterContext(override_settings(PATIENT_PROCESS_API_URL=stub.url_template))
+        upstream.reset_session()
+        cache.clear()
+        weight, height = {"value": 70, "unit": "kg"}, {"value": 1.8, "unit": "m"}
+        for _ in range(3):
+            with self.assertRaises(ProcessingError) as raised:
+                call_upstream(1, weight, height)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(stub.requests, 2)
+
+
+@override_settings(
+    PATIENT_BREAKER_ENABLED=True,
+    PATIENT_BREAKER_FAILURES=2,
+    PATIENT_BREAKER_RESET_TIMEOUT=30,
+    PATIENT_BREAKER_BACKEND='local',
+    PATIENT_PROCESS_GLOBAL_THROTTLE=None,
+)
+class OpenCircuitResponseTests(TestCase):
+    """
+    The process endpoints fail fast while the breaker is open, and say when to come back
+    """
+
+    def setUp(self):
+        breaker.get_cache().clear()
+        cache.clear()
+        self.patient = Patient.objects.create(**PATIENT)
+        breaker.record(False)
+        breaker.record(False)
+
+    def test_503_with_retry_after(self):
+        for urlconf in ('patient.tests.sync_urls', 'patient.tests.async_urls'):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                cache.clear()
+                response = self.client.post(
+                    f'/api/patients/{self.patient.id}/process',
+                    {"weight": {"value": 70, "unit": "kg"}, "height": {"value": 1.8, "unit": "m"}},
+                    content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '30')
+                self.assertIn("circuit open", response.json()["error"])
@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from patient.models import Patient, PatientMetrics, ProcessJob
+
+AVA = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+BEN = {"first_name": "Ben", "last_name": "Ode", "dob": "1985-05-05", "sex": "male", "ethnic_background": "Yoruba"}
+CY = {"first_name": "Cy", "last_name": "Lund", "dob": "1970-03-03", "sex": "other", "ethnic_background": "Swedish"}
+
+
+class UpsertPatientsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def upsert(self, rows, query=''):
+        return self.client.post(f'/api/patients/upsert{query}', rows, content_type='application/json')
+
+    def test_counts_created_and_updated(self):
+        stored = Patient.objects.create(**AVA)
+        response = self.upsert([{**AVA, "ethnic_background": "Korean-American"}, BEN])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["created"], body["updated"]), (1, 1))
+        self.assertEqual([patient["first_name"] for patient in body["patients"]], ["Ava", "Ben"])
+
+        stored.refresh_from_db()
+        self.assertEqual(stored.ethnic_background, "Korean-American")
+        self.assertGreater(stored.updated_at, stored.created_at)
+        self.assertEqual(Patient.objects.count(), 2)
+
+    def test_repeated_key_keeps_the_last_row(self):
+        body = self.upsert([AVA, {**AVA, "sex": "other"}]).json()
+        self.assertEqual((body["created"], body["updated"]), (1, 0))
+        self.assertEqual(Patient.objects.get().sex, "other")
+
+    def test_patients_sharing_a_key_are_kept_the_oldest_updated(self):
+        oldest, newer = Patient.objects.create(**AVA), Patient.objects.create(**AVA)
+        body = self.upsert([{**AVA, "sex": "other"}]).json()
+        self.assertEqual((body["created"], body["updated"]), (0, 1))
+        self.assertEqual(Patient.objects.get(id=oldest.id).sex, "other")
+        self.assertEqual(Patient.objects.get(id=newer.id).sex, "female")
+
+    def test_counts_only(self):
+        body = self.upsert([AVA, BEN], '?return_patients=false').json()
+        self.assertEqual(body, {"success": True, "created": 2, "updated": 0})
+
+    def test_invalid_rows_change_nothing(self):
+        response = self.upsert([AVA, {**BEN, "sex": "unknown"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Patient.objects.exists())
+        self.assertEqual(self.upsert(AVA).status_code, 400)
+
+
+class BulkDeletePatientsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ava, self.ben, self.cy = (Patient.objects.create(**data) for data in (AVA, BEN, CY))
+        metrics = PatientMetrics.objects.create(
+            patient=self.ava, weight_value=70, weight_unit='kg', height_value=1.8, height_unit='m',
+            metric_key='70.00kg|1.80m'
+        )
+        ProcessJob.objects.create(patient=self.ava, weight_value=70, height_value=1.8, metrics=metrics)
+
+    def delete(self, body, query=''):
+        return self.client.post(f'/api/patients/delete{query}', body, content_type='application/json')
+
+    def test_by_ids_with_metrics_and_jobs(self):
+        response = self.delete({"ids": [self.ava.id, self.ben.id, 999999]})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["deleted"], 2)
+        self.assertEqual([patient["id"] for patient in body["patients"]], [self.ava.id, self.ben.id])
+        self.assertEqual(list(Patient.objects.values_list('id', flat=True)), [self.cy.id])
+        self.assertFalse(PatientMetrics.objects.exists())
+        self.assertFalse(ProcessJob.objects.exists())
+
+    def test_by_filter(self):
+        body = self.delete({"filter": {"sex": "male"}}).json()
+        self.assertEqual(body["deleted"], 1)
+        self.assertEqual(body["patients"][0]["first_name"], "Ben")
+        body = self.delete({"filter": {"dob_to": "1989-12-31"}}).json()
+        self.assertEqual(body["deleted"], 1)
+        self.assertEqual(list(Patient.objects.values_list('id', flat=True)), [self.ava.id])
+
+    def test_without_payloads(self):
+        body = self.delete({"ids": [self.ava.id]}, '?return_patients=false').json()
+        self.assertEqual(body, {"success": True, "deleted": 1})
+
+    def test_list_count_follows_the_delete(self):
+        self.assertEqual(self.client.get('/api/patients').json()["series"]["result"]["total_count"], 3)
+        # Invalidated once the delete commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.delete({"ids": [self.ava.id]})
+        self.assertEqual(self.client.get('/api/patients').json()["series"]["result"]["total_count"], 2)
+
+    def test_refuses_unbounded_or_ambiguous_deletes(self):
+        for body in ({"filter": {}}, {"filter": {"name": ""}}, {}, {"ids": []},
+                     {"ids": [self.ava.id], "filter": {"sex": "male"}}):
+            with self.subTest(body=body):
+                self.assertEqual(self.delete(body).status_code, 400)
+        self.assertEqual(Patient.objects.count(), 3)
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from patient.models import Patient, PatientMetrics
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = Patient.objects.create(**PATIENT)
+        self.detail = f'/api/patients/{self.patient.id}'
+
+    def test_detail_etag_and_last_modified(self):
+        response = self.client.get(self.detail)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Answered from the cache alone
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.detail, headers={"If-Modified-Since": last_modified}).status_code, 304)
+        self.assertEqual(self.client.get(self.detail, headers={"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_list_etag(self):
+        etag = self.client.get('/api/patients')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/patients', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        # Each page and filter set has its own
+        self.assertNotEqual(self.client.get('/api/patients', {"sex": "male"})['ETag'], etag)
+
+    def test_metrics_are_part_of_the_etag(self):
+        plain = self.client.get(self.detail)['ETag']
+        with_metrics = self.client.get(self.detail, {"include": "metrics"})
+        self.assertNotEqual(with_metrics['ETag'], plain)
+        self.assertNotIn('Last-Modified', with_metrics)
+
+        PatientMetrics.objects.create(
+            patient=self.patient, weight_value=70, weight_unit='kg', height_value=1.8, height_unit='m'
+        )
+        response = self.client.get(self.detail, {"include": "metrics"}, headers={"If-None-Match": with_metrics['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["series"]["result"]["patient"]["latest_metrics"]["weight"]["value"], 70)
+
+
+class InvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = Patient.objects.create(**PATIENT)
+
+    def list_result(self):
+        response = self.client.get('/api/patients')
+        return response['ETag'], response.json()["series"]["result"]
+
+    def test_create_drops_list_pages(self):
+        etag, result = self.list_result()
+        self.assertEqual(result["total_count"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/patients', {**PATIENT, "first_name": "Ben"}, content_type='application/json')
+        patient_id = response.json()["series"]["result"]["patient"]["id"]
+
+        new_etag, result = self.list_result()
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(result["total_count"], 2)
+        self.assertEqual(result["patients"][-1]["id"], patient_id)
+        # Write-through: the new patient's detail is already cached
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f'/api/patients/{patient_id}').status_code, 200)
+
+    def test_delete_drops_detail_and_list_pages(self):
+        detail = f'/api/patients/{self.patient.id}'
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        self.list_result()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(detail).status_code, 200)
+
+        self.assertEqual(self.client.get(detail).status_code, 404)
+        _, result = self.list_result()
+        self.assertEqual((result["total_count"], result["patients"]), (0, []))
+
+    def test_upsert_changes_the_validators(self):
+        detail = f'/api/patients/{self.patient.id}'
+        etag = self.client.get(detail)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/patients/upsert', [{**PATIENT, "ethnic_background": "Korean-American"}],
+                content_type='application/json'
+            )
+        response = self.client.get(detail, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["series"]["result"]["patient"]["ethnic_background"], "Korean-American")
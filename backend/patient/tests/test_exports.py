@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from django.test import TestCase, override_settings
+
+from patient.models import Patient, PatientMetrics
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+RESULTS = [[0, 1.5], [30, 2.25]]
+
+
+@override_settings(PATIENT_EXPORT_CHUNK_SIZE=2)
+class ExportPatientsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ava = Patient.objects.create(**PATIENT)
+        cls.ben = Patient.objects.create(**{**PATIENT, "first_name": "Ben"})
+        cls.cy = Patient.objects.create(**{**PATIENT, "first_name": "Cy"})
+        for weight in (70, 80):
+            PatientMetrics.objects.create(
+                patient=cls.ava, weight_value=weight, weight_unit='kg', height_value=1.8, height_unit='m',
+                results=RESULTS
+            )
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/patients/export{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="patients.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.ava.id, self.ben.id, self.cy.id])
+        self.assertEqual(rows[0], {"id": self.ava.id, **PATIENT})
+
+    def test_ndjson_with_metrics(self):
+        _, body = self.export('?include=metrics')
+        # One line per patient, however many metrics
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([len(row["metrics"]) for row in rows], [2, 0, 0])
+        self.assertEqual([metrics["weight"]["value"] for metrics in rows[0]["metrics"]], [70, 80])
+        self.assertEqual(rows[0]["metrics"][0]["results"], [
+            {"duration_30_m": 0, "concentration": 1.5}, {"duration_30_m": 30, "concentration": 2.25}
+        ])
+
+    def test_csv_with_metrics(self):
+        response, body = self.export('?output=csv&include=metrics')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        # One row per (patient, metrics) pair, patients without metrics once
+        self.assertEqual([row["first_name"] for row in rows], ["Ava", "Ava", "Ben", "Cy"])
+        self.assertEqual(json.loads(rows[0]["results"]), RESULTS)
+        self.assertEqual(rows[2]["metrics_id"], "")
+        self.assertEqual(
+            datetime.fromisoformat(rows[0]["processed_at"]),
+            PatientMetrics.objects.get(id=rows[0]["metrics_id"]).processed_at
+        )
+
+    def test_csv(self):
+        _, body = self.export('?output=csv')
+        header, *rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(header, ['id', 'first_name', 'last_name', 'dob', 'sex', 'ethnic_background'])
+        self.assertEqual(rows[0], [str(self.ava.id), "Ava", "Kim", "1990-01-01", "female", "Korean"])
+
+    def test_unknown_output(self):
+        response = self.client.get('/api/patients/export?output=xml')
+        self.assertEqual(response.status_code, 400)
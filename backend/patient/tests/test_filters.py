@@ -0,0 +1,118 @@
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from patient.models import Patient
+
+AVA = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+BEN = {"first_name": "Ben", "last_name": "Ode", "dob": "1985-05-05", "sex": "male", "ethnic_background": "Yoruba"}
+KIM = {"first_name": "Kim", "last_name": "Lund", "dob": "1970-03-03", "sex": "other", "ethnic_background": "Swedish"}
+
+search_indexes = import_module('patient.migrations.0009_patient_search_indexes')
+
+
+class PatientFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ava, cls.ben, cls.kim = (Patient.objects.create(**data) for data in (AVA, BEN, KIM))
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, **params):
+        response = self.client.get('/api/patients', params)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["series"]["result"]
+        names = [patient["first_name"] for patient in result["patients"]]
+        # The count is of the filtered patients, and exact
+        self.assertEqual((result["total_count"], result["count_exact"]), (len(names), True))
+        return names
+
+    def test_name_prefix(self):
+        self.assertEqual(self.names(name='kim'), ["Ava", "Kim"])
+        self.assertEqual(self.names(name='o'), ["Ben"])
+        self.assertEqual(self.names(name='ava ki'), ["Ava"])
+        self.assertEqual(self.names(name='Kim Av'), ["Ava"])
+        self.assertEqual(self.names(name='va'), [])
+        self.assertEqual(self.names(name=''), ["Ava", "Ben", "Kim"])
+
+    def test_exact_and_range_filters(self):
+        self.assertEqual(self.names(sex='male'), ["Ben"])
+        self.assertEqual(self.names(ethnic_background='Swedish'), ["Kim"])
+        self.assertEqual(self.names(dob_from='1985-05-05', dob_to='1990-01-01'), ["Ava", "Ben"])
+        self.assertEqual(self.names(sex='female', dob_to='1989-12-31'), [])
+
+        Patient.objects.filter(id=self.kim.id).update(created_at=timezone.now() - timedelta(days=10))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.names(created_from=since), ["Ava", "Ben"])
+        self.assertEqual(self.names(created_to=since), ["Kim"])
+
+    def test_filtered_pages_are_cached_apart(self):
+        self.assertEqual(self.names(), ["Ava", "Ben", "Kim"])
+        self.assertEqual(self.names(sex='male'), ["Ben"])
+        self.assertEqual(self.names(sex='female'), ["Ava"])
+        self.assertEqual(self.names(), ["Ava", "Ben", "Kim"])
+
+    def test_invalid_filters(self):
+        for params in ({"sex": "unknown"}, {"dob_from": "yesterday"}, {"dob_from": "1990-01-02", "dob_to": "1990-01-01"}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/patients', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.json()["series"]["result"])
+
+
+class TrigramIndexTests(SimpleTestCase):
+    """
+    0009's trigram indexes are Postgres-only and optional
+    """
+
+    def schema_editor(self, vendor, execute):
+        editor = mock.Mock(execute=mock.Mock(side_effect=execute), quote_name=lambda name: f'"{name}"')
+        editor.connection.vendor = vendor
+        editor.connection.alias = 'default'
+        return editor
+
+    def test_skipped_on_other_databases(self):
+        editor = self.schema_editor('sqlite', None)
+        search_indexes.create_trigram_indexes(apps, editor)
+        editor.execute.assert_not_called()
+
+    def test_skipped_without_pg_trgm(self):
+        def execute(sql):
+            if 'EXTENSION' in sql:
+                raise DatabaseError('permission denied to create extension "pg_trgm"')
+
+        editor = self.schema_editor('postgresql', execute)
+        with mock.patch.object(search_indexes.transaction, 'atomic'), \
+                self.assertLogs(search_indexes.logger, 'WARNING') as logs:
+            search_indexes.create_trigram_indexes(apps, editor)
+        self.assertEqual(editor.execute.call_count, 1)
+        self.assertIn("skipping trigram indexes", logs.output[0])
+
+    def test_created_with_pg_trgm(self):
+        editor = self.schema_editor('postgresql', None)
+        with mock.patch.object(search_indexes.transaction, 'atomic'):
+            search_indexes.create_trigram_indexes(apps, editor)
+        statements = [call.args[0] for call in editor.execute.call_args_list[1:]]
+        self.assertEqual(len(statements), 2)
+        self.assertIn('(UPPER("last_name"::text)) gin_trgm_ops', statements[0])
+
+
+@skipUnless(connection.vendor == 'postgresql', "trigram indexes are Postgres-only")
+class TrigramIndexPostgresTests(TestCase):
+
+    def test_name_search_can_use_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("pg_trgm is not installed")
+            constraints = connection.introspection.get_constraints(cursor, Patient._meta.db_table)
+        self.assertIn('patient_last_name_trgm_idx', constraints)
+        self.assertIn('patient_first_name_trgm_idx', constraints)
@@ -0,0 +1,70 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from patient.models import Patient
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+@override_settings(PATIENT_IMPORT_CHUNK_SIZE=2)
+class ImportPatientsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, body, content_type):
+        response = self.client.post('/api/patients/import', body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_ndjson_with_row_errors(self):
+        lines = [
+            json.dumps(PATIENT),
+            '{"first_name": ',
+            '',
+            json.dumps({**PATIENT, "first_name": "Ben"}),
+            json.dumps({**PATIENT, "sex": "unknown"}),
+            json.dumps({**PATIENT, "first_name": "Cy"}),
+        ]
+        *chunks, summary = self.upload('\n'.join(lines) + '\n', 'application/x-ndjson')
+
+        # Blank lines are skipped, not counted
+        self.assertEqual([chunk["rows"] for chunk in chunks], [2, 2, 1])
+        self.assertEqual([chunk["created"] for chunk in chunks], [1, 1, 1])
+        errors = [error for chunk in chunks for error in chunk["errors"]]
+        self.assertEqual([error["line"] for error in errors], [2, 5])
+        self.assertTrue(errors[0]["errors"]["non_field_errors"][0].startswith("Invalid JSON"))
+        self.assertIn("sex", errors[1]["errors"])
+
+        self.assertEqual(summary, {"success": False, "summary": {"rows": 5, "created": 3, "failed": 2}})
+        self.assertEqual(
+            list(Patient.objects.order_by('id').values_list('first_name', flat=True)), ["Ava", "Ben", "Cy"]
+        )
+        self.assertEqual(chunks[0]["first_id"], Patient.objects.get(first_name="Ava").id)
+
+    def test_csv(self):
+        body = (
+            "first_name,last_name,dob,sex,ethnic_background\n"
+            "Ava,Kim,1990-01-01,female,Korean\n"
+            "Ben,Ode,1985-05-05,male,Yoruba,extra\n"
+            "Cy,Lund,not-a-date,other,Swedish\n"
+        )
+        *chunks, summary = self.upload(body, 'text/csv')
+        errors = [error for chunk in chunks for error in chunk["errors"]]
+        # Line numbers count the header
+        self.assertEqual([error["line"] for error in errors], [3, 4])
+        self.assertEqual(errors[0]["errors"], {"non_field_errors": ["Too many columns"]})
+        self.assertIn("dob", errors[1]["errors"])
+        self.assertEqual(summary["summary"], {"rows": 3, "created": 1, "failed": 2})
+        self.assertEqual(Patient.objects.get().first_name, "Ava")
+
+    def test_clean_upload(self):
+        *_, summary = self.upload(json.dumps(PATIENT) + '\n', 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(summary, {"success": True, "summary": {"rows": 1, "created": 1, "failed": 0}})
+
+    def test_unsupported_content_type(self):
+        response = self.client.post('/api/patients/import', [PATIENT], content_type='application/json')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Patient.objects.exists())
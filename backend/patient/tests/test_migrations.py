@@ -0,0 +1,89 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from patient.series import unpack_results
+from patient.units import metric_key
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+RESULTS = [[0, 1.5], [30, 2.25], [60, 1.0]]
+
+
+class DataMigrationTests(TransactionTestCase):
+    """
+    0006-0010 on a database that has the duplicates they clean up
+    """
+    migrate_from = ('patient', '0005_processjob')
+    migrate_to = ('patient', '0010_patient_updated_at')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def setUp(self):
+        self.latest = MigrationExecutor(connection).loader.graph.leaf_nodes('patient')[0]
+        self.addCleanup(self.migrate, self.latest)
+        apps = self.migrate(self.migrate_from)
+        Patient = apps.get_model('patient', 'Patient')
+        PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+        ProcessJob = apps.get_model('patient', 'ProcessJob')
+
+        # Same natural key, still two people as far as the data knows
+        self.patient, self.twin = Patient.objects.create(**PATIENT), Patient.objects.create(**PATIENT)
+
+        def metrics(patient, weight, weight_unit, results=RESULTS):
+            return PatientMetrics.objects.create(
+                patient=patient, weight_value=weight, weight_unit=weight_unit,
+                height_value=1.8, height_unit='m', results=results
+            )
+
+        self.kept = metrics(self.patient, 70, 'kg')
+        # Exact duplicate (0006), same request in pounds (0007)
+        self.exact = metrics(self.patient, 70, 'kg')
+        self.pounds = metrics(self.patient, 154.32, 'lb')
+        self.other = metrics(self.patient, 80, 'kg', results=None)
+        self.twin_metrics = metrics(self.twin, 70, 'kg')
+
+        def job(metrics):
+            return ProcessJob.objects.create(
+                patient_id=metrics.patient_id, metrics=metrics, status='done',
+                weight_value=metrics.weight_value, weight_unit=metrics.weight_unit, height_value=1.8
+            )
+
+        self.jobs = [job(self.exact), job(self.pounds), job(self.other)]
+
+    def test_duplicates_merged_and_results_packed(self):
+        apps = self.migrate(self.migrate_to)
+        Patient = apps.get_model('patient', 'Patient')
+        PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+        ProcessJob = apps.get_model('patient', 'ProcessJob')
+
+        self.assertEqual(
+            set(PatientMetrics.objects.values_list('id', flat=True)),
+            {self.kept.id, self.other.id, self.twin_metrics.id}
+        )
+        # Jobs follow the row they were merged into
+        self.assertEqual(
+            [ProcessJob.objects.get(id=job.id).metrics_id for job in self.jobs],
+            [self.kept.id, self.kept.id, self.other.id]
+        )
+
+        kept = PatientMetrics.objects.get(id=self.kept.id)
+        self.assertEqual(kept.metric_key, metric_key(70, 'kg', 1.8, 'm'))
+        self.assertEqual(kept.metric_key, metric_key(154.32, 'lb', 1.8, 'm'))
+        self.assertEqual(unpack_results(kept.results_packed).pairs(), RESULTS)
+        self.assertIsNone(PatientMetrics.objects.get(id=self.other.id).results_packed)
+
+        # Patients are never merged, only their metrics
+        self.assertEqual(Patient.objects.count(), 2)
+        for patient in Patient.objects.all():
+            self.assertEqual(patient.updated_at, patient.created_at)
+
+    def test_reverse_restores_json_results(self):
+        self.migrate(self.migrate_to)
+        apps = self.migrate(self.migrate_from)
+        PatientMetrics = apps.get_model('patient', 'PatientMetrics')
+        self.assertEqual(PatientMetrics.objects.get(id=self.kept.id).results, RESULTS)
+        self.assertIsNone(PatientMetrics.objects.get(id=self.other.id).results)
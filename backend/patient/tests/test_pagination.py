@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from patient.models import Patient
+from patient.pagination import decode_cursor, encode_cursor
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [patient.id for patient in Patient.objects.bulk_create(Patient(**PATIENT) for _ in range(20))]
+
+    def setUp(self):
+        cache.clear()
+
+    def page(self, cursor):
+        response = self.client.get('/api/patients', {"cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["series"]["result"]
+
+    def test_pages_follow_each_other(self):
+        first = self.page('')
+        self.assertEqual(first["page_size"], 15)
+        self.assertEqual([patient["id"] for patient in first["patients"]], self.ids[:15])
+        self.assertNotIn("total_count", first)
+
+        last = self.page(first["next_cursor"])
+        self.assertEqual([patient["id"] for patient in last["patients"]], self.ids[15:])
+        self.assertIsNone(last["next_cursor"])
+
+    def test_cursor_past_deleted_rows(self):
+        # Keyset: the id still orders the rest once its row is gone
+        Patient.objects.filter(id__in=self.ids[10:16]).delete()
+        result = self.page(encode_cursor(self.ids[12]))
+        self.assertEqual([patient["id"] for patient in result["patients"]], self.ids[16:])
+
+    def test_round_trip(self):
+        self.assertIsNone(decode_cursor(''))
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+
+    def test_bad_cursor(self):
+        for cursor in ('not-a-cursor', encode_cursor(-1), 'eyJ4IjoxfQ'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/patients', {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["series"]["result"]["errors"], {"cursor": ["Invalid cursor"]})
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from patient.async_views import AsyncPatientView
+from patient.models import Patient, PatientMetrics
+from patient.pagination import encode_cursor
+from patient.views import PatientView
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+URLCONFS = ('patient.tests.sync_urls', 'patient.tests.async_urls')
+PAGE_SIZES = (5, 20)
+
+
+class IncludeMetricsQueryCountTests(TestCase):
+    """
+    ?include=metrics costs one query per page, whatever its size, on top of the
+    page's own: a cold page is the same number of queries at any page size, a
+    cached one is just the metrics query
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Patient.objects.bulk_create(Patient(**PATIENT) for _ in range(45))
+        metrics = []
+        # Two metrics each, 71 kg the latest, but for every third patient, never processed
+        for patient in cls.patients:
+            if patient.id % 3:
+                for weight in (70, 71):
+                    row = PatientMetrics(
+                        patient=patient, weight_value=weight, weight_unit='kg', height_value=1.8, height_unit='m'
+                    )
+                    row.metric_key = row.build_metric_key()
+                    metrics.append(row)
+        PatientMetrics.objects.bulk_create(metrics)
+
+    def setUp(self):
+        cache.clear()
+
+    def check_list(self, path, size, cold_queries):
+        for urlconf in URLCONFS:
+            with self.subTest(urlconf=urlconf, size=size), override_settings(ROOT_URLCONF=urlconf):
+                cache.clear()
+                with self.assertNumQueries(cold_queries):
+                    response = self.client.get(path)
+                patients = response.json()["series"]["result"]["patients"]
+                self.assertEqual(len(patients), size)
+                for patient in patients:
+                    latest = patient["latest_metrics"]
+                    if patient["id"] % 3:
+                        self.assertEqual(latest["weight"], {"value": 71, "unit": "kg"})
+                    else:
+                        self.assertIsNone(latest)
+                # The page is cached, its metrics are not
+                with self.assertNumQueries(1):
+                    self.client.get(path)
+
+    def test_list_pages(self):
+        # Page rows, COUNT, latest metrics
+        for size in PAGE_SIZES:
+            with mock.patch.object(PatientView, 'page_size', size), \
+                    mock.patch.object(AsyncPatientView, 'page_size', size):
+                self.check_list('/api/patients?include=metrics&page=2', size, 3)
+
+    def test_list_cursor_pages(self):
+        # Page rows, latest metrics
+        cursor = encode_cursor(self.patients[1].id)
+        for size in PAGE_SIZES:
+            with mock.patch.object(PatientView, 'page_size', size), \
+                    mock.patch.object(AsyncPatientView, 'page_size', size):
+                self.check_list('/api/patients?include=metrics&cursor=', size, 2)
+                self.check_list(f'/api/patients?include=metrics&cursor={cursor}', size, 2)
+
+    def test_detail(self):
+        processed = next(patient for patient in self.patients if patient.id % 3)
+        never_processed = next(patient for patient in self.patients if not patient.id % 3)
+        for patient, expected in ((processed, True), (never_processed, False)):
+            for urlconf in URLCONFS:
+                with self.subTest(urlconf=urlconf, patient=patient.id), override_settings(ROOT_URLCONF=urlconf):
+                    cache.clear()
+                    path = f'/api/patients/{patient.id}?include=metrics'
+                    # Patient row, latest metrics
+                    with self.assertNumQueries(2):
+                        response = self.client.get(path)
+                    latest = response.json()["series"]["result"]["patient"]["latest_metrics"]
+                    self.assertEqual(latest is not None, expected)
+                    with self.assertNumQueries(1):
+                        self.client.get(path)
@@ -0,0 +1,87 @@
+import datetime
+import json
+import uuid
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from patient.models import Patient, PatientMetrics, ProcessJob
+from patient.renderers import FastJSONRenderer
+from patient.stub_upstream import concentration_series
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+@override_settings(PATIENT_FAST_JSON=True)
+class FastJSONRendererTests(TestCase):
+    """
+    FastJSONRenderer must produce the stdlib renderer's bytes, or fail the same way
+    """
+
+    def assertSameRendering(self, data):
+        try:
+            expected = JSONRenderer().render(data)
+        except ValueError:
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+            return
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_floats(self):
+        values = [
+            0.0, -0.0, 0.1, 1.5, 123.456, 1e-4, 1e-5, -1e-5, 0.00001234, 10.00001, 2.5e-10,
+            1e15, 1e16, -1.5e16, 123456789012345678.0, 1e22, 5e-324, 1.7976931348623157e308,
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertSameRendering({"value": value, "series": [[1, value]]})
+
+    def test_nonfinite_floats_are_rejected(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value=value):
+                self.assertSameRendering({"value": value, "missing": None})
+
+    def test_other_types(self):
+        self.assertSameRendering({
+            "created_at": datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+            "naive": datetime.datetime(2024, 1, 2, 3, 4, 5),
+            "dob": datetime.date(1990, 1, 1),
+            "id": uuid.UUID(int=1),
+            "text": "1e5 0.00001  ",
+            "none": None,
+            "flag": True,
+        })
+
+    def test_api_payloads(self):
+        cache.clear()
+        patient = Patient.objects.create(**PATIENT)
+        other = Patient.objects.create(**{**PATIENT, "first_name": "Noah"})
+        # A curve sampled down to the tail, where concentrations need an exponent
+        results = concentration_series({"value": 70, "unit": "kg"}, {"value": 1.8, "unit": "m"})
+        results += [[49, 3.2e-05], [50, 4e-07]]
+        metrics = PatientMetrics.objects.create(
+            patient=patient, weight_value=70, weight_unit='kg', height_value=1.8, height_unit='m', results=results
+        )
+        PatientMetrics.objects.create(
+            patient=other, weight_value=80, weight_unit='kg', height_value=1.7, height_unit='m',
+            results=concentration_series({"value": 80, "unit": "kg"}, {"value": 1.7, "unit": "m"}),
+        )
+        job = ProcessJob.objects.create(
+            patient=patient, weight_value=70, height_value=1.8, status=ProcessJob.DONE, metrics=metrics
+        )
+
+        for url in (
+            '/api/patients',
+            '/api/patients?include=metrics',
+            f'/api/patients/{patient.id}?include=metrics',
+            f'/api/patients/{other.id}?include=metrics',
+            f'/api/process-jobs/{job.id}',
+            '/api/analytics/pk',
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                # The async views (PATIENT_ASYNC_VIEWS) send rendered bytes, no data
+                data = response.data if hasattr(response, 'data') else json.loads(response.content)
+                self.assertEqual(response.content, JSONRenderer().render(data))
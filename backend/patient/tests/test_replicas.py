@@ -0,0 +1,96 @@
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+
+from patient import routers
+from patient.models import Patient
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+REPLICA = 'replica_test'
+
+
+def add_mirror(alias):
+    """
+    Register `alias` as a second connection to the test database, as DATABASES does
+    for a replica with TEST MIRROR set to `default`
+    """
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict
+    connections.settings[alias] = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': DEFAULT_DB_ALIAS}}
+
+
+def remove_mirror(alias):
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
+
+
+@override_settings(PATIENT_READ_REPLICAS=[REPLICA], DATABASE_ROUTERS=['patient.routers.ReadReplicaRouter'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Which connection the patient queries of each endpoint run on. The replica alias
+    mirrors the test database, over a connection of its own.
+    """
+    # Resolved in setUpClass, once the mirror exists
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        add_mirror(REPLICA)
+        cls.addClassCleanup(remove_mirror, REPLICA)
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.patient = Patient.objects.create(**PATIENT)
+
+    def patient_queries(self, method, *args, **kwargs):
+        """
+        Make the request; returns the response and the aliases its patient queries ran on
+        """
+        aliases = []
+
+        def wrapper(alias):
+            def record(execute, sql, params, many, context):
+                if 'patient_patient' in sql:
+                    aliases.append(alias)
+                return execute(sql, params, many, context)
+            return record
+
+        with ExitStack() as stack:
+            for alias in (DEFAULT_DB_ALIAS, REPLICA):
+                stack.enter_context(connections[alias].execute_wrapper(wrapper(alias)))
+            response = method(*args, **kwargs)
+        return response, set(aliases)
+
+    def test_list_and_detail_read_from_the_replica(self):
+        response, aliases = self.patient_queries(self.client.get, '/api/patients')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {REPLICA})
+
+        response, aliases = self.patient_queries(self.client.get, f'/api/patients/{self.patient.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {REPLICA})
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        response, aliases = self.patient_queries(
+            self.client.post, '/api/patients', PATIENT, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        patient_id = response.json()["series"]["result"]["patient"]["id"]
+
+        # The test client sends the cookie back: this client reads its write from the primary
+        cache.clear()
+        for path in ('/api/patients', f'/api/patients/{patient_id}'):
+            with self.subTest(path=path):
+                response, aliases = self.patient_queries(self.client.get, path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+
+    def test_failed_writes_dont_pin(self):
+        response = self.client.post('/api/patients', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from patient.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def run_concurrently(self, flight, key, fn, callers=8):
+        """
+        Start `callers` calls, let fn finish once all of them are waiting; returns their outcomes
+        """
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            futures = [executor.submit(flight.do, key, fn) for _ in range(callers)]
+            while not all(future.running() for future in futures):
+                time.sleep(0.001)
+            # Time for the followers to get from do() to waiting on the leader
+            time.sleep(0.1)
+            self.release.set()
+        outcomes = []
+        for future in futures:
+            error = future.exception()
+            outcomes.append(error if error is not None else future.result())
+        return outcomes
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight()
+        outcomes = self.run_concurrently(flight, 'key', self.slow(result={"id": 1}))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [{"id": 1}] * 8)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_reaches_every_caller(self):
+        flight = SingleFlight()
+        error = ValueError("upstream down")
+        outcomes = self.run_concurrently(flight, 'key', self.slow(error=error))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+    def test_calls_after_completion_run_again(self):
+        flight = SingleFlight()
+        self.release.set()
+        flight.do('key', self.slow(result=1))
+        flight.do('key', self.slow(result=2))
+        flight.do('other', self.slow(result=3))
+        self.assertEqual(self.calls, 3)
+
+    def test_async_followers_await_the_leader(self):
+        flight = AsyncSingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        async def main():
+            return await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [1] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(flight.in_flight(), 0)
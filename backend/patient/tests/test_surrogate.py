@@ -0,0 +1,131 @@
+from io import StringIO
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from patient import telemetry, upstream
+from patient.models import Patient, PatientMetrics
+from patient.stub_upstream import StubUpstreamServer, concentration_series
+from patient.surrogate import SurrogateTable
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+URLCONFS = ('patient.tests.sync_urls', 'patient.tests.async_urls')
+
+
+class SurrogateTableTests(SimpleTestCase):
+
+    def setUp(self):
+        # As build_table makes it: (durations, concentrations) per (kg, m)
+        self.table = SurrogateTable({
+            (70.0, 1.7): ([1, 2], np.array([1.0, 2.0])),
+            (70.0, 1.9): ([1, 2], np.array([3.0, 4.0])),
+            (80.0, 1.7): ([1, 2], np.array([5.0, 6.0])),
+            (80.0, 1.9): ([1, 2], np.array([7.0, 8.0])),
+            (90.0, 1.8): ([1, 2, 3], np.array([1.0, 1.0, 1.0])),
+        })
+
+    def concentrations(self, weight, height):
+        return [round(value, 9) for value in self.table.estimate(weight, height).concentrations]
+
+    def test_stored_point(self):
+        self.assertEqual(self.concentrations(80.0, 1.9), [7.0, 8.0])
+
+    def test_interpolates_in_height_then_weight(self):
+        self.assertEqual(self.concentrations(70.0, 1.8), [2.0, 3.0])
+        self.assertEqual(self.concentrations(75.0, 1.7), [3.0, 4.0])
+        self.assertEqual(self.concentrations(75.0, 1.8), [4.0, 5.0])
+
+    def test_never_extrapolates(self):
+        for weight, height in ((65.0, 1.8), (75.0, 2.0), (95.0, 1.8)):
+            with self.subTest(weight=weight, height=height):
+                self.assertIsNone(self.table.estimate(weight, height))
+
+    def test_differently_sampled_neighbours(self):
+        # Between 80 and 90 kg at 1.8 m the series don't line up
+        self.assertIsNone(self.table.estimate(85.0, 1.8))
+
+
+@override_settings(
+    PATIENT_PROCESS_API_HEDGE=False,
+    PATIENT_BREAKER_ENABLED=False,
+    PATIENT_PROCESS_API_RETRIES=0,
+    PATIENT_PROCESS_GLOBAL_THROTTLE=None,
+    PATIENT_SURROGATE_ENABLED=True,
+    PATIENT_SURROGATE_AFTER=0,
+)
+class SurrogateResponseTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        telemetry.reset()
+        stub = StubUpstreamServer().__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        self.enterContext(override_settings(PATIENT_PROCESS_API_URL=stub.url_template))
+        upstream.reset_session()
+        self.stub = stub
+        self.patient = Patient.objects.create(**PATIENT)
+
+    def warm(self, *args):
+        out = StringIO()
+        call_command('warm_metrics', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def process(self, weight, height):
+        return self.client.post(
+            f'/api/patients/{self.patient.id}/process',
+            {"weight": weight, "height": height}, content_type='application/json'
+        )
+
+    def test_warm_metrics_grid(self):
+        output = self.warm('--weights', '60:80:10', '--heights', '170,190', '--height-unit', 'cm')
+        self.assertIn("6 weight/height combination(s) x 1 patient(s) = 6 request(s)", output)
+        self.assertIn("surrogate table: 6 weight/height point(s)", output)
+        self.assertEqual(PatientMetrics.objects.count(), 6)
+        self.assertEqual(self.stub.requests, 6)
+
+        # Stored combinations are skipped, however they are written
+        output = self.warm('--weights', '60', '--heights', '1.7', '--observed')
+        self.assertIn("0 fetched, 6 already stored", output)
+        self.assertEqual(self.stub.requests, 6)
+
+    def test_warm_metrics_dry_run_and_bad_arguments(self):
+        self.assertIn("= 2 request(s)", self.warm('--weights', '60,70', '--heights', '1.7', '--dry-run'))
+        self.assertFalse(PatientMetrics.objects.exists())
+        for args in (('--weights', '60'), ('--weights', '80:60:10', '--heights', '1.7'), ()):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.warm(*args)
+
+    def test_estimate_when_the_api_fails(self):
+        self.warm('--weights', '70,80', '--heights', '1.7,1.9')
+        stored = PatientMetrics.objects.count()
+        self.stub.fail_status = 503
+
+        for urlconf in URLCONFS:
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                response = self.process({"value": 75, "unit": "kg"}, {"value": 180, "unit": "cm"})
+                self.assertEqual(response.status_code, 200)
+                body = response.json()
+                self.assertTrue(body["approximate"])
+                self.assertEqual(body["patient"]["height"], {"value": 180, "unit": "cm"})
+                # The stub's curve is smooth: close to the exact answer
+                exact = concentration_series({"value": 75, "unit": "kg"}, {"value": 1.8, "unit": "m"})
+                self.assertEqual(len(body["results"]), len(exact))
+                for point, (_, concentration) in zip(body["results"], exact):
+                    self.assertAlmostEqual(point["concentration"], concentration, delta=0.05 * concentration)
+
+                # Nothing to interpolate from: the failure stands
+                self.assertEqual(self.process({"value": 100, "unit": "kg"}, {"value": 1.8, "unit": "m"}).status_code, 503)
+
+        # Estimates are never stored
+        self.assertEqual(PatientMetrics.objects.count(), stored)
+        counters = {tuple(labels): value for name, labels, value in telemetry.snapshot()["counters"]
+                    if name == 'patient_surrogate_responses_total'}
+        self.assertEqual(counters, {(('reason', 'error'),): 2})
+
+    @override_settings(PATIENT_SURROGATE_ENABLED=False)
+    def test_disabled(self):
+        self.warm('--weights', '70,80', '--heights', '1.8')
+        self.stub.fail_status = 503
+        self.assertEqual(self.process({"value": 75, "unit": "kg"}, {"value": 1.8, "unit": "m"}).status_code, 503)
@@ -0,0 +1,98 @@
+import asyncio
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, override_settings
+
+from patient import telemetry
+from patient.middleware import time_query
+from patient.models import Patient
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+
+
+def observed(name, route):
+    """
+    (sum, count) of a histogram for one route, all other labels summed
+    """
+    total = count = 0
+    for histogram_name, labels, _, histogram_total, histogram_count in telemetry.snapshot()["histograms"]:
+        if histogram_name == name and ('route', route) in labels:
+            total += histogram_total
+            count += histogram_count
+    return total, count
+
+
+@override_settings(PATIENT_TELEMETRY_ENABLED=True, PATIENT_TELEMETRY_DIR='')
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        telemetry.reset()
+        Patient.objects.create(**PATIENT)
+
+    def test_counts_the_queries_of_a_request(self):
+        self.client.get('/api/patients')
+        queries, requests = observed('patient_db_queries_per_request', 'api/patients')
+        self.assertEqual(requests, 1)
+        self.assertGreater(queries, 0)
+
+    def test_connections_of_other_threads_are_timed(self):
+        # As the threads sync_to_async runs the ORM in under ASGI
+        wrappers = []
+
+        def connect():
+            connection = connections[DEFAULT_DB_ALIAS]
+            connection.ensure_connection()
+            wrappers.extend(connection.execute_wrappers)
+            connection.close()
+
+        thread = threading.Thread(target=connect)
+        thread.start()
+        thread.join()
+        self.assertIn(time_query, wrappers)
+
+    def test_streaming_responses_are_recorded_when_the_stream_ends(self):
+        response = self.client.get('/api/patients/export')
+        # The export query runs while the body streams
+        self.assertEqual(observed('patient_db_queries_per_request', 'api/patients/export'), (0, 0))
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'"Ava"', body)
+        queries, requests = observed('patient_db_queries_per_request', 'api/patients/export')
+        self.assertEqual(requests, 1)
+        self.assertGreater(queries, 0)
+
+
+@override_settings(PATIENT_TELEMETRY_ENABLED=True, ROOT_URLCONF='patient.tests.async_urls')
+class AsyncInstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        telemetry.reset()
+        Patient.objects.create(**PATIENT)
+
+    async def test_counts_the_queries_of_a_request(self):
+        with override_settings(PATIENT_TELEMETRY_DIR=''):
+            await self.async_client.get('/api/patients')
+        queries, requests = observed('patient_db_queries_per_request', 'api/patients')
+        self.assertEqual(requests, 1)
+        self.assertGreater(queries, 0)
+
+    async def test_flush_runs_off_the_event_loop(self):
+        where = []
+
+        def flush(force=False):
+            try:
+                asyncio.get_running_loop()
+                where.append('event loop')
+            except RuntimeError:
+                where.append('thread')
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PATIENT_TELEMETRY_DIR=directory, PATIENT_TELEMETRY_FLUSH_INTERVAL=0), \
+                mock.patch.object(telemetry, 'flush', flush):
+            await self.async_client.get('/api/patients')
+        self.assertEqual(where, ['thread'])
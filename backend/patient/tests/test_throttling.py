@@ -0,0 +1,174 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from patient import throttling, upstream
+from patient.batch import process_batch
+from patient.models import Patient
+from patient.stub_upstream import StubUpstreamServer
+from patient.throttling import MICROSECONDS, CacheBucketStore, DatabaseBucketStore, parse_rate
+
+PATIENT = {"first_name": "Ava", "last_name": "Kim", "dob": "1990-01-01", "sex": "female", "ethnic_background": "Korean"}
+NOW = 1_700_000_000 * MICROSECONDS
+
+
+def item(patient, weight):
+    return {"patient_id": patient.id, "weight": {"value": weight, "unit": "kg"}, "height": {"value": 1.8, "unit": "m"}}
+
+
+class BucketStoreTests(TestCase):
+    """
+    GCRA on both stores: 5/min is a burst of 5, then one every 12 s
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.interval, self.period = parse_rate('5/min')
+
+    def check_gcra(self, store):
+        for _ in range(5):
+            self.assertEqual(store.consume('key', self.interval, self.period, NOW), 0)
+        # Full: the wait is exact
+        self.assertEqual(store.consume('key', self.interval, self.period, NOW), 12 * MICROSECONDS)
+        self.assertEqual(store.consume('key', self.interval, self.period, NOW + 5 * MICROSECONDS), 7 * MICROSECONDS)
+        self.assertEqual(store.consume('key', self.interval, self.period, NOW + 12 * MICROSECONDS), 0)
+        # Other keys have their own bucket
+        self.assertEqual(store.consume('other', self.interval, self.period, NOW), 0)
+        # Idle for longer than the period: a full burst again, not more
+        later = NOW + 3600 * MICROSECONDS
+        allowed = sum(store.consume('key', self.interval, self.period, later) == 0 for _ in range(7))
+        self.assertEqual(allowed, 5)
+
+    def test_cache_store(self):
+        self.check_gcra(CacheBucketStore('default'))
+
+    def test_database_store(self):
+        self.check_gcra(DatabaseBucketStore())
+
+    def test_several_slots_at_once(self):
+        store = CacheBucketStore('default')
+        self.assertEqual(store.consume('key', 3 * self.interval, self.period, NOW), 0)
+        self.assertGreater(store.consume('key', 3 * self.interval, self.period, NOW), 0)
+        self.assertEqual(store.consume('key', 2 * self.interval, self.period, NOW), 0)
+
+    def test_refund(self):
+        store = CacheBucketStore('default')
+        for _ in range(5):
+            store.consume('key', self.interval, self.period, NOW)
+        store.refund('key', self.interval)
+        self.assertEqual(store.consume('key', self.interval, self.period, NOW), 0)
+
+    def test_cache_store_concurrent_requests(self):
+        """
+        Requests racing on one bucket, idle or not, never get more than the burst
+        """
+        store = CacheBucketStore('default')
+        for key, stored in (('fresh', None), ('idle', NOW - 3600 * MICROSECONDS)):
+            with self.subTest(key=key):
+                if stored is not None:
+                    cache.set(key, stored)
+                results = []
+                threads = [
+                    threading.Thread(target=lambda: results.append(
+                        store.consume(key, self.interval, self.period, NOW)
+                    ))
+                    for _ in range(20)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(results.count(0), 5)
+
+
+@override_settings(
+    PATIENT_PROCESS_API_HEDGE=False,
+    PATIENT_BREAKER_ENABLED=False,
+    PATIENT_PROCESS_GLOBAL_THROTTLE=None,
+)
+class ProcessThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        stub = StubUpstreamServer().__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        self.enterContext(override_settings(PATIENT_PROCESS_API_URL=stub.url_template))
+        upstream.reset_session()
+        self.stub = stub
+        self.patients = [Patient.objects.create(**PATIENT) for _ in range(5)]
+        # DRF reads its rates once per class
+        self.enterContext(mock.patch(
+            'patient.views.PatientProcessRateThrottle.THROTTLE_RATES', {'patient_process': '3/min'}
+        ))
+
+    def process(self, patient, weight):
+        return self.client.post(
+            f'/api/patients/{patient.id}/process',
+            {"weight": {"value": weight, "unit": "kg"}, "height": {"value": 1.8, "unit": "m"}},
+            content_type='application/json'
+        )
+
+    def batch(self, items):
+        return self.client.post('/api/patients/process/batch', items, content_type='application/json')
+
+    def test_process_burst_then_exact_retry_after(self):
+        for weight in (70, 71, 72):
+            self.assertEqual(self.process(self.patients[0], weight).status_code, 200)
+        response = self.process(self.patients[0], 73)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+    def test_batch_pays_per_upstream_call(self):
+        response = self.batch([item(patient, 70) for patient in self.patients[:2]])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stub.requests, 2)
+        # Stored metrics are free
+        response = self.batch([item(patient, 70) for patient in self.patients[:2]])
+        self.assertEqual(response.json()["summary"]["cached"], 2)
+        # Two more calls than the one slot left: refused whole, nothing called
+        response = self.batch([item(patient, 71) for patient in self.patients[:2]])
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(self.batch([item(self.patients[0], 71)]).status_code, 200)
+
+    def test_batch_above_the_burst_never_fits(self):
+        response = self.batch([item(patient, 70) for patient in self.patients])
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('Retry-After', response)
+        self.assertIn("at most 3", response.json()["detail"])
+
+
+@override_settings(PATIENT_PROCESS_API_HEDGE=False, PATIENT_BREAKER_ENABLED=False)
+class UpstreamBudgetTests(TestCase):
+    """
+    PATIENT_PROCESS_GLOBAL_THROTTLE is charged per external call, whoever makes it
+    """
+
+    def setUp(self):
+        cache.clear()
+        stub = StubUpstreamServer().__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        self.enterContext(override_settings(PATIENT_PROCESS_API_URL=stub.url_template))
+        upstream.reset_session()
+        self.stub = stub
+        self.patients = [Patient.objects.create(**PATIENT) for _ in range(5)]
+
+    @override_settings(PATIENT_PROCESS_GLOBAL_THROTTLE='3/min')
+    def test_batch_calls_are_charged_one_by_one(self):
+        reports = process_batch([item(patient, 70) for patient in self.patients])
+        self.assertEqual([report["success"] for report in reports].count(True), 3)
+        self.assertEqual({report.get("status") for report in reports if not report["success"]}, {429})
+        self.assertEqual(self.stub.requests, 3)
+
+    @override_settings(PATIENT_PROCESS_GLOBAL_THROTTLE='600/min')
+    def test_background_callers_wait_for_the_budget(self):
+        # Spent until 0.1 s from now
+        cache.set(throttling.UPSTREAM_BUDGET_KEY, int(time.time() * MICROSECONDS) + 60 * MICROSECONDS)
+        with throttling.wait_for_budget(5):
+            reports = process_batch([item(patient, 70) for patient in self.patients])
+        self.assertTrue(all(report["success"] for report in reports))
+        self.assertEqual(self.stub.requests, 5)
@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+
+from patient import upstream
+from patient.processing import ProcessingError, call_upstream
+from patient.stub_upstream import StubUpstreamServer
+
+WEIGHT = {"value": 70, "unit": "kg"}
+HEIGHT = {"value": 1.8, "unit": "m"}
+
+
+@override_settings(
+    PATIENT_PROCESS_API_HEDGE=False,
+    PATIENT_PROCESS_API_RETRIES=2,
+    PATIENT_PROCESS_API_BACKOFF=0,
+    PATIENT_BREAKER_ENABLED=False,
+    PATIENT_PROCESS_GLOBAL_THROTTLE=None,
+)
+class UpstreamClientTests(SimpleTestCase):
+    """
+    The pooled external API client against the local stub server
+    """
+
+    def start_stub(self, **options):
+        stub = StubUpstreamServer(**options).__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        self.enterContext(override_settings(PATIENT_PROCESS_API_URL=stub.url_template))
+        # A fresh session per test, so connection counts start at 0
+        upstream.reset_session()
+        self.addCleanup(upstream.reset_session)
+        cache.clear()
+        return stub
+
+    def test_session_reuses_one_connection(self):
+        stub = self.start_stub()
+        for pk in range(1, 6):
+            fields = call_upstream(pk, WEIGHT, HEIGHT)
+            self.assertEqual(fields["weight_value"], 70)
+            self.assertIsNotNone(fields["results_packed"])
+
+        self.assertEqual((stub.requests, stub.connections), (5, 1))
+        stats = upstream.pool_stats()
+        self.assertEqual(stats["connections_reused"], 4)
+        self.assertEqual(stats["calls"], 5)
+
+    def test_retries_gateway_errors(self):
+        for fail_status in (502, 503, 504):
+            with self.subTest(status=fail_status):
+                stub = self.start_stub(fail_status=fail_status, fail_first=2)
+                fields = call_upstream(1, WEIGHT, HEIGHT)
+                self.assertEqual(fields["weight_value"], 70)
+                self.assertEqual(stub.requests, 3)
+
+    def test_gives_up_after_the_retries(self):
+        stub = self.start_stub(fail_status=503)
+        with self.assertRaises(ProcessingError) as raised:
+            call_upstream(1, WEIGHT, HEIGHT)
+        self.assertEqual(raised.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(stub.requests, 3)
+
+    def test_client_errors_are_not_retried(self):
+        stub = self.start_stub(fail_status=400)
+        with self.assertRaises(ProcessingError):
+            call_upstream(1, WEIGHT, HEIGHT)
+        self.assertEqual(stub.requests, 1)
+
+    def test_read_timeout(self):
+        stub = self.start_stub(delay=0.5)
+        with override_settings(PATIENT_PROCESS_API_READ_TIMEOUT=0.1):
+            with self.assertRaises(ProcessingError) as raised:
+                call_upstream(1, WEIGHT, HEIGHT)
+        self.assertEqual(raised.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("timed out", str(raised.exception))
+        # A read that timed out isn't repeated, the API may still be working on it
+        self.assertEqual(stub.requests, 1)
+        self.assertEqual(upstream.pool_stats()["errors"], 1)
@@ -0,0 +1,218 @@
+"""
+GCRA (generic cell rate algorithm) throttling. Each key keeps a single number, its
+theoretical arrival time (TAT), in a store every worker shares, so a check is O(1),
+the limit holds across workers and nodes, and the wait until the next allowed
+request is exact. A rate of N/period admits a burst of N, then one every period/N.
+"""
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from rest_framework.throttling import UserRateThrottle
+
+from .models import ThrottleBucket
+from . import telemetry
+
+MICROSECONDS = 1000000
+# A TAT older than now reads as an idle bucket, so keys can outlive any period
+CACHE_KEY_TIMEOUT = 86400
+# Per-key lock of the cache store: held for one get/set, frees itself if its holder dies
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 100
+LOCK_SLEEP = 0.005
+UPSTREAM_BUDGET_KEY = 'gcra:throttle_patient_process_global_all'
+
+# Seconds an upstream call made in this context may wait for PATIENT_PROCESS_GLOBAL_THROTTLE,
+# 0 to fail at once, None to wait as long as it takes (see wait_for_budget)
+_budget_wait = ContextVar('patient_upstream_budget_wait', default=0)
+
+
+class BudgetExhausted(Exception):
+    """
+    PATIENT_PROCESS_GLOBAL_THROTTLE is spent; `retry_after` is the seconds until the next call
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"budget exhausted, retry in {math.ceil(retry_after)}s")
+        self.retry_after = retry_after
+
+
+class CacheBucketStore:
+    """
+    TATs in a Django cache. Each update is a get/set under a per-key lock taken with
+    add(), which is atomic on Redis, memcached and locmem, so concurrent requests never
+    overwrite each other's slot.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    @contextmanager
+    def locked(self, key):
+        """
+        Yields whether the lock was taken
+        """
+        lock_key = f'{key}:lock'
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock_key, 1, LOCK_TIMEOUT):
+                try:
+                    yield True
+                finally:
+                    self.cache.delete(lock_key)
+                return
+            time.sleep(LOCK_SLEEP)
+        yield False
+
+    def consume(self, key, interval, period, now):
+        """
+        Take `interval` of the bucket (one slot, or several at once); all arguments in
+        microseconds. Returns 0, or the wait when full.
+        """
+        with self.locked(key) as taken:
+            if not taken:
+                # Too contended to tell, turn the request away
+                return interval
+            tat = max(self.cache.get(key, 0), now)
+            wait = tat + interval - period - now
+            if wait > 0:
+                return wait
+            self.cache.set(key, tat + interval, CACHE_KEY_TIMEOUT)
+            return 0
+
+    def refund(self, key, interval):
+        with self.locked(key) as taken:
+            tat = self.cache.get(key) if taken else None
+            if tat is not None:
+                self.cache.set(key, tat - interval, CACHE_KEY_TIMEOUT)
+
+
+class DatabaseBucketStore:
+    """
+    TATs in the ThrottleBucket table: one conditional UPDATE per allowed request
+    """
+
+    def consume(self, key, interval, period, now):
+        # Allowed iff max(tat, now) + interval - period <= now, i.e. tat <= now + period - interval
+        if ThrottleBucket.objects.filter(key=key, tat__lte=now + period - interval).update(
+            tat=Greatest(F('tat'), Value(now)) + interval
+        ):
+            return 0
+        try:
+            with transaction.atomic():
+                ThrottleBucket.objects.create(key=key, tat=now + interval)
+            return 0
+        except IntegrityError:
+            pass
+        tat = ThrottleBucket.objects.filter(key=key).values_list('tat', flat=True).first()
+        if tat is None:
+            return 0
+        return max(tat + interval - period - now, 1)
+
+    def refund(self, key, interval):
+        ThrottleBucket.objects.filter(key=key).update(tat=F('tat') - interval)
+
+
+def get_store():
+    if settings.PATIENT_THROTTLE_BACKEND == 'db':
+        return DatabaseBucketStore()
+    return CacheBucketStore(settings.PATIENT_THROTTLE_CACHE)
+
+
+def parse_rate(rate):
+    """
+    (interval, period) in microseconds of an "N/period" rate, as DRF parses it
+    """
+    num_requests, duration = UserRateThrottle.parse_rate(None, rate)
+    period = duration * MICROSECONDS
+    return period // num_requests, period
+
+
+class GCRAThrottle(UserRateThrottle):
+    """
+    UserRateThrottle's rates and keys (user id, else client IP) on GCRA state in the
+    PATIENT_THROTTLE_BACKEND store. A request costs one slot, charge() takes several.
+    """
+    key_prefix = 'gcra:'
+
+    def __init__(self):
+        super().__init__()
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        return self.charge(request, view, 1)
+
+    def charge(self, request, view, cost):
+        """
+        Take `cost` slots at once, or none. More than the burst is never allowed,
+        and leaves wait() None.
+        """
+        self.wait_seconds = None
+        if self.rate is None or cost <= 0:
+            return True
+        if cost > self.num_requests:
+            return False
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        interval, period = parse_rate(self.rate)
+        wait = get_store().consume(self.key_prefix + key, interval * cost, period, int(time.time() * MICROSECONDS))
+        if wait:
+            self.wait_seconds = wait / MICROSECONDS
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def take_upstream_budget():
+    """
+    Charge one external API call to PATIENT_PROCESS_GLOBAL_THROTTLE, the budget every
+    caller shares (process views, batches, jobs, warm_metrics). Waits for a slot as
+    allowed by wait_for_budget, else raises BudgetExhausted. Returns the refund for
+    refund_upstream_budget, None without a budget.
+    """
+    if settings.PATIENT_PROCESS_GLOBAL_THROTTLE is None:
+        return None
+    store = get_store()
+    interval, period = parse_rate(settings.PATIENT_PROCESS_GLOBAL_THROTTLE)
+    max_wait = _budget_wait.get()
+    waited = 0
+    while True:
+        wait = store.consume(UPSTREAM_BUDGET_KEY, interval, period, int(time.time() * MICROSECONDS)) / MICROSECONDS
+        if not wait:
+            return store, interval
+        if max_wait is not None and waited + wait > max_wait:
+            telemetry.inc('patient_throttle_rejections_total', scope='patient_process_global')
+            raise BudgetExhausted(wait)
+        time.sleep(wait)
+        waited += wait
+
+
+def refund_upstream_budget(charge):
+    """
+    Give back a slot whose call was never made
+    """
+    if charge is not None:
+        store, interval = charge
+        store.refund(UPSTREAM_BUDGET_KEY, interval)
+
+
+@contextmanager
+def wait_for_budget(seconds=None):
+    """
+    Let the upstream calls made inside wait up to `seconds` (None: no limit) for the
+    global budget instead of failing at once; for background callers. Threads started
+    inside need the context copied (see batch.py).
+    """
+    token = _budget_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _budget_wait.reset(token)
@@ -0,0 +1,49 @@
+from django.conf import settings
+
+WEIGHT_TO_KG = {
+    'kg': 1.0,
+    'g': 0.001,
+    'mg': 0.000001,
+    'lb': 0.45359237,
+    'lbs': 0.45359237,
+    'oz': 0.028349523125,
+    'st': 6.35029318,
+}
+HEIGHT_TO_M = {
+    'm': 1.0,
+    'cm': 0.01,
+    'mm': 0.001,
+    'in': 0.0254,
+    'ft': 0.3048,
+}
+
+
+def to_si(value, unit, factors):
+    """
+    Convert to kg/m, or None when the unit is unknown
+    """
+    factor = factors.get(str(unit).strip().lower())
+    if factor is None or value is None:
+        return None
+    return float(value) * factor
+
+
+def _key_part(value, unit, factors, si_unit, precision):
+    si_value = to_si(value, unit, factors)
+    if si_value is None:
+        # Unknown unit (or legacy row without a value): only exact matches hit
+        return f"{value}{unit}"
+    return f"{si_value:.{precision}f}{si_unit}"
+
+
+def metric_key(weight_value, weight_unit, height_value, height_unit, precision=None):
+    """
+    Normalized lookup key for a process request: SI units rounded to
+    PATIENT_METRICS_KEY_PRECISION decimals, so 70 kg, 70.0 kg and 154.32 lb match.
+    """
+    if precision is None:
+        precision = settings.PATIENT_METRICS_KEY_PRECISION
+    return "|".join([
+        _key_part(weight_value, weight_unit, WEIGHT_TO_KG, 'kg', precision),
+        _key_part(height_value, height_unit, HEIGHT_TO_M, 'm', precision),
+    ])
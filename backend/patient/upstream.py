@@ -0,0 +1,337 @@
+"""
+Client for the external process API: one pooled keep-alive session per worker process,
+and one httpx.AsyncClient per event loop for the async views. Both go through the
+circuit breaker (see breaker.py) and, with PATIENT_PROCESS_API_HEDGE, send a second
+copy of a call still unanswered after this worker's p95 latency. Every call is charged
+to the PATIENT_PROCESS_GLOBAL_THROTTLE budget first (see throttling.py).
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import breaker, telemetry, throttling
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_stats = {"calls": 0, "errors": 0, "seconds": 0.0, "hedged": 0}
+# event loop -> AsyncClient; connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+RETRY_STATUSES = (502, 503, 504)
+# Latencies of this worker's recent successful calls, for the hedge delay
+_latencies = deque(maxlen=200)
+HEDGE_MIN_SAMPLES = 20
+_hedge_executor = None
+_hedge_executor_pid = None
+
+
+def build_session():
+    retry = Retry(
+        total=settings.PATIENT_PROCESS_API_RETRIES,
+        connect=settings.PATIENT_PROCESS_API_RETRIES,
+        read=0,
+        status=settings.PATIENT_PROCESS_API_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        # The process call is a pure computation, safe to repeat
+        allowed_methods=frozenset({'POST'}),
+        backoff_factor=settings.PATIENT_PROCESS_API_BACKOFF,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.PATIENT_PROCESS_API_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Shared session for this worker. Rebuilt after a fork so workers never share sockets.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = build_session()
+                _session_pid = pid
+                _stats.update(calls=0, errors=0, seconds=0.0, hedged=0)
+                _latencies.clear()
+    return _session
+
+
+def reset_session():
+    global _session, _session_pid
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+        _async_clients.clear()
+        _latencies.clear()
+    breaker.reset()
+
+
+def build_async_client():
+    pool_size = settings.PATIENT_PROCESS_API_POOL_SIZE
+    return httpx.AsyncClient(
+        # Connection errors are retried by the transport, 502/503/504 by apost_process
+        transport=httpx.AsyncHTTPTransport(
+            retries=settings.PATIENT_PROCESS_API_RETRIES,
+            verify=settings.PATIENT_PROCESS_API_VERIFY_TLS,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        ),
+        timeout=httpx.Timeout(
+            settings.PATIENT_PROCESS_API_READ_TIMEOUT,
+            connect=settings.PATIENT_PROCESS_API_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+def get_async_client():
+    """
+    Shared AsyncClient for the running event loop (one per worker under an ASGI server)
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+def process_url(pk):
+    return settings.PATIENT_PROCESS_API_URL.format(pk=pk)
+
+
+def hedge_delay():
+    """
+    Seconds to wait before hedging a call: the p95 of this worker's recent successful
+    calls (at least PATIENT_PROCESS_API_HEDGE_MIN_DELAY), None while hedging is off
+    or there are too few samples yet
+    """
+    if not settings.PATIENT_PROCESS_API_HEDGE:
+        return None
+    with _lock:
+        samples = sorted(_latencies)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    p95 = samples[math.ceil(0.95 * len(samples)) - 1]
+    return max(p95, settings.PATIENT_PROCESS_API_HEDGE_MIN_DELAY)
+
+
+def get_hedge_executor():
+    """
+    Per-worker threads the sync client runs hedged calls on
+    """
+    global _hedge_executor, _hedge_executor_pid
+    pid = os.getpid()
+    if _hedge_executor is None or _hedge_executor_pid != pid:
+        with _lock:
+            if _hedge_executor is None or _hedge_executor_pid != pid:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=settings.PATIENT_PROCESS_API_POOL_SIZE * 2,
+                    thread_name_prefix='upstream-hedge',
+                )
+                _hedge_executor_pid = pid
+    return _hedge_executor
+
+
+def count_hedge():
+    with _lock:
+        _stats["hedged"] += 1
+    telemetry.inc('patient_upstream_hedged_requests_total')
+
+
+def hedged(call, delay):
+    """
+    call() on a thread, and a second one if it hasn't returned after `delay` seconds.
+    The first to succeed wins (the other runs to completion unused), or the last error is raised.
+    """
+    executor = get_hedge_executor()
+    first = executor.submit(call)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    count_hedge()
+    pending, error = {first, executor.submit(call)}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def ahedged(call, delay):
+    """
+    hedged() for coroutines; the losing request is cancelled
+    """
+    tasks = {asyncio.ensure_future(call())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            count_hedge()
+            tasks.add(asyncio.ensure_future(call()))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def before_call():
+    """
+    Charge the global budget, then ask the breaker. Returns the breaker probe flag.
+    Raises throttling.BudgetExhausted or breaker.CircuitOpen.
+    """
+    charge = throttling.take_upstream_budget()
+    try:
+        return breaker.before_call()
+    except breaker.CircuitOpen:
+        # No call made, the slot goes back
+        throttling.refund_upstream_budget(charge)
+        raise
+
+
+def finish_call(started, outcome, probe):
+    """
+    Stats, telemetry and breaker bookkeeping for a call that got past the breaker.
+    `outcome` is the HTTP status of the answer used, 'error' when none came back.
+    """
+    elapsed = time.perf_counter() - started
+    ok = outcome != 'error' and int(outcome) < 500
+    with _lock:
+        _stats["calls"] += 1
+        _stats["seconds"] += elapsed
+        if not outcome.startswith('2'):
+            _stats["errors"] += 1
+        else:
+            _latencies.append(elapsed)
+    telemetry.observe('patient_upstream_request_duration_seconds', elapsed, status=outcome)
+    breaker.record(ok, probe)
+
+
+def post_process(pk, payload):
+    """
+    POST weight/height to the external API and return the decoded JSON.
+    Raises throttling.BudgetExhausted or breaker.CircuitOpen without calling,
+    requests.RequestException on transport/HTTP errors and ValueError on bad JSON.
+    """
+    session = get_session()
+    probe = before_call()
+
+    def send():
+        resp = session.post(
+            process_url(pk),
+            json=payload,
+            timeout=(settings.PATIENT_PROCESS_API_CONNECT_TIMEOUT, settings.PATIENT_PROCESS_API_READ_TIMEOUT),
+            verify=settings.PATIENT_PROCESS_API_VERIFY_TLS,
+        )
+        resp.raise_for_status()
+        return resp
+
+    started = time.perf_counter()
+    # HTTP status of the final attempt, 'error' when no response came back
+    outcome = 'error'
+    try:
+        delay = hedge_delay()
+        resp = send() if delay is None else hedged(send, delay)
+        outcome = str(resp.status_code)
+        return resp.json()
+    except requests.HTTPError as e:
+        outcome = str(e.response.status_code)
+        raise
+    finally:
+        finish_call(started, outcome, probe)
+
+
+async def apost_process(pk, payload):
+    """
+    Async post_process. Raises throttling.BudgetExhausted, breaker.CircuitOpen,
+    httpx.HTTPError on transport/HTTP errors and ValueError on bad JSON.
+    """
+    client = get_async_client()
+    probe = await sync_to_async(before_call)()
+    retries = settings.PATIENT_PROCESS_API_RETRIES
+
+    async def send():
+        for attempt in range(retries + 1):
+            resp = await client.post(process_url(pk), json=payload)
+            if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                break
+            # Same schedule as urllib3's Retry: no wait before the first retry, then doubling
+            if attempt:
+                await asyncio.sleep(settings.PATIENT_PROCESS_API_BACKOFF * 2 ** attempt)
+        resp.raise_for_status()
+        return resp
+
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        delay = hedge_delay()
+        resp = await (send() if delay is None else ahedged(send, delay))
+        outcome = str(resp.status_code)
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        outcome = str(e.response.status_code)
+        raise
+    finally:
+        finish_call(started, outcome, probe)
+
+
+def pool_stats():
+    """
+    Connection reuse for this worker: requests sent vs new connections opened
+    """
+    requests_sent = connections_opened = 0
+    session = _session
+    if session is not None and _session_pid == os.getpid():
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+
+    with _lock:
+        calls, errors, seconds, hedged_calls = _stats["calls"], _stats["errors"], _stats["seconds"], _stats["hedged"]
+    delay = hedge_delay()
+    return {
+        "pid": os.getpid(),
+        "calls": calls,
+        "errors": errors,
+        "hedged": hedged_calls,
+        "hedge_delay_ms": round(delay * 1000, 2) if delay is not None else None,
+        "avg_latency_ms": round(seconds / calls * 1000, 2) if calls else None,
+        "requests_sent": requests_sent,
+        "connections_opened": connections_opened,
+        "connections_reused": max(requests_sent - connections_opened, 0),
+        # Calls above include the async views', which use these clients instead of the session
+        "async_clients": len(_async_clients),
+    }
@@ -1,9 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from .views import PatientView,BulkAddPatientView,PatientDetailView,ProcessPatientView
+from .async_views import AsyncPatientView, AsyncPatientDetailView, AsyncProcessPatientView
+from .views import PatientView,BulkAddPatientView,UpsertPatientsView,BulkDeletePatientsView,ImportPatientsView,ExportPatientsView,PatientDetailView,ProcessPatientView,ProcessBatchView,ProcessJobView,UpstreamStatusView,TelemetryView,PKAnalyticsView
+
+# Async list/detail/process views, for ASGI servers
+ListView = AsyncPatientView if settings.PATIENT_ASYNC_VIEWS else PatientView
+DetailView = AsyncPatientDetailView if settings.PATIENT_ASYNC_VIEWS else PatientDetailView
+ProcessView = AsyncProcessPatientView if settings.PATIENT_ASYNC_VIEWS else ProcessPatientView
 
 urlpatterns = [
-    path('patients', PatientView.as_view(), name='patients'),
+    path('patients', ListView.as_view(), name='patients'),
     path('patients/bulk', BulkAddPatientView.as_view(), name='patientsBulk'),
-    path('patients/<int:pk>', PatientDetailView.as_view(), name='patient-detail'),
-    path('patients/<int:pk>/process', ProcessPatientView.as_view(), name='patient-process'),
+    path('patients/upsert', UpsertPatientsView.as_view(), name='patientsUpsert'),
+    path('patients/delete', BulkDeletePatientsView.as_view(), name='patientsBulkDelete'),
+    path('patients/import', ImportPatientsView.as_view(), name='patientsImport'),
+    path('patients/export', ExportPatientsView.as_view(), name='patientsExport'),
+    path('patients/<int:pk>', DetailView.as_view(), name='patient-detail'),
+    path('patients/<int:pk>/process', ProcessView.as_view(), name='patient-process'),
+    path('patients/process/batch', ProcessBatchView.as_view(), name='patient-process-batch'),
+    path('process-jobs/<int:pk>', ProcessJobView.as_view(), name='process-job'),
+    path('upstream', UpstreamStatusView.as_view(), name='upstream-status'),
+    path('metrics', TelemetryView.as_view(), name='metrics'),
+    path('analytics/pk', PKAnalyticsView.as_view(), name='analytics-pk'),
 ]
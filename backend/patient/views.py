@@ -1,51 +1,192 @@
 
-from django.utils.dateparse import parse_date
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import requests
+from rest_framework.exceptions import Throttled
+
+from .models import Patient, ProcessJob
+from .serializers import (
+    PatientFilterSerializer, AddPatientSerializer, BulkDeletePatientsSerializer,
+    PatientMetricsPostSerializer, ProcessBatchItemSerializer
+)
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+from .filters import filter_patients, filters_key
+from .payloads import patient_rows, patient_payload, latest_metrics
+from .caches import (
+    get_patient_count, get_cached_patient, cache_patient,
+    patient_list_key, get_cached_patient_list, cache_patient_list, metrics_entry
+)
+from .bulk import bulk_create_patients, delete_patients, upsert_patients
+from .imports import NDJSON_CONTENT_TYPES, CSV_CONTENT_TYPES, iter_ndjson_rows, iter_csv_rows, stream_import
+from .exports import EXPORTERS
+from .processing import ProcessingError, find_metrics, metrics_payload
+from .surrogate import fetch_or_estimate
+from .batch import process_batch
+from .analytics import get_pk_analytics
+from .throttling import GCRAThrottle
+from .routers import replica_reads
+from . import breaker, jobs, telemetry, upstream
+
+
+def cached_response(request, entry, body, response_class=Response):
+    """
+    200 with the entry's validators, or a 304 when the client already has it
+    """
+    last_modified = entry.get("last_modified")
+    response = get_conditional_response(request, etag=entry["etag"], last_modified=last_modified)
+    if response is None:
+        response = response_class(body)
+    response['ETag'] = entry["etag"]
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def include_metrics(request):
+    return 'metrics' in request.GET.get('include', '').split(',')
+
+
+def with_latest_metrics(entry, patients, latest):
+    """
+    ?include=metrics: the validators to serve the entry with, and its patients
+    with "latest_metrics" attached (null for patients never processed)
+    """
+    patients = [{**patient, "latest_metrics": latest.get(patient['id'])} for patient in patients]
+    return metrics_entry(entry, latest), patients
 
-from .models import Patient, PatientMetrics
-from .serializers import PatientSerializer, AddPatientSerializer, PatientMetricsPostSerializer
 
 class PatientView(APIView):
     """
     GET: Return patients from DB with manual pagination
+         (or keyset pagination when a `cursor` param is sent),
+         optionally filtered (see PatientFilterSerializer).
+         Pages are cached until a patient is added or deleted.
+         ?include=metrics attaches each patient's latest metrics.
+         Reads from a replica when there are some (see routers.py).
     POST: Add a new patient
     """
+    page_size = 15
 
+    @replica_reads()
     def get(self, request):
+        filter_serializer = PatientFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response({
+                "series": {
+                    "success": False,
+                    "result": {
+                        "errors": filter_serializer.errors
+                    }
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
+        filters = filter_serializer.validated_data
+
+        if 'cursor' in request.query_params:
+            return self.get_cursor_page(request, filters)
+
         try:
             page = int(request.query_params.get('page', 1))
         except ValueError:
             page = 1
 
-        page_size = 15
-        start = (page - 1) * page_size
-        end = start + page_size
-
-        patients = Patient.objects.all().order_by('id')[start:end]
-        serializer = PatientSerializer(patients, many=True)
+        key = patient_list_key('page', page, filters_key(filters))
+        entry = get_cached_patient_list(key)
+        if entry is None:
+            page_size = self.page_size
+            start = (page - 1) * page_size
+            end = start + page_size
+
+            queryset = filter_patients(Patient.objects.all(), filters)
+            rows = patient_rows(queryset.order_by('id')[start:end])
+
+            if filters:
+                total_count, count_exact = queryset.count(), True
+            else:
+                total_count, count_exact = get_patient_count()
+            total_pages = (total_count + page_size - 1) // page_size
+
+            entry = cache_patient_list(key, {
+                "page": page,
+                "total_pages": total_pages,
+                "total_count": total_count,
+                "count_exact": count_exact,
+                "patients": [data for data, _ in rows]
+            }, rows)
+
+        result = entry["result"]
+        if include_metrics(request):
+            # One window-function query for the whole page, the page itself stays cached
+            latest = latest_metrics([patient['id'] for patient in result["patients"]])
+            entry, patients = with_latest_metrics(entry, result["patients"], latest)
+            result = {**result, "patients": patients}
+
+        return cached_response(request, entry, {
+            "series": {
+                "success": True,
+                "result": result
+            }
+        })
 
-        total_count = Patient.objects.count()
-        total_pages = (total_count + page_size - 1) // page_size
+    def get_cursor_page(self, request, filters):
+        """
+        Keyset pagination on id: stays O(page) at any depth and skips the COUNT
+        """
+        try:
+            last_id = decode_cursor(request.query_params.get('cursor'))
+        except InvalidCursor as e:
+            return Response({
+                "series": {
+                    "success": False,
+                    "result": {
+                        "errors": {"cursor": [str(e)]}
+                    }
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
+        key = patient_list_key('cursor', last_id, filters_key(filters))
+        entry = get_cached_patient_list(key)
+        if entry is None:
+            patients = filter_patients(Patient.objects.all(), filters).order_by('id')
+            if last_id is not None:
+                patients = patients.filter(id__gt=last_id)
+
+            # Fetch one extra row to know whether there is a next page
+            rows = patient_rows(patients[:self.page_size + 1])
+            has_more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+
+            entry = cache_patient_list(key, {
+                "page_size": self.page_size,
+                "next_cursor": encode_cursor(rows[-1][0]['id']) if has_more else None,
+                "patients": [data for data, _ in rows]
+            }, rows)
+
+        result = entry["result"]
+        if include_metrics(request):
+            # One window-function query for the whole page, the page itself stays cached
+            latest = latest_metrics([patient['id'] for patient in result["patients"]])
+            entry, patients = with_latest_metrics(entry, result["patients"], latest)
+            result = {**result, "patients": patients}
+
+        return cached_response(request, entry, {
             "series": {
                 "success": True,
-                "result": {
-                    "page": page,
-                    "total_pages": total_pages,
-                    "total_count": total_count,
-                    "patients": serializer.data
-                }
+                "result": result
             }
         })
 
     def post(self, request):
         serializer = AddPatientSerializer(data=request.data)
         if serializer.is_valid():
+            # Lists and count are invalidated by the post_save signal (see signals.py)
             patient = serializer.save()
+            # Write-through: the detail is ready
+            cache_patient(patient_payload(patient), patient.updated_at)
             return Response({
                 "series": {
                     "success": True,
@@ -75,7 +216,9 @@ class PatientView(APIView):
 
 class BulkAddPatientView(APIView):
     """
-    Add multiple patients to the database in a single request
+    Add multiple patients to the database in a single request.
+    The whole batch is validated first, then written with chunked bulk_create
+    (PATIENT_BULK_CHUNK_SIZE rows per INSERT) in one transaction.
     """
 
     def post(self, request):
@@ -87,7 +230,7 @@ class BulkAddPatientView(APIView):
 
         serializer = AddPatientSerializer(data=request.data, many=True)
         if serializer.is_valid():
-            patients = serializer.save()
+            patients = bulk_create_patients(serializer.validated_data)
             response_data = [
                 {
                     "id": patient.id,
@@ -110,34 +253,158 @@ class BulkAddPatientView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UpsertPatientsView(APIView):
+    """
+    Insert or update a list of patients keyed on (first_name, last_name, dob):
+    the stored ones are locked and get sex/ethnic_background updated, the others are
+    inserted, chunked, in one transaction (see bulk.upsert_patients).
+    ?return_patients=false answers with the counts only.
+    """
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({
+                "success": False,
+                "error": "Expected a list of patient objects"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = AddPatientSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({
+                "success": False,
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        patients, created = upsert_patients(serializer.validated_data)
+
+        body = {
+            "success": True,
+            "created": len(created),
+            "updated": len(patients) - len(created),
+        }
+        if request.query_params.get('return_patients', 'true').lower() != 'false':
+            body["patients"] = [patient_payload(patient) for patient in patients]
+        return Response(body, status=status.HTTP_200_OK)
+
+
+class BulkDeletePatientsView(APIView):
+    """
+    Delete patients by {"ids": [...]} or {"filter": {...list filters}}, with their
+    metrics and jobs, as set-based DELETEs in one transaction.
+    ?return_patients=false skips loading the deleted payloads.
+    """
+
+    def post(self, request):
+        serializer = BulkDeletePatientsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "success": False,
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if 'ids' in serializer.validated_data:
+            ids = serializer.validated_data['ids']
+        else:
+            queryset = filter_patients(Patient.objects.all(), serializer.validated_data['filter'])
+            ids = list(queryset.values_list('id', flat=True))
+
+        return_payloads = request.query_params.get('return_patients', 'true').lower() != 'false'
+        deleted, payloads = delete_patients(ids, return_payloads=return_payloads)
+
+        body = {"success": True, "deleted": deleted}
+        if return_payloads:
+            body["patients"] = payloads
+        return Response(body, status=status.HTTP_200_OK)
+
+
+class ImportPatientsView(APIView):
+    """
+    Stream patients in as NDJSON or CSV (header row required).
+    The body is read line by line and inserted every PATIENT_IMPORT_CHUNK_SIZE rows,
+    progress and row errors are streamed back as NDJSON, one line per chunk.
+    """
+
+    def post(self, request):
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type in NDJSON_CONTENT_TYPES:
+            rows = iter_ndjson_rows(request._request)
+        elif content_type in CSV_CONTENT_TYPES:
+            rows = iter_csv_rows(request._request)
+        else:
+            return Response({
+                "success": False,
+                "error": "Expected an application/x-ndjson or text/csv body"
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        return StreamingHttpResponse(
+            stream_import(rows, settings.PATIENT_IMPORT_CHUNK_SIZE),
+            content_type='application/x-ndjson',
+        )
+
+
+class ExportPatientsView(APIView):
+    """
+    Stream every patient out as NDJSON or CSV (?output=ndjson|csv),
+    optionally with their metrics (?include=metrics).
+    Uses one server-side cursor query so memory stays flat.
+    """
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORTERS:
+            return Response({
+                "success": False,
+                "error": f"output must be one of: {', '.join(EXPORTERS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        include_metrics = 'metrics' in request.query_params.get('include', '').split(',')
+        exporter, content_type = EXPORTERS[output]
+        response = StreamingHttpResponse(
+            exporter(include_metrics, settings.PATIENT_EXPORT_CHUNK_SIZE),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="patients.{output}"'
+        return response
+
+
 class PatientDetailView(APIView):
     """
-    Return, delete a single patient by ID
+    Return, delete a single patient by ID.
+    GET is served from the cache with ETag/Last-Modified, a matching
+    If-None-Match/If-Modified-Since gets a 304 without touching the DB.
+    ?include=metrics attaches the patient's latest metrics.
+    GET reads from a replica when there are some (see routers.py).
     """
 
+    @replica_reads()
     def get(self, request, pk):
-        try:
-            patient = Patient.objects.get(pk=pk)
-        except Patient.DoesNotExist:
-            return Response({
-                "series": {
-                    "success": False,
-                    "result": {"patient": None}
-                }
-            }, status=status.HTTP_404_NOT_FOUND)
+        entry = get_cached_patient(pk)
+        if entry is None:
+            rows = patient_rows(Patient.objects.filter(pk=pk))
+            if not rows:
+                return Response({
+                    "series": {
+                        "success": False,
+                        "result": {"patient": None}
+                    }
+                }, status=status.HTTP_404_NOT_FOUND)
+            entry = cache_patient(*rows[0])
 
-        serializer = PatientSerializer(patient)
-        return Response({
+        patient = entry["patient"]
+        if include_metrics(request):
+            entry, (patient,) = with_latest_metrics(entry, [patient], latest_metrics([patient['id']]))
+
+        return cached_response(request, entry, {
             "series": {
                 "success": True,
-                "result": {"patient": serializer.data}
+                "result": {"patient": patient}
             }
-        }, status=status.HTTP_200_OK)
+        })
 
     def delete(self, request, pk):
-        try:
-            patient = Patient.objects.get(pk=pk)
-        except Patient.DoesNotExist:
+        # Same set-based delete as /patients/delete, no collector walk over metrics
+        deleted, payloads = delete_patients([pk])
+        if not deleted:
             return Response({
                 "series": {
                     "success": False,
@@ -145,36 +412,82 @@ class PatientDetailView(APIView):
                 }
             }, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = PatientSerializer(patient)
-        patient.delete()
         return Response({
             "series": {
                 "success": True,
-                "result": {"patient": serializer.data}
+                "result": {"patient": payloads[0]}
             }
         }, status=status.HTTP_200_OK)
 
 
+# Custom throttle class: PATIENT_PROCESS_THROTTLE per client (the external API's own
+# budget, PATIENT_PROCESS_GLOBAL_THROTTLE, is charged per call in upstream.py)
+class PatientProcessRateThrottle(GCRAThrottle):
+    scope = 'patient_process'
 
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from rest_framework.throttling import UserRateThrottle
-import requests
-from requests.exceptions import RequestException, Timeout, ConnectionError
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if not allowed:
+            telemetry.inc('patient_throttle_rejections_total', scope=self.scope)
+        return allowed
+
+
+class UpstreamStatusView(APIView):
+    """
+    Connection pool reuse and call stats for the external API client (this worker only),
+    and the circuit breaker's state (all workers when they share it)
+    """
+
+    def get(self, request):
+        return Response({
+            "success": True,
+            "pool": upstream.pool_stats(),
+            "breaker": breaker.status()
+        }, status=status.HTTP_200_OK)
+
+
+class TelemetryView(APIView):
+    """
+    Prometheus text: request latency, DB queries and time per route, external API
+    latency by status, stored metrics hit/miss, throttle rejections, circuit breaker
+    trips; summed over workers. The breaker state gauge is this worker's view.
+    """
+
+    def get(self, request):
+        return HttpResponse(
+            telemetry.render_prometheus() + '\n'.join(breaker.prometheus_lines()) + '\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
 
-# Custom throttle class
-class PatientProcessRateThrottle(UserRateThrottle):
-    scope = 'patient_process'
+
+class PKAnalyticsView(APIView):
+    """
+    Cmax, Tmax, AUC and half-life across every processed series, overall and
+    by sex / ethnic background
+    """
+
+    def get(self, request):
+        analytics, cached = get_pk_analytics()
+        return Response({
+            "success": True,
+            "cached": cached,
+            "result": analytics
+        }, status=status.HTTP_200_OK)
 
 
 class ProcessPatientView(APIView):
+    """
+    POST weight/height: return stored metrics or call the external API.
+    With ?async=true a miss is queued as a ProcessJob and answered with 202.
+    With PATIENT_SURROGATE_ENABLED an API failure (or slowness) may be answered
+    with an "approximate" local estimate instead.
+    """
     throttle_classes = [PatientProcessRateThrottle]
 
     def post(self, request, pk):
-        # Fetch patient
+        # Fetch patient (only its id is used)
         try:
-            patient = Patient.objects.get(pk=pk)
+            patient = Patient.objects.only('id').get(pk=pk)
         except Patient.DoesNotExist:
             return Response(
                 {"success": False, "error": "Patient not found"},
@@ -189,92 +502,128 @@ class ProcessPatientView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        weight_value = serializer.validated_data['weight']['value']
-        weight_unit = serializer.validated_data['weight']['unit']
-        height_value = serializer.validated_data['height']['value']
-        height_unit = serializer.validated_data['height']['unit']
-
-        # Check if metrics already exist
-        metrics = PatientMetrics.objects.filter(
-            patient=patient,
-            weight_value=weight_value,
-            weight_unit=weight_unit,
-            height_value=height_value,
-            height_unit=height_unit
-        ).first()
+        weight = serializer.validated_data['weight']
+        height = serializer.validated_data['height']
 
+        # Check if metrics already exist (on a replica if any; one that lags just
+        # misses, get_or_fetch_metrics looks again on the primary before calling out)
+        with replica_reads():
+            metrics = find_metrics(patient, weight, height)
+        telemetry.inc('patient_metrics_cache_requests_total', result='hit' if metrics else 'miss')
         if metrics:
-            results = [
-                {"duration_30_m": r[0], "concentration": r[1]} for r in (metrics.results or [])
-            ]
-            return Response({
+            return Response(metrics_payload(metrics), status=status.HTTP_200_OK)
+
+        # Async mode: queue the external call and let the client poll the job
+        if request.query_params.get('async', '').lower() in ('1', 'true'):
+            job = jobs.enqueue(patient, weight, height)
+            response = Response({
                 "success": True,
-                "patient": {
-                    "weight": {"value": metrics.weight_value, "unit": metrics.weight_unit},
-                    "height": {"value": metrics.height_value, "unit": metrics.height_unit}
-                },
-                "results": results
-            }, status=status.HTTP_200_OK)
-
-        # Call external API
-        payload = {
-            "weight": {"value": weight_value, "unit": weight_unit},
-            "height": {"value": height_value, "unit": height_unit}
-        }
-        external_url = f"https://coding-patient-api.vesynta.workers.dev/api/patients/{pk}/process"
+                "job": jobs.job_payload(job)
+            }, status=status.HTTP_202_ACCEPTED)
+            response['Location'] = reverse('process-job', kwargs={'pk': job.id})
+            return response
 
+        # Call external API and save the result (coalesced with identical in-flight requests),
+        # or estimate it locally when the API is down or slow and the surrogate is on
         try:
-            resp = requests.post(external_url, json=payload, timeout=10, verify=False)
-            resp.raise_for_status()  # Raise exception for HTTP errors
-            data = resp.json()       # Could raise JSONDecodeError
-        except (RequestException, ConnectionError, Timeout) as e:
-            return Response(
-                {"success": False, "error": f"External API request failed: {str(e)}"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-        except ValueError:  # JSON decode error
-            return Response(
-                {"success": False, "error": "Invalid JSON returned from external API"},
-                status=status.HTTP_502_BAD_GATEWAY
+            metrics, estimate = fetch_or_estimate(patient, weight, height)
+        except ProcessingError as e:
+            response = Response(
+                {"success": False, "error": str(e)},
+                status=e.status_code
             )
+            if e.retry_after is not None:
+                response['Retry-After'] = '%d' % e.retry_after
+            return response
+        if estimate is not None:
+            return Response(estimate, status=status.HTTP_200_OK)
+
+        return Response(metrics_payload(metrics), status=status.HTTP_200_OK)
 
-        # Validate keys exist in the response
-        try:
-            patient_data = data["patient"]
-            weight_data = patient_data["weight"]
-            height_data = patient_data["height"]
-            results_data = data.get("results", [])
-        except KeyError as e:
-            return Response(
-                {"success": False, "error": f"Missing expected key in API response: {str(e)}"},
-                status=status.HTTP_502_BAD_GATEWAY
-            )
 
-        # Save to DB
+class ProcessBatchView(APIView):
+    """
+    Process a list of {patient_id, weight, height} items in one request.
+    Answers 200 with a per-item report; failed items don't fail the batch.
+    Each item that needs the external API costs one request of the client's
+    process rate; a batch the rate can't cover is refused as a whole with 429.
+    """
+
+    def admit(self, request, calls):
+        throttle = PatientProcessRateThrottle()
+        if throttle.charge(request, self, calls):
+            return
+        telemetry.inc('patient_throttle_rejections_total', scope=throttle.scope)
+        if throttle.wait() is None:
+            raise Throttled(detail=(
+                f"{calls} items need the external API, at most {throttle.num_requests} per batch at this rate"
+            ))
+        raise Throttled(throttle.wait())
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({
+                "success": False,
+                "error": "Expected a list of {patient_id, weight, height} objects"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        max_items = settings.PATIENT_PROCESS_BATCH_MAX_ITEMS
+        if len(request.data) > max_items:
+            return Response({
+                "success": False,
+                "error": f"At most {max_items} items per batch"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Invalid items are reported, the valid ones still get processed
+        items, reports = [], {}
+        for index, data in enumerate(request.data):
+            serializer = ProcessBatchItemSerializer(data=data)
+            if serializer.is_valid():
+                items.append((index, serializer.validated_data))
+            else:
+                reports[index] = {
+                    "index": index,
+                    "patient_id": data.get('patient_id') if isinstance(data, dict) else None,
+                    "success": False,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": serializer.errors,
+                }
+
+        processed = process_batch(
+            [item for _, item in items], admit=lambda calls: self.admit(request, calls)
+        )
+        for (index, _), report in zip(items, processed):
+            reports[index] = {"index": index, **report}
+        reports = [reports[index] for index in sorted(reports)]
+
+        failed = sum(1 for report in reports if not report["success"])
+        return Response({
+            "success": failed == 0,
+            "summary": {
+                "total": len(reports),
+                "cached": sum(1 for report in reports if report.get("source") == 'cached'),
+                "processed": sum(1 for report in reports if report.get("source") == 'processed'),
+                "failed": failed,
+            },
+            "items": reports
+        }, status=status.HTTP_200_OK)
+
+
+class ProcessJobView(APIView):
+    """
+    Status of an async process job, with the results once it's done
+    """
+
+    def get(self, request, pk):
         try:
-            metrics = PatientMetrics.objects.create(
-                patient=patient,
-                weight_value=weight_data["value"],
-                weight_unit=weight_data["unit"],
-                height_value=height_data["value"],
-                height_unit=height_data["unit"],
-                results=results_data
-            )
-        except Exception as e:
+            job = ProcessJob.objects.select_related('metrics').get(pk=pk)
+        except ProcessJob.DoesNotExist:
             return Response(
-                {"success": False, "error": f"Failed to save metrics: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"success": False, "error": "Job not found"},
+                status=status.HTTP_404_NOT_FOUND
             )
 
-        structured_results = [
-            {"duration_30_m": r[0], "concentration": r[1]} for r in (metrics.results or [])
-        ]
-
         return Response({
-            "success": True,
-            "patient": {
-                "weight": {"value": metrics.weight_value, "unit": metrics.weight_unit},
-                "height": {"value": metrics.height_value, "unit": metrics.height_unit}
-            },
-            "results": structured_results
+            "success": job.status != ProcessJob.FAILED,
+            "job": jobs.job_payload(job)
         }, status=status.HTTP_200_OK)